@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# Measure how long reading and linking object files takes, and how much memory it needs, on generated object files
+
+import os
+import tempfile
+import time
+import tracemalloc
+
+from gsl import linkObjectFiles, write_out
+from lib.imports import imports
+from lib.imports.imports import OBJECT_EXT
+from lib.imports.objectfile_imports import getObjectFiles, OBJECT_FORMATS, DEFAULT_OBJECT_FORMAT
+from lib.codegen.codegen import build_object_file, build_binary_object_file
+from collections import OrderedDict
+
+def synthetic_object(name, deps, funcs, instrs, entry=False, object_format=DEFAULT_OBJECT_FORMAT):
+    '''An object file for module `name` with `funcs` functions of `instrs` instructions each, that call each other
+    and the functions of the modules it depends on. With entry it has a main function.'''
+    global_code = ['LDC 00', 'LDC {}_global_g'.format(name), 'STA 00']
+    global_labels = ['{}_global_g'.format(name)]
+    function_code = OrderedDict()
+    for f in range(funcs):
+        label = '{}_func_f{}_0'.format(name, f)
+        callee = '{}_func_f{}_0'.format(deps[0] if deps and f % 2 else name, (f + 1) % funcs)
+        body = ['LINK 00'] + ['LDL -2', 'LDC {}'.format(f + 1), 'ADD', 'STL -2'] * (instrs // 4)
+        function_code[label] = body + ['LDL -2', 'BSR ' + callee, 'AJS -1', 'LDR RR', 'STR RR', label + '_exit: UNLINK', 'RET']
+    if entry:
+        function_code['{}_func_main_0'.format(name)] = ['LINK 00', 'LDC 00', 'BSR {}_func_f0_0'.format(name), 'AJS -1', 'LDR RR', 'STR RR', 'UNLINK', 'RET']
+    build = build_binary_object_file if object_format == 'binary' else build_object_file
+    return build(deps, global_code, global_labels, function_code)
+
+# open, but slower. Object files are opened by lib.imports.imports, so it is put in there
+def slow_open(latency):
+    def res(*args, **kwargs):
+        time.sleep(latency)
+        return open(*args, **kwargs)
+    return res
+
+def main():
+    from argparse import ArgumentParser
+    argparser = ArgumentParser(description="Benchmark reading and linking object files")
+    argparser.add_argument("--modules", help="Number of modules", type=int, default=20)
+    argparser.add_argument("--funcs", help="Functions per module", type=int, default=500)
+    argparser.add_argument("--instrs", help="Instructions per function", type=int, default=40)
+    argparser.add_argument("--object-format", help="Format of the object files", choices=OBJECT_FORMATS, default=DEFAULT_OBJECT_FORMAT)
+    argparser.add_argument("--keep-unused", help="Link without leaving out unreachable code", action="store_true")
+    argparser.add_argument("--deps", help="Number of modules every module depends on", type=int, default=1)
+    argparser.add_argument("--open-latency", metavar="SECONDS", help="Wait this long in every open of an object file, like a network drive would", type=float, default=0)
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # lib0 is the main module, every module depends on the ones after it
+        names = ['lib{}'.format(m) for m in range(args.modules)]
+        for ix, name in enumerate(names):
+            deps = names[ix + 1:ix + 1 + args.deps]
+            data = synthetic_object(name, deps, args.funcs, args.instrs, entry=(ix == 0), object_format=args.object_format)
+            with open(os.path.join(tmp, name + OBJECT_EXT), "wb" if type(data) is bytes else "w") as f:
+                f.write(data)
+        size = sum(os.path.getsize(os.path.join(tmp, name + OBJECT_EXT)) for name in names)
+
+        if args.open_latency > 0:
+            imports.open = slow_open(args.open_latency)
+
+        main_path = os.path.join(tmp, names[0] + OBJECT_EXT)
+        out_path = os.path.join(tmp, "out.ssm")
+        # Timed without tracing allocations, which slows down allocating code much more than the rest
+        start = time.perf_counter()
+        mod_dicts = getObjectFiles(open(main_path), main_path, tmp)
+        read = time.perf_counter()
+        write_out(linkObjectFiles(mod_dicts, names[0], keep_unused=args.keep_unused), out_path, "executable")
+        end = time.perf_counter()
+
+        mod_dicts = None
+        tracemalloc.start()
+        write_out(linkObjectFiles(getObjectFiles(open(main_path), main_path, tmp), names[0], keep_unused=args.keep_unused), out_path, "executable")
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        out_size = os.path.getsize(os.path.join(tmp, "out.ssm"))
+
+    print("{} modules, {:.1f} MB of {} object files, {:.1f} MB executable".format(args.modules, size / 1e6, args.object_format, out_size / 1e6))
+    print("read {:.3f}s, link {:.3f}s, peak memory {:.1f} MB".format(read - start, end - read, peak / 1e6))
+
+if __name__ == "__main__":
+    main()
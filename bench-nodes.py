@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+# Measure how many AST nodes can be made, iterated and recognised per second
+
+import time
+
+from lib.datastructure.AST import AST, FunKind
+from lib.datastructure.token import Token, TOKEN
+from lib.datastructure.position import NO_POSITION
+
+ID = Token(NO_POSITION, TOKEN.IDENTIFIER, "f")
+ARG = Token(NO_POSITION, TOKEN.INT, 1)
+
+CASES = [
+    ("FUNCALL keywords", lambda: AST.FUNCALL(id=ID, kind=FunKind.FUNC, args=[ARG])),
+    ("FUNCALL positional", lambda: AST.FUNCALL(ID, FunKind.FUNC, [ARG])),
+    ("FUNDECL keywords", lambda: AST.FUNDECL(kind=FunKind.FUNC, fixity=None, id=ID, params=[], type=None, vardecls=[], stmts=[])),
+    ("BREAK", lambda: AST.BREAK()),
+]
+
+def rate(f, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        f()
+    return count / (time.perf_counter() - start)
+
+def main():
+    from argparse import ArgumentParser
+    argparser = ArgumentParser(description="Benchmark the construction of AST nodes")
+    argparser.add_argument("--count", help="Operations per measurement", type=int, default=200000)
+    args = argparser.parse_args()
+
+    node = AST.FUNDECL(kind=FunKind.FUNC, fixity=None, id=ID, params=[], type=None, vardecls=[], stmts=[])
+    print("{:<28} | {:>12}".format("operation", "per second"))
+    for name, f in CASES:
+        print("{:<28} | {:>12.0f}".format(name, rate(f, args.count)))
+    print("{:<28} | {:>12.0f}".format("FUNDECL iterate", rate(lambda: list(node), args.count)))
+    print("{:<28} | {:>12.0f}".format("is a node", rate(lambda: type(node) in AST.nodes, args.count)))
+
+    AST.setValidation(True)
+    for name, f in CASES:
+        print("{:<28} | {:>12.0f}".format(name + ", checked", rate(f, args.count)))
+    AST.setValidation(False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+# Time the typechecker on chains of an overloaded operator, where every overload accepts the rest of the chain
+
+import io
+import time
+
+from lib.analysis.error_handler import ERROR_HANDLER
+from lib.parser.lexer import tokenize
+from lib.parser.parser import parseTokenStream
+from lib.util.util import SourceMap
+from lib.imports.imports import getExternalSymbols
+from lib.builtins.builtin_mod import enrichExternalTable
+from semantic_analysis import buildSymbolTable, normalizeAllTypes, fixate_operator_properties, check_functype_clashes, \
+    forbid_illegal_types, resolveNames, fixExpression, analyseFunc
+from lib.analysis.typechecker import typecheck_globals, typecheck_functions
+from lib.debug.synthetic import overloaded_program
+
+def analysed_tables(source):
+    infile = io.StringIO(source)
+    source_map = SourceMap(infile)
+    ERROR_HANDLER.setSourceMapping(source_map)
+    ast = parseTokenStream(tokenize(infile), source_map, backend="descent")
+
+    ext_table, _ = getExternalSymbols(ast, "bench", {}, {})
+    ext_table = enrichExternalTable(ext_table)
+    symbol_table, ext_table = buildSymbolTable(ast, "bench", just_for_headerfile=False, ext_symbol_table=ext_table)
+    normalizeAllTypes(ast, symbol_table, ext_table, "bench", full_normalize=True, headerfiles={}, typesyn_headerfiles={})
+    fixate_operator_properties(symbol_table, ext_table)
+    check_functype_clashes(symbol_table, ext_table)
+    forbid_illegal_types(symbol_table, ext_table)
+    resolveNames(symbol_table, ext_table)
+    fixExpression(ast, symbol_table, ext_table)
+    analyseFunc(symbol_table)
+    ERROR_HANDLER.checkpoint()
+    return symbol_table, ext_table
+
+def main():
+    from argparse import ArgumentParser
+    argparser = ArgumentParser(description="Benchmark overload resolution in the typechecker")
+    argparser.add_argument("--depths", metavar="N,...", help="Comma-separated chain lengths", type=str, default="4,8,16,64,256")
+    argparser.add_argument("--overloads", help="Number of overloads of the operator (at most 4)", type=int, default=3)
+    args = argparser.parse_args()
+
+    print("{:>6} {:>9} | {:>12}".format("depth", "overloads", "typecheck s"))
+    for depth in map(int, args.depths.split(",")):
+        symbol_table, ext_table = analysed_tables(overloaded_program(depth=depth, overloads=args.overloads))
+        start = time.perf_counter()
+        typecheck_globals(symbol_table, ext_table)
+        typecheck_functions(symbol_table, ext_table)
+        elapsed = time.perf_counter() - start
+        ERROR_HANDLER.checkpoint()
+        print("{:>6} {:>9} | {:>12.4f}".format(depth, args.overloads, elapsed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+# Compare parse time and peak memory with and without packrat memoization
+
+import io
+import time
+import tracemalloc
+
+from lib.parser.lexer import tokenize
+from lib.parser.parser import SPL
+from lib.debug.synthetic import synthetic_program
+
+def measure(tokens, infile, packrat):
+    start = time.perf_counter()
+    SPL.parse_strict(tokens, infile, packrat=packrat)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    SPL.parse_strict(tokens, infile, packrat=packrat)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    from argparse import ArgumentParser
+    argparser = ArgumentParser(description="Benchmark the packrat mode of the parser")
+    argparser.add_argument("--sizes", metavar="N,...", help="Comma-separated function counts", type=str, default="50,200")
+    argparser.add_argument("--depth", help="Expression nesting depth", type=int, default=4)
+    args = argparser.parse_args()
+
+    print("{:>6} {:>8} | {:>9} {:>9} | {:>10} {:>10}".format("funcs", "tokens", "plain s", "packrat s", "plain KiB", "packrat KiB"))
+    for size in map(int, args.sizes.split(",")):
+        source = synthetic_program(funcs=size, globs=size // 4, depth=args.depth)
+        infile = io.StringIO(source)
+        tokens = list(tokenize(infile))
+        plain_t, plain_m = measure(tokens, infile, False)
+        packrat_t, packrat_m = measure(tokens, infile, True)
+        print("{:>6} {:>8} | {:>9.3f} {:>9.3f} | {:>10} {:>10}".format(size, len(tokens), plain_t, packrat_t, plain_m // 1024, packrat_m // 1024))
+
+if __name__ == "__main__":
+    main()
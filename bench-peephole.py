@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Count the instructions the peephole optimizer saves on the example programs:
+# static counts in the object files, dynamic counts by running the executables in an SSM interpreter
+
+import glob
+import os
+import subprocess
+import sys
+
+from lib.imports.objectfile_imports import parseObjectFile
+from lib.codegen.peephole import OPT_LEVELS
+from lib.debug.ssm import run, SSMError
+
+def compile_output(path, level, flags):
+    # The output from the first comment on, since warnings come before it
+    res = subprocess.run([sys.executable, "gsc.py", path, "--stdout", "-O", str(level)] + flags,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    start = res.stdout.find("//")
+    return res.stdout[start:] if res.returncode == 0 and start != -1 else None
+
+def static_count(object_file):
+    sections = parseObjectFile(object_file)
+    code = sections["global_inits"].split("\n") + sections["functions"].split("\n")
+    return len([line for line in code if line.strip() and not line.startswith("//")])
+
+def dynamic_count(executable, stdin):
+    try:
+        output, steps, halted = run(executable, stdin=stdin)
+    except SSMError:
+        return None, None
+    return (output, steps) if halted else (None, None)
+
+def main():
+    from argparse import ArgumentParser
+    argparser = ArgumentParser(description="Benchmark the peephole optimizer on the example programs")
+    argparser.add_argument("--programs", metavar="GLOB", help="Programs to compile", type=str, default="example programs/**/*.spl")
+    argparser.add_argument("--stdin", help="Input for programs that read", type=str, default="42\n")
+    args = argparser.parse_args()
+
+    levels = OPT_LEVELS
+    print("{:<48} | {} | {}".format("program", " ".join("{:>7}".format("O{} st".format(l)) for l in levels),
+                                   " ".join("{:>8}".format("O{} dyn".format(l)) for l in levels)))
+    totals_static = [0] * len(levels)
+    totals_dynamic = [0] * len(levels)
+    for path in sorted(glob.glob(args.programs, recursive=True)):
+        objects = [compile_output(path, l, ["-C"]) for l in levels]
+        if any(o is None for o in objects):
+            continue
+        statics = [static_count(o) for o in objects]
+        totals_static = [t + s for t, s in zip(totals_static, statics)]
+
+        dynamics = [dynamic_count(e, args.stdin) if e is not None else (None, None) for e in [compile_output(path, l, []) for l in levels]]
+        if all(output is not None for output, _ in dynamics):
+            if len(set(output for output, _ in dynamics)) != 1:
+                raise Exception("Optimized program behaves differently: " + path)
+            totals_dynamic = [t + steps for t, (_, steps) in zip(totals_dynamic, dynamics)]
+            dynamic_text = " ".join("{:>8}".format(steps) for _, steps in dynamics)
+        else:
+            dynamic_text = " ".join("{:>8}".format("-") for _ in levels)
+        print("{:<48} | {} | {}".format(os.path.relpath(path, "example programs"), " ".join("{:>7}".format(s) for s in statics), dynamic_text))
+
+    print("{:<48} | {} | {}".format("total", " ".join("{:>7}".format(s) for s in totals_static), " ".join("{:>8}".format(d) for d in totals_dynamic)))
+    for ix, level in enumerate(levels[1:], 1):
+        print("O{}: {:.1f}% fewer instructions, {:.1f}% fewer executed".format(level,
+            100 * (1 - totals_static[ix] / totals_static[0]), 100 * (1 - totals_dynamic[ix] / max(totals_dynamic[0], 1))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+# Compare the memory taken by a list of Tokens and by a TokenBuffer for the same input
+
+import io
+import tracemalloc
+
+from lib.parser.lexer import tokenize
+from lib.datastructure.token import TokenBuffer
+from lib.debug.synthetic import synthetic_program
+
+def traced_size(build, source):
+    tracemalloc.start()
+    tokens = build(tokenize(io.StringIO(source)))
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(tokens), size, peak
+
+def main():
+    from argparse import ArgumentParser
+    argparser = ArgumentParser(description="Benchmark the memory use of the token stream")
+    argparser.add_argument("--sizes", metavar="N,...", help="Comma-separated function counts", type=str, default="100,400,1600")
+    args = argparser.parse_args()
+
+    print("{:>6} {:>9} {:>8} | {:>12} {:>12} | {:>10} {:>10} | {:>11} {:>11}".format(
+        "funcs", "src bytes", "tokens", "list B/tok", "buffer B/tok", "list tok/MB", "buf tok/MB", "list peak", "buf peak"))
+    for size in map(int, args.sizes.split(",")):
+        source = synthetic_program(funcs=size, globs=size // 4)
+        count, list_size, list_peak = traced_size(list, source)
+        _, buffer_size, buffer_peak = traced_size(TokenBuffer, source)
+        print("{:>6} {:>9} {:>8} | {:>12.1f} {:>12.1f} | {:>10} {:>10} | {:>9}Ki {:>9}Ki".format(
+            size, len(source), count,
+            list_size / count, buffer_size / count,
+            count * 2**20 // list_size, count * 2**20 // buffer_size,
+            list_peak // 1024, buffer_peak // 1024))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+import os
+import io
+import sys
+import time
+from argparse import ArgumentParser
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import redirect_stdout, redirect_stderr
+
+import gsc
+from gsl import make_import_mapping
+from lib.analysis.error_handler import *
+from lib.imports.imports import resolveFileName, validate_modname, IMPORT_DIR_ENV_VAR_NAME, SOURCE_EXT, HEADER_EXT
+from lib.imports.build_cache import BUILD_CACHE_DIR
+from lib.parser.lexer import tokenize, LEXER_ENGINES, DEFAULT_LEXER_ENGINE
+from lib.parser.parser import parseTokenStream, PARSER_BACKENDS, DEFAULT_PARSER_BACKEND
+from lib.codegen.peephole import OPT_LEVELS, DEFAULT_OPT_LEVEL
+from lib.imports.objectfile_imports import OBJECT_FORMATS, DEFAULT_OBJECT_FORMAT
+from lib.util.util import SourceMap
+
+'''
+Build driver: compiles a program together with every module it (transitively) imports.
+Headerfiles only depend on their own source, so they are all generated first and in parallel.
+The object file of a module can be generated as soon as the headerfiles of all modules it transitively imports exist,
+the executable as soon as all object files exist.
+'''
+
+def scanImports(path, lexer):
+    # Only the import list is needed, and the descent backend gives the same tree as the grammar much faster
+    out = io.StringIO()
+    ERROR_HANDLER.errors = []
+    ERROR_HANDLER.warnings = []
+    with redirect_stdout(out), redirect_stderr(out):
+        try:
+            with open(path, "r") as infile:
+                source = SourceMap(infile)
+                ERROR_HANDLER.setSourceMapping(source)
+                ast = parseTokenStream(tokenize(infile, engine=lexer), source, backend="descent")
+            imports = [x.name.val for x in ast.imports]
+        except SystemExit:
+            imports = None
+    return imports, out.getvalue()
+
+def discoverModules(main_file, args, import_mapping, lib_dir_env, executor):
+    main_name = os.path.splitext(os.path.basename(main_file))[0]
+    modules = OrderedDict()
+    prebuilt = []
+    frontier = [(main_name, main_file)]
+    while frontier: # Every module found in the previous round is scanned at the same time
+        scanned = list(executor.map(scanImports, [path for (_, path) in frontier], [args.lexer] * len(frontier)))
+        found = []
+        for (name, path), (imports, output) in zip(frontier, scanned):
+            print(output, end="")
+            if imports is None:
+                exit(1)
+            imports = list(OrderedDict.fromkeys(x for x in imports if x != name))
+            modules[name] = {"path": path, "imports": imports}
+
+            for imp in imports:
+                validate_modname(imp)
+                if imp in modules or imp in prebuilt or any(imp == x[0] for x in frontier + found):
+                    continue
+                try:
+                    handle, imp_path = resolveFileName(imp, SOURCE_EXT, os.path.dirname(path), file_mapping_arg=import_mapping, lib_dir_path=args.lp, lib_dir_env=lib_dir_env)
+                    handle.close()
+                    found.append((imp, imp_path))
+                except FileNotFoundError as e:
+                    # No source, so this has to be a library that is already compiled
+                    try:
+                        handle, _ = resolveFileName(imp, HEADER_EXT, os.path.dirname(path), file_mapping_arg=import_mapping, lib_dir_path=args.lp, lib_dir_env=lib_dir_env)
+                        handle.close()
+                        prebuilt.append(imp)
+                    except FileNotFoundError:
+                        ERROR_HANDLER.addError(ERR.ImportNotFound, [imp, "\t" + "\n\t".join(str(e).split("\n"))])
+        ERROR_HANDLER.checkpoint()
+        frontier = found
+    return modules
+
+def importClosure(name, modules):
+    seen = OrderedDict()
+    openlist = list(modules[name]["imports"])
+    while openlist:
+        cur = openlist.pop()
+        if cur in seen or cur == name or cur not in modules:
+            continue
+        seen[cur] = None
+        openlist.extend(modules[cur]["imports"])
+    return list(seen)
+
+def makeJobs(modules, main_name, main_flags):
+    '''Map of job to (gsc target flags, jobs it has to wait for), dependencies first'''
+    jobs = OrderedDict()
+    for name in modules:
+        if name != main_name or any(main_name in mod["imports"] for mod in modules.values()):
+            jobs[("header", name)] = (["-H"], [])
+    for name in modules:
+        if name != main_name:
+            jobs[("object", name)] = (["-C"], [("header", dep) for dep in importClosure(name, modules)])
+    closure = importClosure(main_name, modules)
+    jobs[("binary", main_name)] = (main_flags, [("header", dep) for dep in closure] + [("object", dep) for dep in closure])
+    return jobs
+
+def runJob(argv):
+    # Runs in a worker process, so the output is collected and printed by the driver in one piece
+    out = io.StringIO()
+    start = time.time()
+    ERROR_HANDLER.errors = []
+    ERROR_HANDLER.warnings = []
+    with redirect_stdout(out), redirect_stderr(out):
+        try:
+            gsc.main(argv)
+            success = True
+        except SystemExit as e:
+            success = e.code in [None, 0]
+    return success, start, time.time(), out.getvalue()
+
+def criticalPath(jobs, timings):
+    finish = {}
+    chain = {}
+    for job in jobs:
+        deps = [dep for dep in jobs[job][1] if dep in finish]
+        before = max(deps, key=lambda dep: finish[dep]) if deps else None
+        finish[job] = timings[job] + (finish[before] if before is not None else 0)
+        chain[job] = (chain[before] if before is not None else []) + [job]
+    last = max(finish, key=lambda job: finish[job])
+    return finish[last], chain[last]
+
+def build(modules, main_name, main_flags, common_argv, executor):
+    jobs = makeJobs(modules, main_name, main_flags)
+    done = {}
+    timings = {}
+    failed = False
+    pending = {}
+    waiting = OrderedDict(jobs)
+
+    while waiting or pending:
+        if not failed:
+            for job in [job for (job, (_, deps)) in waiting.items() if all(dep in done for dep in deps)]:
+                flags = waiting.pop(job)[0]
+                pending[executor.submit(runJob, [modules[job[1]]["path"]] + flags + common_argv)] = job
+        elif not pending:
+            break
+
+        finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        for future in finished:
+            job = pending.pop(future)
+            success, start, end, output = future.result()
+            print(output, end="")
+            timings[job] = end - start
+            if success:
+                done[job] = end
+            else:
+                print(ERRCOLOR.FAIL + "[ERROR] Build of {} for {} failed".format(job[0], job[1]) + ERRCOLOR.ENDC, file=sys.stderr)
+                failed = True
+    return jobs, timings, not failed
+
+def reportTimings(modules, jobs, timings, wall_time):
+    print("{:<24} {:>9} {:>9} {:>9}".format("module", "header s", "object s", "binary s"))
+    for name in modules:
+        cols = [timings.get((kind, name)) for kind in ["header", "object", "binary"]]
+        print("{:<24} {:>9} {:>9} {:>9}".format(name, *["{:.3f}".format(t) if t is not None else "-" for t in cols]))
+
+    total = sum(timings.values())
+    length, chain = criticalPath(OrderedDict((job, v) for (job, v) in jobs.items() if job in timings), timings)
+    print("Total work: {:.3f}s, wall time: {:.3f}s".format(total, wall_time))
+    print("Critical path: {:.3f}s ({})".format(length, " -> ".join("{} {}".format(kind, name) for (kind, name) in chain)))
+    print("Parallelism: {:.2f}".format(total / length if length > 0 else 1.0))
+
+def main():
+    argparser = ArgumentParser(description="SPL Build driver")
+    argparser.add_argument("infile", metavar="INPUT", help="Input file of the main module")
+    argparser.add_argument("--lp", metavar="PATH", help="Directory to import source and header files from", nargs="?", type=str)
+    argparser.add_argument("--im", metavar="LIBNAME:PATH,...", help="Comma-separated module:path mapping list, to explicitly specify import paths", type=str)
+    argparser.add_argument("-o", metavar="OUTPUT", help="Output file for the executable, without extension")
+    argparser.add_argument("-j", metavar="N", help="Number of modules to compile at the same time", type=int, default=os.cpu_count())
+    argparser.add_argument("--lexer", help="Lexer engine to use", choices=list(LEXER_ENGINES), default=DEFAULT_LEXER_ENGINE)
+    argparser.add_argument("--parser", help="Parser backend to use", choices=PARSER_BACKENDS, default=DEFAULT_PARSER_BACKEND)
+    argparser.add_argument("-O", metavar="LEVEL", help="Optimization level of the generated code (0-2): from 1 on constant expressions are folded and the code is optimized with a peephole optimizer", type=int, choices=OPT_LEVELS, default=DEFAULT_OPT_LEVEL)
+    argparser.add_argument("--accessor-calls", help="Call the builtin head and tail functions for .hd and .tl instead of inlining them, for smaller code", action="store_true")
+    argparser.add_argument("--fold-globals", help="With -O 1 or higher, use the value of constant globals in functions, assuming no other module assigns them", action="store_true")
+    argparser.add_argument("--object-format", help="Format of object files: commented SSM text, or binary with an index of the functions and labels", choices=OBJECT_FORMATS, default=DEFAULT_OBJECT_FORMAT)
+    argparser.add_argument("--keep-unused", help="Keep the functions and globals the program cannot reach in the executable", action="store_true")
+    argparser.add_argument("--incremental", help="Reuse outputs whose source and imported headers are unchanged", action="store_true")
+    argparser.add_argument("--cache-dir", metavar="PATH", help="Directory to keep outputs in for incremental builds", type=str, default=BUILD_CACHE_DIR)
+    args = argparser.parse_args()
+
+    import_mapping = make_import_mapping(args.im)
+    lib_dir_env = os.environ[IMPORT_DIR_ENV_VAR_NAME] if IMPORT_DIR_ENV_VAR_NAME in os.environ else None
+
+    if not args.infile.endswith(SOURCE_EXT):
+        ERROR_HANDLER.addError(ERR.CompInputFileExtension, [SOURCE_EXT])
+    if not os.path.isfile(args.infile):
+        ERROR_HANDLER.addError(ERR.CompInputFileNonExist, [args.infile])
+    main_name = os.path.splitext(os.path.basename(args.infile))[0]
+    validate_modname(main_name)
+    ERROR_HANDLER.checkpoint()
+
+    # Arguments passed on to every compiler invocation
+    common_argv = ["--lexer", args.lexer, "--parser", args.parser, "-O", str(args.O), "--object-format", args.object_format]
+    if args.lp is not None:
+        common_argv += ["--lp", args.lp]
+    if args.im is not None:
+        common_argv += ["--im", args.im]
+    if args.accessor_calls:
+        common_argv += ["--accessor-calls"]
+    if args.fold_globals:
+        common_argv += ["--fold-globals"]
+    if args.keep_unused:
+        common_argv += ["--keep-unused"]
+    if args.incremental:
+        common_argv += ["--incremental", "--cache-dir", args.cache_dir]
+
+    with ProcessPoolExecutor(max_workers=args.j) as executor:
+        start = time.time()
+        modules = discoverModules(args.infile, args, import_mapping, lib_dir_env, executor)
+        build_start = time.time()
+
+        # Only the executable can be renamed, other outputs have to stay where imports can find them
+        jobs, timings, success = build(modules, main_name, ["-o", args.o] if args.o else [], common_argv, executor)
+        build_end = time.time()
+
+    print("Discovered {} modules in {:.3f}s".format(len(modules), build_start - start))
+    reportTimings(modules, jobs, timings, build_end - build_start)
+    if not success:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
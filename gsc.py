@@ -6,24 +6,29 @@ from argparse import ArgumentParser
 from gsl import linkObjectFiles, write_out, make_import_mapping
 from lib.analysis.error_handler import *
 
-from lib.parser.lexer import tokenize, REG_FIL
-from lib.parser.parser import parseTokenStream
+from lib.parser.lexer import tokenize, REG_FIL, LEXER_ENGINES, DEFAULT_LEXER_ENGINE
+from lib.parser.parser import parseTokenStream, PARSER_BACKENDS, DEFAULT_PARSER_BACKEND
+from lib.util.util import SourceMap
+from lib.datastructure.AST import AST
 
 # TODO do not import all of this but just use analyse instead or something
 from semantic_analysis import buildSymbolTable, forbid_illegal_types, fixate_operator_properties, check_functype_clashes, normalizeAllTypes, resolveNames, analyseFunc, fixExpression
 from lib.analysis.typechecker import typecheck_globals, typecheck_functions
 from lib.builtins.builtin_mod import enrichExternalTable
-from lib.codegen.codegen import generate_object_file
-from lib.imports.imports import export_headers, getHeaders, getExternalSymbols, HEADER_EXT
+from lib.codegen.codegen import generate_object_file, codegen_options
+from lib.codegen.peephole import OPT_LEVELS, DEFAULT_OPT_LEVEL
+from lib.imports.imports import export_headers, getHeaders, getExternalSymbols, reportLoadTimes, HEADER_EXT
 from lib.imports.imports import validate_modname, get_type_dependencies, IMPORT_DIR_ENV_VAR_NAME, SOURCE_EXT, \
     OBJECT_EXT, TARGET_EXT
-from lib.imports.objectfile_imports import getObjectFiles
+from lib.imports.objectfile_imports import getObjectFiles, isBinaryObject, OBJECT_FORMATS, DEFAULT_OBJECT_FORMAT
+from lib.imports.build_cache import BuildCache, headerUpToDate, objectUpToDate, BUILD_CACHE_DIR
+from lib.imports.imports import content_hash
 from lib.parser.lexer import tokenize
 from lib.parser.parser import parseTokenStream
 
 
 
-def generateObjectFile(ast, args, main_mod_name, import_mapping):
+def generateObjectFile(ast, args, main_mod_name, import_mapping, source_hash):
     headerfiles, typesyn_headerfiles = getHeaders(ast,
         main_mod_name,
         HEADER_EXT,
@@ -31,6 +36,8 @@ def generateObjectFile(ast, args, main_mod_name, import_mapping):
         file_mapping_arg=import_mapping,
         lib_dir_path=args.lp,
         lib_dir_env=os.environ[IMPORT_DIR_ENV_VAR_NAME] if IMPORT_DIR_ENV_VAR_NAME in os.environ else None)
+    if args.load_times:
+        reportLoadTimes([(head['path'], head['load_time']) for head in list(headerfiles.values()) + list(typesyn_headerfiles.values())])
 
     ext_table, dependency_names = getExternalSymbols(ast, main_mod_name, headerfiles, typesyn_headerfiles)
     ext_table = enrichExternalTable(ext_table)
@@ -66,13 +73,30 @@ def generateObjectFile(ast, args, main_mod_name, import_mapping):
     typecheck_functions(symbol_table, ext_table)
     ERROR_HANDLER.checkpoint()
 
-    gen_code = generate_object_file(symbol_table, ext_table, headerfiles, main_mod_name, dependency_names)
+    stamp = {
+        'source': source_hash,
+        'headers': [(head['name'], head['hash']) for head in list(headerfiles.values()) + list(typesyn_headerfiles.values())],
+        'codegen': codegen_options(args.O, not args.accessor_calls, args.fold_globals)
+    }
+
+    gen_code = generate_object_file(symbol_table, ext_table, headerfiles, main_mod_name, dependency_names, stamp=stamp,
+        opt_level=args.O, inline_accessors=not args.accessor_calls, fold_globals=args.fold_globals, object_format=args.object_format)
 
     return gen_code
 
 
+# data is a string, or a list of chunks like the linker gives
+def emitOutput(data, outfile_name, type_name, args, found_path=None):
+    if args.stdout:
+        print(data if type(data) is str else "".join(data))
+    elif found_path == outfile_name:
+        print('Up to date {} "{}"'.format(type_name, outfile_name))
+    else:
+        write_out(data, outfile_name, type_name)
 
-def main():
+
+
+def main(argv=None):
     argparser = ArgumentParser(description="SPL Compiler")
     argparser.add_argument("infile", metavar="INPUT", help="Input file", nargs="?", default="./example programs/p1_example.spl")
     argparser.add_argument("--lp", metavar="PATH", help="Directory to import header files from", nargs="?", type=str)
@@ -81,7 +105,22 @@ def main():
     argparser.add_argument("-C", help="Produce an object file instead of an executable", action="store_true")
     argparser.add_argument("-H", help="Produce a header file instead of an executable", action="store_true")
     argparser.add_argument("--stdout", help="Output to stdout", action="store_true")
-    args = argparser.parse_args()
+    argparser.add_argument("--lexer", help="Lexer engine to use", choices=list(LEXER_ENGINES), default=DEFAULT_LEXER_ENGINE)
+    argparser.add_argument("--packrat", help="Memoize grammar rules while parsing", action="store_true")
+    argparser.add_argument("--parser", help="Parser backend to use", choices=PARSER_BACKENDS, default=DEFAULT_PARSER_BACKEND)
+    argparser.add_argument("--incremental", help="Reuse outputs whose source and imported headers are unchanged", action="store_true")
+    argparser.add_argument("--cache-dir", metavar="PATH", help="Directory to keep outputs in for incremental builds", type=str, default=BUILD_CACHE_DIR)
+    argparser.add_argument("-O", metavar="LEVEL", help="Optimization level of the generated code (0-2): from 1 on constant expressions are folded and the code is optimized with a peephole optimizer", type=int, choices=OPT_LEVELS, default=DEFAULT_OPT_LEVEL)
+    argparser.add_argument("--accessor-calls", help="Call the builtin head and tail functions for .hd and .tl instead of inlining them, for smaller code", action="store_true")
+    argparser.add_argument("--fold-globals", help="With -O 1 or higher, use the value of constant globals in functions, assuming no other module assigns them", action="store_true")
+    argparser.add_argument("--object-format", help="Format of object files: commented SSM text, or binary with an index of the functions and labels", choices=OBJECT_FORMATS, default=DEFAULT_OBJECT_FORMAT)
+    argparser.add_argument("--keep-unused", help="Keep the functions and globals the program cannot reach in the executable", action="store_true")
+    argparser.add_argument("--load-times", help="Print how long loading each imported header and object file took", action="store_true")
+    argparser.add_argument("--validate-ast", help="Check every AST node against the node schema when it is made (slow, for debugging)", action="store_true")
+    args = argparser.parse_args(argv)
+
+    # Always set, so a compile server does not keep it on for the next request
+    AST.setValidation(args.validate_ast)
 
     import_mapping = make_import_mapping(args.im)
 
@@ -116,6 +155,9 @@ def main():
     if args.o and args.stdout:
         ERROR_HANDLER.addError(ERR.CompInvalidArguments, ["Cannot write to specified path when outputting to stdout!\n(-o and --stdout)"])
 
+    if args.C and args.stdout and args.object_format == "binary":
+        ERROR_HANDLER.addError(ERR.CompInvalidArguments, ["Cannot output a binary object file to stdout!\n(-C and --stdout and --object-format binary)"])
+
     ERROR_HANDLER.checkpoint()
 
     try:
@@ -123,42 +165,71 @@ def main():
     except Exception as e:
         ERROR_HANDLER.addError(ERR.CompInputFileException, [args.infile, "{} {}".format(e.__class__.__name__, str(e))], fatal=True)
 
-    ERROR_HANDLER.setSourceMapping(infile)
-
-    tokenstream = tokenize(infile)
-
-    ast = parseTokenStream(tokenstream, infile)
+    source_hash = content_hash(infile.read())
+    infile.seek(0)
+
+    source = SourceMap(infile)
+    ERROR_HANDLER.setSourceMapping(source)
+
+    # Incremental build: look for outputs generated from the same source and headers
+    found_header = None
+    found_object = None
+    if args.incremental:
+        build_cache = BuildCache(args.cache_dir)
+        # Object files built with other options are kept apart, so switching between them does not evict anything
+        object_key = source_hash + "-" + codegen_options(args.O, not args.accessor_calls, args.fold_globals) + "-" + args.object_format
+        if compiler_target['header']:
+            found_header = build_cache.lookup(outfile_base + HEADER_EXT, main_mod_name, source_hash, HEADER_EXT,
+                lambda data: headerUpToDate(data, source_hash))
+        if compiler_target['object'] or compiler_target['binary']:
+            found_object = build_cache.lookup(outfile_base + OBJECT_EXT, main_mod_name, object_key, OBJECT_EXT,
+                lambda data: isBinaryObject(data) == (args.object_format == "binary") and objectUpToDate(data,
+                    source_hash,
+                    os.path.dirname(args.infile),
+                    file_mapping_arg=import_mapping,
+                    lib_dir_path=args.lp,
+                    lib_dir_env=os.environ[IMPORT_DIR_ENV_VAR_NAME] if IMPORT_DIR_ENV_VAR_NAME in os.environ else None,
+                    codegen=codegen_options(args.O, not args.accessor_calls, args.fold_globals)))
+
+    if (compiler_target['header'] and found_header is None) or ((compiler_target['object'] or compiler_target['binary']) and found_object is None):
+        tokenstream = tokenize(infile, engine=args.lexer)
+
+        ast = parseTokenStream(tokenstream, source, packrat=args.packrat, backend=args.parser)
 
     #print("Are there imports?",bool(ast.imports))
 
     #print(ast)
 
     if compiler_target['header']: # Generate a headerfile
-        symbol_table, ext_table = buildSymbolTable(ast, main_mod_name, just_for_headerfile=True)
-        #print(ext_table)
-        #resolveTypeSyns(symbol_table, ext_table)
-        mod_dependencies = get_type_dependencies(ast)
-        header_json = export_headers(symbol_table, main_mod_name, mod_dependencies, ext_table)
-
-        if not args.stdout:
-            outfile_name = outfile_base + HEADER_EXT
-            write_out(header_json, outfile_name, "headerfile")
+        if found_header is not None:
+            header_json, found_path = found_header
         else:
-            print(header_json)
+            symbol_table, ext_table = buildSymbolTable(ast, main_mod_name, just_for_headerfile=True)
+            #print(ext_table)
+            #resolveTypeSyns(symbol_table, ext_table)
+            mod_dependencies = get_type_dependencies(ast)
+            header_json = export_headers(symbol_table, main_mod_name, mod_dependencies, ext_table, source_hash=source_hash)
+            found_path = None
+            if args.incremental:
+                build_cache.store(main_mod_name, source_hash, HEADER_EXT, header_json)
+
+        emitOutput(header_json, outfile_base + HEADER_EXT, "headerfile", args, found_path)
+
+    if compiler_target['object'] or compiler_target['binary']:
+        if found_object is not None:
+            gen_code, found_path = found_object
+        else:
+            gen_code = generateObjectFile(ast, args, main_mod_name, import_mapping, source_hash)
+            found_path = None
+            if args.incremental:
+                build_cache.store(main_mod_name, object_key, OBJECT_EXT, gen_code)
 
     if compiler_target['object']: # Generate an object file
-        gen_code = generateObjectFile(ast, args, main_mod_name, import_mapping)
-
-        if not args.stdout:
-            outfile_name = outfile_base + OBJECT_EXT
-            write_out(gen_code, outfile_name, "objectfile")
-        else:
-            print(gen_code)
+        emitOutput(gen_code, outfile_base + OBJECT_EXT, "objectfile", args, found_path)
 
     if compiler_target['binary']: # Generate a binary
-        gen_code = generateObjectFile(ast, args, main_mod_name, import_mapping)
-        from io import StringIO
-        pseudo_file_code = StringIO(gen_code)
+        from io import StringIO, BytesIO
+        pseudo_file_code = BytesIO(gen_code) if type(gen_code) is bytes else StringIO(gen_code)
 
         mod_dicts = getObjectFiles(
             pseudo_file_code,
@@ -169,13 +240,12 @@ def main():
             lib_dir_env=os.environ[IMPORT_DIR_ENV_VAR_NAME] if IMPORT_DIR_ENV_VAR_NAME in os.environ else None
         )
 
-        result = linkObjectFiles(mod_dicts, main_mod_name)
+        if args.load_times: # The first is the object file just generated, which is not loaded
+            reportLoadTimes([(mod.path, mod.load_time) for mod in mod_dicts[1:]])
 
-        if not args.stdout:
-            outfile_name = outfile_base + TARGET_EXT
-            write_out(result, outfile_name, "executable")
-        else:
-            print(result)
+        result = linkObjectFiles(mod_dicts, main_mod_name, keep_unused=args.keep_unused)
+
+        emitOutput(result, outfile_base + TARGET_EXT, "executable", args)
 
     # Final cleanup
     infile.close()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+import sys
+
+from lib.util.compile_server import request, run_tool, SERVER_TOOLS
+
+'''
+Compile client: takes the same arguments as gsc.py, or as gsl.py when the first argument is "gsl".
+The request is sent to a running gsd.py; without one, the compiler is run in this process instead.
+'''
+
+def main():
+    argv = sys.argv[1:]
+    tool = "gsc"
+    if argv and argv[0] in SERVER_TOOLS:
+        tool = argv.pop(0)
+
+    response = request(tool, argv)
+    if response is None: # No server, compile here
+        exit(run_tool(tool, argv))
+
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    exit(response["code"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser
+
+from lib.util.compile_server import serve, default_socket_path, SERVER_SOCKET_ENV_VAR_NAME
+
+def main():
+    argparser = ArgumentParser(description="SPL Compile server, answers requests from gscc.py")
+    argparser.add_argument("--socket", metavar="PATH", help="Unix socket to listen on (default: ${} or {})".format(SERVER_SOCKET_ENV_VAR_NAME, default_socket_path()), type=str)
+    args = argparser.parse_args()
+
+    exit(serve(args.socket))
+
+
+if __name__ == "__main__":
+    main()
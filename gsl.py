@@ -1,16 +1,22 @@
 #!/usr/bin/env python3
 
 from argparse import ArgumentParser
-from lib.imports.imports import validate_modname, IMPORT_DIR_ENV_VAR_NAME, OBJECT_EXT, TARGET_EXT
+from lib.imports.imports import validate_modname, reportLoadTimes, IMPORT_DIR_ENV_VAR_NAME, OBJECT_EXT, TARGET_EXT
 from lib.imports.objectfile_imports import getObjectFiles, OBJECT_COMMENT_PREFIX, OBJECT_FORMAT
+from lib.codegen.linker import modulePieces, pieceBlocks, resolveSymbols, markLive, pieceText, codeBlock
 from lib.analysis.error_handler import *
 
 import os
 
 from collections import OrderedDict
 from datetime import datetime
+from itertools import dropwhile
 
 
+# What the linker calls the code it adds itself, when it reports a problem with a label
+ENTRY_POINT_MODULE = "<entry point>"
+BUILTINS_MODULE = "<builtins>"
+
 BUILTIN_FUNC_BODIES = {
     'head':
         [
@@ -114,14 +120,19 @@ def makeEntryPoint(module_name):
     return temp
 
 
+# A section of the executable as a list of chunks of text, so the sections never have to be concatenated
 def buildSection(mod_dicts, section_name):
-    res = ""
+    res = []
     if section_name in SECTION_COMMENT_LOOKUP:
-        res += OBJECT_COMMENT_PREFIX + SECTION_COMMENT_LOOKUP[section_name] + "\n"
-    res += "\n".join(list(map(lambda x: x[section_name], mod_dicts))).lstrip() + "\n"
+        res.append(OBJECT_COMMENT_PREFIX + SECTION_COMMENT_LOOKUP[section_name] + "\n")
+    # Sections are stripped, so the modules before the first that has something in this section are skipped
+    texts = list(dropwhile(lambda text: len(text) == 0, map(lambda x: x[section_name], mod_dicts)))
+    for text in texts[:-1]:
+        res.extend([text, "\n"])
+    res.extend(texts[-1:] + ["\n"])
     if section_name == "functions":
         for func_name, instructions in BUILTIN_FUNC_BODIES.items():
-            res += func_name + ":" + "\n".join(instructions) + "\n"
+            res.append(func_name + ":" + "\n".join(instructions) + "\n")
     return res
 
 
@@ -136,33 +147,72 @@ SECTION_COMMENT_LOOKUP = {
     "global_mem": OBJECT_FORMAT['globals'],
     "functions": OBJECT_FORMAT['funcs']
 }
-def linkObjectFiles(mod_dicts, main_mod_name):
+
+# The builtin function bodies as pieces, see lib/codegen/linker
+def builtinPieces():
+    texts = [func_name + ":" + "\n".join(instructions) for func_name, instructions in BUILTIN_FUNC_BODIES.items()]
+    return [(codeBlock(text), text) for text in texts]
+
+'''
+The sections of the executable with only the code that can be reached from the entry point.
+'''
+def buildLiveSections(modules, builtins, entry, defined):
+    markLive([entry] + [block for pieces in modules for block in pieceBlocks(pieces)] + [block for (block, _) in builtins], defined)
+
+    res = {}
+    for section_name in SECTION_COMMENT_LOOKUP:
+        chunks = [OBJECT_COMMENT_PREFIX + SECTION_COMMENT_LOOKUP[section_name] + "\n"]
+        for pieces in modules:
+            chunks.extend(pieceText(piece) + "\n" for piece in pieces[section_name] if piece[0].live)
+        if section_name == "functions":
+            chunks.extend(text + "\n" for (block, text) in builtins if block.live)
+        res[section_name] = chunks
+    return res
+
+'''
+Returns the executable as a list of chunks of text, to be written out one after another (or joined).
+Every label has to be defined once, and every label that is used has to be defined, otherwise the errors are reported.
+Unless keep_unused is set, functions and globals the program cannot reach are left out.
+'''
+def linkObjectFiles(mod_dicts, main_mod_name, keep_unused=False):
     head = ("// SSM ASSEMBLY GENERATED ON {}".format(datetime.now().strftime("%c"))).upper()
-    func_text = buildSection(mod_dicts, 'functions')
-    right_main_present = func_text.find(getEntryPointName(main_mod_name)) != -1
+    modules = [modulePieces(mod) for mod in mod_dicts]
+    builtins = builtinPieces()
+    entry = codeBlock(makeEntryPoint(main_mod_name), root=True)
+
+    right_main_present = any(getEntryPointName(main_mod_name) in block.defines for pieces in modules for (block, _) in pieces['functions'])
     if not right_main_present:
         ERROR_HANDLER.addError(ERR.CompilerNoEntrypointPresent, [main_mod_name])
         ERROR_HANDLER.checkpoint()
+    defined = resolveSymbols([(ENTRY_POINT_MODULE, [entry]), (BUILTINS_MODULE, [block for (block, _) in builtins])] +
+        [(mod.module, pieceBlocks(pieces)) for (mod, pieces) in zip(mod_dicts, modules)])
+
+    if keep_unused:
+        sections = {section_name: buildSection(mod_dicts, section_name) for section_name in SECTION_COMMENT_LOOKUP}
+    else:
+        sections = buildLiveSections(modules, builtins, entry, defined)
 
     sep_line = "//" + "="*(len(head)-2)+"\n"
-    result = ""
-    result += sep_line
-    result += head + "\n"
-    result += "// © Ward Theunisse & Ischa Stork 2020\n"
-    result += sep_line
-    result += buildSection(mod_dicts, 'global_inits')
-    result += OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['entrypoint'] + "\n"
-    result += "BRA main\n"
-    result += buildSection(mod_dicts, 'global_mem')
-    result += func_text
-    result += OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['main'] + "\n"
-    result += makeEntryPoint(main_mod_name)
+    result = [
+        sep_line,
+        head + "\n",
+        "// © Ward Theunisse & Ischa Stork 2020\n",
+        sep_line
+    ]
+    result.extend(sections['global_inits'])
+    result.append(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['entrypoint'] + "\n")
+    result.append("BRA main\n")
+    result.extend(sections['global_mem'])
+    result.extend(sections['functions'])
+    result.append(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['main'] + "\n")
+    result.append(makeEntryPoint(main_mod_name))
     return result
 
+# data is a string, a list of chunks that are written one after another, or bytes
 def write_out(data, outfile_name, type_name):
     try:
-        with open(outfile_name, "w") as outfile:
-            outfile.write(data)
+        with open(outfile_name, "wb" if type(data) is bytes else "w") as outfile:
+            outfile.writelines([data] if type(data) in [str, bytes] else data)
             print('Succesfully written {} "{}"'.format(type_name, outfile_name))
     except Exception as e:
         ERROR_HANDLER.addError(ERR.CompOutputFileException, [outfile_name, "{} {}".format(e.__class__.__name__, str(e))], fatal=True)
@@ -177,14 +227,16 @@ def make_import_mapping(im):
     return temp
 
 
-def main():
+def main(argv=None):
     argparser = ArgumentParser(description="SPL Linker")
     argparser.add_argument("infile", metavar="INPUT", help="Input file")
     argparser.add_argument("--lp", metavar="PATH", help="Directory to import object files from", nargs="?", type=str)
     argparser.add_argument("--im", metavar="LIBNAME:PATH,...", help="Comma-separated object_file:path mapping list, to explicitly specify object file paths", type=str)
     argparser.add_argument("-o", metavar="OUTPUT", help="Output filename", type=str)
     argparser.add_argument("--stdout", help="Output to stdout", action="store_true")
-    args = argparser.parse_args()
+    argparser.add_argument("--keep-unused", help="Keep the functions and globals the program cannot reach in the executable", action="store_true")
+    argparser.add_argument("--load-times", help="Print how long loading each object file took", action="store_true")
+    args = argparser.parse_args(argv)
 
     import_mapping = make_import_mapping(args.im)
 
@@ -225,14 +277,16 @@ def main():
         lib_dir_env=os.environ[IMPORT_DIR_ENV_VAR_NAME] if IMPORT_DIR_ENV_VAR_NAME in os.environ else None
     )
     infile.close()
+    if args.load_times:
+        reportLoadTimes([(mod.path, mod.load_time) for mod in mod_dicts])
 
-    end = linkObjectFiles(mod_dicts, main_mod_name)
+    end = linkObjectFiles(mod_dicts, main_mod_name, keep_unused=args.keep_unused)
     #print(end)
 
     if not args.stdout:
         write_out(end, outfile_name, "executable")
     else:
-        print(end)
+        print("".join(end))
 
     '''
     for struct in mod_dicts:
@@ -4,7 +4,7 @@ from enum import IntEnum
 import sys
 from lib.datastructure.token import Token
 from lib.datastructure.AST import AST
-from lib.util.util import pointToPosition
+from lib.util.util import pointToPosition, SourceMap
 from lib.parser.lexer import REG_FIL
 from lib.builtins.functions import ENTRYPOINT_FUNCNAME
 
@@ -98,6 +98,9 @@ class ERR(IntEnum):
     CompilerNoEntrypointPresent = 74
     ImportSameName = 75
     IllegalOpDef = 76
+    # Linker
+    LinkerDuplicateLabel = 77
+    LinkerUndefinedLabel = 78
 
 ERRMSG = {
     ERR.OverloadFunMultipleDef: 'Overloaded functions "{}" has multiple definitions with the same type:',
@@ -176,6 +179,8 @@ ERRMSG = {
     ERR.CompilerNoEntrypointPresent: 'No entrypoint function "{}"'.format(ENTRYPOINT_FUNCNAME) + ' found in input module "{}"',
     ERR.ImportSameName: 'Tried to import a module with the same name as the input file: "{}"',
     ERR.IllegalOpDef: 'It is not allowed to define operator with identifier {} \n{}',
+    ERR.LinkerDuplicateLabel: 'Label "{}" is defined by both module "{}" and module "{}"',
+    ERR.LinkerUndefinedLabel: 'Label "{}" used by module "{}" is not defined by any linked module',
 }
 
 class WARN(IntEnum):
@@ -217,7 +222,8 @@ class ErrorHandler():
         self.hidewarn = False
 
     def setSourceMapping(self, sourcecode):
-        self.sourcecode = sourcecode
+        # Index the source once, instead of reading up to the line for every message
+        self.sourcecode = sourcecode if isinstance(sourcecode, SourceMap) else SourceMap(sourcecode)
 
     def addError(self, error_type, tokens, source=None, fatal=False):
         error = {
@@ -1,39 +1,214 @@
 #!/usr/bin/env python3
 
 from lib.parser.parser import Accessor_lookup
-from lib.datastructure.position import Position
+from lib.datastructure.position import NO_POSITION
 from lib.datastructure.token import Token, TOKEN
 from lib.datastructure.AST import AST, FunKind, FunKindToUniq, FunUniq, Accessor
 from lib.datastructure.scope import NONGLOBALSCOPE
 from lib.debug.AST_prettyprinter import subprint_type
 from lib.analysis.error_handler import ERR, ERROR_HANDLER
+from lib.datastructure.interned_types import internType, freezeType, sameType, VOID_TYPE_NODE
+from collections import OrderedDict
+
+def literalTypeNode(node):
+    node._start_pos = NO_POSITION
+    return freezeType(node)
+
+# Shared between all literals, so these nodes must never be modified
+LITERAL_TYPE_NODES = {
+    TOKEN.INT: literalTypeNode(AST.BASICTYPE(type_id=Token(NO_POSITION, TOKEN.TYPE_IDENTIFIER, "Int"))),
+    TOKEN.CHAR: literalTypeNode(AST.BASICTYPE(type_id=Token(NO_POSITION, TOKEN.TYPE_IDENTIFIER, "Char"))),
+    TOKEN.BOOL: literalTypeNode(AST.BASICTYPE(type_id=Token(NO_POSITION, TOKEN.TYPE_IDENTIFIER, "Bool"))),
+    TOKEN.STRING: literalTypeNode(AST.LISTTYPE(type=AST.TYPE(val=AST.BASICTYPE(type_id=Token(NO_POSITION, TOKEN.TYPE_IDENTIFIER, "Char"))))),
+    TOKEN.EMPTY_LIST: literalTypeNode(AST.BASICTYPE(type_id=Token(NO_POSITION, TOKEN.TYPE_IDENTIFIER, "[]")))
+}
+
+CONDITION_TYPE_NODE = freezeType(AST.BASICTYPE(type_id=Token(NO_POSITION, TOKEN.TYPE_IDENTIFIER, "Bool")))
 
 def tokenToNode(token):
-    if token.typ == TOKEN.INT:
-        node = AST.BASICTYPE(type_id=Token(Position(), TOKEN.TYPE_IDENTIFIER, "Int"))
-        node._start_pos = Position()
-        return node
-    elif token.typ == TOKEN.CHAR:
-        node = AST.BASICTYPE(type_id=Token(Position(), TOKEN.TYPE_IDENTIFIER, "Char"))
-        node._start_pos = Position()
-        return node
-    elif token.typ == TOKEN.BOOL:
-        node = AST.BASICTYPE(type_id=Token(Position(), TOKEN.TYPE_IDENTIFIER, "Bool"))
-        node._start_pos = Position()
-        return node
-    elif token.typ == TOKEN.STRING:
-        node = AST.LISTTYPE(type=AST.TYPE(val=AST.BASICTYPE(type_id=Token(Position(), TOKEN.TYPE_IDENTIFIER, "Char"))))
-        node._start_pos = Position()
-        return node
-    elif token.typ == TOKEN.EMPTY_LIST:
-        node = AST.BASICTYPE(type_id=Token(Position(), TOKEN.TYPE_IDENTIFIER, "[]"))
-        node._start_pos = Position()
-        return node
+    if token.typ in LITERAL_TYPE_NODES:
+        return LITERAL_TYPE_NODES[token.typ]
     else:
         raise Exception('Unexpected token type encountered')
 
+'''
+Overloads of every function and operator, grouped by arity and return type, in the order the typechecker tries them:
+the overloads of the symbol table in definition order, then those of the external table grouped per module.
+This way a call only looks at the overloads it could resolve to.
+'''
+class OverloadIndex():
+    def __init__(self, symbol_table, ext_table):
+        self.local = {}
+        self.external = {}
+        self.external_returns = set()
+
+        for identifier, overloads in symbol_table.functions.items():
+            for k, o in enumerate(overloads):
+                for return_type in [None, internType(o['type'].to_type.val)]:
+                    self.local.setdefault((identifier, return_type, len(o['type'].from_types)), []).append((k, o))
+
+        for identifier, overloads in ext_table.functions.items():
+            per_module = {}
+            for oid, o in enumerate(overloads):
+                for return_type in [None, internType(o['type'].to_type.val)]:
+                    self.external_returns.add((identifier, return_type))
+                    per_module.setdefault(return_type, OrderedDict()).setdefault(o['module'], []).append((oid, o))
+            for return_type, modules in per_module.items():
+                for module, module_overloads in modules.items():
+                    for oid, o in module_overloads:
+                        self.external.setdefault((identifier, return_type, len(o['type'].from_types)), []).append((module, oid, o))
+
+    # A return type of None means the call can return anything
+    def localCandidates(self, identifier, return_type, arity):
+        return self.local.get((identifier, return_type, arity), [])
+
+    def externalCandidates(self, identifier, return_type, arity):
+        return self.external.get((identifier, return_type, arity), [])
+
+    def externalReturns(self, identifier, return_type):
+        return (identifier, return_type) in self.external_returns
+
+'''
+What checking an expression against a type will do, worked out bottom-up before the expression is checked top-down.
+If exact is set, checking it against a type without reporting a mismatch succeeds for exactly the types in types,
+and reports nothing. Otherwise (undefined functions, empty lists, tuples, illegal accessors and calls on any of those)
+such a check can report errors itself, so the expression is checked against every type it is tried with.
+'''
+class Synthesis():
+    __slots__ = ('types', 'exact')
+
+    def __init__(self, types, exact):
+        self.types = types
+        self.exact = exact
+
+NOT_EXACT = Synthesis(frozenset(), False)
+
+# Everything remembered while checking one expression
+class TypecheckMemo():
+    def __init__(self):
+        self.synthesized = {}
+        self.arguments = {}
+
+def varrefType(expr, symbol_table, ext_table, func):
+    if type(expr.val) is AST.RES_GLOBAL:
+        if expr.val.module is None:
+            return symbol_table.global_vars[expr.val.id.val].type.val
+        else:
+            return ext_table.global_vars[expr.val.id.val]['type'].val
+    elif type(expr.val) is AST.RES_NONGLOBAL:
+        if expr.val.scope == NONGLOBALSCOPE.LocalVar:
+            return func['local_vars'][expr.val.id.val].type.val
+        else:
+            return func['arg_vars'][expr.val.id.val]['type'].val
+    return None
+
+# The type getSubType ends up with, or None if it would report an error on the way
+def accessedType(typ, fields):
+    for field in fields:
+        accessor = Accessor_lookup.get(field.val)
+        if accessor == Accessor.FST or accessor == Accessor.SND:
+            if type(typ) is not AST.TUPLETYPE:
+                return None
+            typ = typ.a.val if accessor == Accessor.FST else typ.b.val
+        elif accessor == Accessor.HD or accessor == Accessor.TL:
+            if type(typ) is not AST.LISTTYPE:
+                return None
+            if accessor == Accessor.HD:
+                typ = typ.type.val
+        else:
+            return None
+    return typ
+
+''' Work out the types of the expression and all of its subexpressions, bottom-up '''
+def synthesize(expr, symbol_table, ext_table, func, index, synthesized):
+    if type(expr) is Token:
+        if expr.typ in LITERAL_TYPE_NODES and expr.typ != TOKEN.EMPTY_LIST:
+            res = Synthesis(frozenset([internType(LITERAL_TYPE_NODES[expr.typ])]), True)
+        else:
+            res = NOT_EXACT
+    elif type(expr) is AST.PARSEDEXPR:
+        res = synthesize(expr.val, symbol_table, ext_table, func, index, synthesized)
+    elif type(expr) is AST.RES_VARREF:
+        typ = varrefType(expr, symbol_table, ext_table, func)
+        typ = accessedType(typ, expr.val.fields) if typ is not None else None
+        res = Synthesis(frozenset([internType(typ)]), True) if typ is not None else NOT_EXACT
+    elif type(expr) is AST.FUNCALL:
+        args = [synthesize(arg, symbol_table, ext_table, func, index, synthesized) for arg in expr.args]
+        res = synthesizeCall(expr, args, symbol_table, ext_table, func, index)
+    elif type(expr) is AST.TUPLE:
+        synthesize(expr.a, symbol_table, ext_table, func, index, synthesized)
+        synthesize(expr.b, symbol_table, ext_table, func, index, synthesized)
+        res = NOT_EXACT
+    else:
+        res = NOT_EXACT
+    synthesized[id(expr)] = res
+    return res
+
+'''
+A call can be checked against a return type if exactly one overload with that return type accepts the arguments,
+or, if more do, exactly one of those is defined in this module.
+In a global definition a call that resolves is an error in itself, so calls there are never exact.
+'''
+def synthesizeCall(expr, args, symbol_table, ext_table, func, index):
+    identifier = (FunKindToUniq(expr.kind), expr.id.val)
+    if func is None or not all(arg.exact for arg in args):
+        return NOT_EXACT
+    if identifier not in symbol_table.functions and identifier not in ext_table.functions:
+        return NOT_EXACT
+
+    def accepts(o):
+        return all(internType(param.val) in arg.types for param, arg in zip(o['type'].from_types, args))
+
+    local_matches = {}
+    for _, o in index.localCandidates(identifier, None, len(args)):
+        if accepts(o):
+            return_type = internType(o['type'].to_type.val)
+            local_matches[return_type] = local_matches.get(return_type, 0) + 1
+    external_matches = {}
+    for _, _, o in index.externalCandidates(identifier, None, len(args)):
+        if accepts(o):
+            return_type = internType(o['type'].to_type.val)
+            external_matches[return_type] = external_matches.get(return_type, 0) + 1
+
+    types = [t for t in set(local_matches) | set(external_matches)
+             if local_matches.get(t, 0) == 1 or (t not in local_matches and external_matches[t] == 1)]
+    return Synthesis(frozenset(types), True)
+
+'''
+Check an argument against the type of a parameter, without reporting a mismatch.
+Returns whether it matches, and the checked argument if it had to be checked to know that.
+A call tries the same argument against the parameters of many overloads, and nested calls would do so again for every
+combination, so arguments that are not exact are only checked once per parameter type, remembering the errors they reported.
+'''
+def typecheckArgument(arg, param_type, symbol_table, ext_table, func, r, index, memo):
+    synthesized = memo.synthesized.get(id(arg))
+    if synthesized is not None and synthesized.exact:
+        return internType(param_type) in synthesized.types, None
+
+    key = (id(arg), id(param_type))
+    if key in memo.arguments:
+        success, res, errors = memo.arguments[key]
+        for e in errors:
+            ERROR_HANDLER.addError(e['type'], e['tokens'], e['source'])
+        return success, res
+
+    first_error = len(ERROR_HANDLER.errors)
+    success, res = typecheck(arg, param_type, symbol_table, ext_table, func, r, noErrors=True, index=index, memo=memo)
+    memo.arguments[key] = (success, res, ERROR_HANDLER.errors[first_error:])
+    return success, res
+
+# Only the arguments of the overload that was picked are checked top-down, the others were decided by their synthesis
+def selectedArguments(expr, match, symbol_table, ext_table, func, r, index, memo):
+    return [res if res is not None else typecheck(arg, param.val, symbol_table, ext_table, func, r, noErrors=True, index=index, memo=memo)[1]
+            for arg, param, res in zip(expr.args, match['params'], match['args'])]
+
 ''' Type check the given expression '''
-def typecheck(expr, exp_type, symbol_table, ext_table, func=None, r=0, noErrors=False):
+def typecheck(expr, exp_type, symbol_table, ext_table, func=None, r=0, noErrors=False, index=None, memo=None):
+    if index is None:
+        index = OverloadIndex(symbol_table, ext_table)
+    if memo is None:
+        memo = TypecheckMemo()
+        synthesize(expr, symbol_table, ext_table, func, index, memo.synthesized)
 
     if type(expr) is Token:
         if expr.typ == TOKEN.EMPTY_LIST:
@@ -43,46 +218,24 @@ def typecheck(expr, exp_type, symbol_table, ext_table, func=None, r=0, noErrors=
                 ERROR_HANDLER.addError(ERR.UnexpectedEmptyList, [expr])
 
         typ = tokenToNode(expr)
-        if not AST.equalVals(typ, exp_type):
+        if not sameType(typ, exp_type):
             if r == 0 and not noErrors:
                 ERROR_HANDLER.addError(ERR.UnexpectedType, [subprint_type(typ), subprint_type(exp_type), expr])
             return False, expr
 
         return True, expr
     elif type(expr) is AST.PARSEDEXPR:
-        return typecheck(expr.val, exp_type, symbol_table, ext_table, func, r, noErrors)
+        return typecheck(expr.val, exp_type, symbol_table, ext_table, func, r, noErrors, index, memo)
     elif type(expr) is AST.RES_VARREF:
-        if type(expr.val) is AST.RES_GLOBAL:
-            if expr.val.module is None:
-                typ = symbol_table.global_vars[expr.val.id.val].type.val
-            else:
-                typ = ext_table.global_vars[expr.val.id.val]['type'].val
+        typ = varrefType(expr, symbol_table, ext_table, func)
+        if typ is not None:
             fields = list(reversed(expr.val.fields))
-
             success, typ = getSubType(typ, fields, expr)
 
             if not success:
                 return True, expr
 
-            if not AST.equalVals(typ, exp_type):
-                if r == 0 and not noErrors:
-                    ERROR_HANDLER.addError(ERR.UnexpectedType, [subprint_type(typ), subprint_type(exp_type), expr])
-                return False, expr
-
-        elif type(expr.val) is AST.RES_NONGLOBAL:
-            typ = None
-            if expr.val.scope == NONGLOBALSCOPE.LocalVar:
-                typ = func['local_vars'][expr.val.id.val].type.val
-            else:
-                typ = func['arg_vars'][expr.val.id.val]['type'].val
-
-            fields = list(reversed(expr.val.fields))
-            success, typ = getSubType(typ, fields, expr)
-
-            if not success:
-                return True, expr
-
-            if not AST.equalVals(typ, exp_type):
+            if not sameType(typ, exp_type):
                 if r == 0 and not noErrors:
                     ERROR_HANDLER.addError(ERR.UnexpectedType, [subprint_type(typ), subprint_type(exp_type), expr])
                 return False, expr
@@ -94,47 +247,31 @@ def typecheck(expr, exp_type, symbol_table, ext_table, func=None, r=0, noErrors=
             ERROR_HANDLER.addError(ERR.UndefinedFun, [expr.id.val, expr.id])
             return True, expr
 
+        return_type = internType(exp_type) if exp_type is not None else None
+
         # Symbol table functions
         matches = []
-        if identifier in symbol_table.functions:
-            out_type_matches = {}
-            i = 0
-            for o in symbol_table.functions[identifier]:
-                if AST.equalVals(exp_type, o['type'].to_type.val) or exp_type is None:
-                    out_type_matches[i] = o
-                i += 1
-
-            for k, o in out_type_matches.items():
-                args = []
-
-                if len(o['type'].from_types) == len(expr.args):
-                    input_matches = 0
-
-                    for i in range(len(o['type'].from_types)):
-                        typ, arg_res = typecheck(expr.args[i], o['type'].from_types[i].val, symbol_table, ext_table, func, r, noErrors=True)
-                        args.append(arg_res)
-                        if typ:
-                            input_matches += 1
-
-                    if input_matches == len(expr.args):
-                        matches.append({
-                            'id': k,
-                            'module': None,
-                            'args': args,
-                            'returns': not AST.equalVals(o['type'].to_type, AST.TYPE(val=Token(Position(), TOKEN.TYPE_IDENTIFIER, "Void"))),
-                        })
+        for k, o in index.localCandidates(identifier, return_type, len(expr.args)):
+            args = []
+            input_matches = 0
+
+            for i in range(len(o['type'].from_types)):
+                typ, arg_res = typecheckArgument(expr.args[i], o['type'].from_types[i].val, symbol_table, ext_table, func, r, index, memo)
+                args.append(arg_res)
+                if typ:
+                    input_matches += 1
+
+            if input_matches == len(expr.args):
+                matches.append({
+                    'id': k,
+                    'module': None,
+                    'params': o['type'].from_types,
+                    'args': args,
+                    'returns': not sameType(o['type'].to_type, VOID_TYPE_NODE),
+                })
 
         if identifier in ext_table.functions:
-            out_type_matches = {}
-            i = 0
-            for o in ext_table.functions[identifier]:
-                if AST.equalVals(exp_type, o['type'].to_type.val) or exp_type is None:
-                    if o['module'] not in out_type_matches:
-                        out_type_matches[o['module']] = {}
-                    out_type_matches[o['module']][i] = o
-                i += 1
-
-            if len(out_type_matches) == 0 and len(matches) == 0:
+            if not index.externalReturns(identifier, return_type) and len(matches) == 0:
                 if not noErrors and exp_type is not None:
                     if expr.kind == FunKind.FUNC:
                         ERROR_HANDLER.addError(ERR.NoOverloadedFunDef, [expr.id.val, subprint_type(exp_type), expr.id])
@@ -142,25 +279,24 @@ def typecheck(expr, exp_type, symbol_table, ext_table, func=None, r=0, noErrors=
                         ERROR_HANDLER.addError(ERR.NoOpDefWithType, [expr.id.val, subprint_type(exp_type), expr.id])
                 return False, expr
 
-            for module, f in out_type_matches.items():
-                for oid, of in f.items():
-                    args = []
-                    if len(of['type'].from_types) == len(expr.args):
-                        input_matches = 0
-
-                        for i in range(len(of['type'].from_types)):
-                            typ, arg_res = typecheck(expr.args[i], of['type'].from_types[i].val, symbol_table, ext_table, func, r, noErrors=True)
-                            args.append(arg_res)
-                            if typ:
-                                input_matches += 1
-
-                        if input_matches == len(expr.args):
-                            matches.append({
-                                'id': oid,
-                                'module': module,
-                                'args': args,
-                                'returns': not AST.equalVals(of['type'].to_type, AST.TYPE(val=Token(Position(), TOKEN.TYPE_IDENTIFIER, "Void"))),
-                            })
+            for module, oid, of in index.externalCandidates(identifier, return_type, len(expr.args)):
+                args = []
+                input_matches = 0
+
+                for i in range(len(of['type'].from_types)):
+                    typ, arg_res = typecheckArgument(expr.args[i], of['type'].from_types[i].val, symbol_table, ext_table, func, r, index, memo)
+                    args.append(arg_res)
+                    if typ:
+                        input_matches += 1
+
+                if input_matches == len(expr.args):
+                    matches.append({
+                        'id': oid,
+                        'module': module,
+                        'params': of['type'].from_types,
+                        'args': args,
+                        'returns': not sameType(of['type'].to_type, VOID_TYPE_NODE),
+                    })
 
         # Give preference to functions defined in current module if type is exactly the same.
         if len(matches) > 0:
@@ -203,7 +339,8 @@ def typecheck(expr, exp_type, symbol_table, ext_table, func=None, r=0, noErrors=
                 ERROR_HANDLER.addError(ERR.GlobalDefMustBeConstant, [expr.id])
                 return True, expr
 
-        return True, AST.TYPED_FUNCALL(id=expr.id, uniq=FunKindToUniq(expr.kind), args=matches[0]['args'], oid=matches[0]['id'],
+        args = selectedArguments(expr, matches[0], symbol_table, ext_table, func, r, index, memo)
+        return True, AST.TYPED_FUNCALL(id=expr.id, uniq=FunKindToUniq(expr.kind), args=args, oid=matches[0]['id'],
                                            module=matches[0]['module'], returns=matches[0]['returns'])
 
     elif type(expr) is AST.TUPLE:
@@ -211,8 +348,8 @@ def typecheck(expr, exp_type, symbol_table, ext_table, func=None, r=0, noErrors=
             ERROR_HANDLER.addError(ERR.UnexpectedTuple, [exp_type, expr])
             return True, expr
 
-        type1, a = typecheck(expr.a, exp_type.a.val, symbol_table, ext_table, func)
-        type2, b = typecheck(expr.b, exp_type.b.val, symbol_table, ext_table, func)
+        type1, a = typecheck(expr.a, exp_type.a.val, symbol_table, ext_table, func, index=index, memo=memo)
+        type2, b = typecheck(expr.b, exp_type.b.val, symbol_table, ext_table, func, index=index, memo=memo)
 
         return type1 or type2, AST.TUPLE(a=a, b=b)
 
@@ -249,7 +386,7 @@ def getSubType(typ, fields, expr):
 
     return success, typ
 
-def typecheck_actstmt(stmt, symbol_table, ext_table, func):
+def typecheck_actstmt(stmt, symbol_table, ext_table, func, index=None):
     typ = None
     if hasattr(stmt.val, 'varref'):
         if type(stmt.val.varref.val) == AST.RES_NONGLOBAL:
@@ -268,42 +405,43 @@ def typecheck_actstmt(stmt, symbol_table, ext_table, func):
         success, typ = getSubType(typ, fields, stmt.val.varref)
 
         if success:
-            _, stmt.val.expr = typecheck(stmt.val.expr, typ, symbol_table, ext_table, func)
+            _, stmt.val.expr = typecheck(stmt.val.expr, typ, symbol_table, ext_table, func, index=index)
     else:
-        _, stmt.val = typecheck(stmt.val, typ, symbol_table, ext_table, func)
+        _, stmt.val = typecheck(stmt.val, typ, symbol_table, ext_table, func, index=index)
 
-def typecheck_stmts(func, symbol_table, ext_table):
+def typecheck_stmts(func, symbol_table, ext_table, index=None):
     for vardecl in func['def'].vardecls:
-        _, vardecl.expr = typecheck(vardecl.expr, vardecl.type.val, symbol_table, ext_table, func)
+        _, vardecl.expr = typecheck(vardecl.expr, vardecl.type.val, symbol_table, ext_table, func, index=index)
 
     stmts = list(reversed(func['def'].stmts))
-    ast_boolnode = AST.BASICTYPE(type_id=Token(Position(), TOKEN.TYPE_IDENTIFIER, "Bool"))
     while len(stmts) > 0:
         stmt = stmts.pop()
         if type(stmt.val) == AST.ACTSTMT:
-            typecheck_actstmt(stmt.val, symbol_table, ext_table, func)
+            typecheck_actstmt(stmt.val, symbol_table, ext_table, func, index=index)
         elif type(stmt.val) == AST.IFELSE:
             for b in stmt.val.condbranches:
                 if b.expr is not None:
-                    _, b.expr = typecheck(b.expr, ast_boolnode, symbol_table, ext_table, func)
+                    _, b.expr = typecheck(b.expr, CONDITION_TYPE_NODE, symbol_table, ext_table, func, index=index)
                 stmts.extend(list(reversed(b.stmts)))
         elif type(stmt.val) == AST.LOOP:
             if stmt.val.cond is not None:
-                _, stmt.val.cond = typecheck(stmt.val.cond, ast_boolnode, symbol_table, ext_table, func)
+                _, stmt.val.cond = typecheck(stmt.val.cond, CONDITION_TYPE_NODE, symbol_table, ext_table, func, index=index)
             if stmt.val.init is not None:
-                typecheck_actstmt(stmt.val.init, symbol_table, ext_table, func)
+                typecheck_actstmt(stmt.val.init, symbol_table, ext_table, func, index=index)
             if stmt.val.update is not None:
-                typecheck_actstmt(stmt.val.update, symbol_table, ext_table, func)
+                typecheck_actstmt(stmt.val.update, symbol_table, ext_table, func, index=index)
             stmts.extend(list(reversed(stmt.val.stmts)))
         elif type(stmt.val) == AST.RETURN:
             if stmt.val.expr is not None:
-                _, stmt.val.expr = typecheck(stmt.val.expr, func['type'].to_type.val, symbol_table, ext_table, func)
+                _, stmt.val.expr = typecheck(stmt.val.expr, func['type'].to_type.val, symbol_table, ext_table, func, index=index)
 
 def typecheck_functions(symbol_table, ext_table):
+    index = OverloadIndex(symbol_table, ext_table)
     for f in symbol_table.functions:
         for o in symbol_table.functions[f]:
-            typecheck_stmts(o, symbol_table, ext_table)
+            typecheck_stmts(o, symbol_table, ext_table, index)
 
 def typecheck_globals(symbol_table, ext_table):
+    index = OverloadIndex(symbol_table, ext_table)
     for g in symbol_table.global_vars:
-        _, symbol_table.global_vars[g].expr = typecheck(symbol_table.global_vars[g].expr, symbol_table.global_vars[g].type.val, symbol_table, ext_table)
\ No newline at end of file
+        _, symbol_table.global_vars[g].expr = typecheck(symbol_table.global_vars[g].expr, symbol_table.global_vars[g].type.val, symbol_table, ext_table, index=index)
\ No newline at end of file
@@ -5,13 +5,15 @@ from lib.builtins.operators import BUILTIN_INFIX_OPS, BUILTIN_PREFIX_OPS, ILLEGA
 from lib.builtins.types import BUILTIN_TYPES, VOID_TYPE, BASIC_TYPES, HIGHER_BUILTIN_TYPES
 from lib.datastructure.AST import AST, FunUniq, FunKind
 from lib.datastructure.token import Token, TOKEN
-from lib.datastructure.position import Position
+from lib.datastructure.position import NO_POSITION
+from lib.datastructure.interned_types import freezeType, sameType
 
 from lib.datastructure.symbol_table import ExternalTable
 
 from lib.analysis.error_handler import *
 
 from collections import OrderedDict
+from types import MappingProxyType
 
 
 BUILTINS_NAME = "builtins"
@@ -21,15 +23,15 @@ Given an abstract type (like T) return all of its concrete possibilities as AST
 '''
 def abstractToConcreteType(abstract_type):
     if abstract_type == 'T':
-        return [AST.BASICTYPE(type_id=Token(Position(), TOKEN.TYPE_IDENTIFIER, b)) for b in BASIC_TYPES]
+        return [AST.BASICTYPE(type_id=Token(NO_POSITION, TOKEN.TYPE_IDENTIFIER, b)) for b in BASIC_TYPES]
     elif abstract_type in BASIC_TYPES:
-        return [AST.BASICTYPE(type_id=Token(Position(), TOKEN.TYPE_IDENTIFIER, abstract_type))]
+        return [AST.BASICTYPE(type_id=Token(NO_POSITION, TOKEN.TYPE_IDENTIFIER, abstract_type))]
     elif abstract_type == '[T]':
-        return [AST.LISTTYPE(type=AST.TYPE(val=AST.BASICTYPE(type_id=Token(Position(), TOKEN.TYPE_IDENTIFIER, b)))) for b in BASIC_TYPES]
+        return [AST.LISTTYPE(type=AST.TYPE(val=AST.BASICTYPE(type_id=Token(NO_POSITION, TOKEN.TYPE_IDENTIFIER, b)))) for b in BASIC_TYPES]
     elif abstract_type in ['[' + x + ']' for x in BASIC_TYPES]:
-        return [AST.LISTTYPE(type=AST.TYPE(val=AST.BASICTYPE(type_id=Token(Position(), TOKEN.TYPE_IDENTIFIER, abstract_type[1:-1]))))]
+        return [AST.LISTTYPE(type=AST.TYPE(val=AST.BASICTYPE(type_id=Token(NO_POSITION, TOKEN.TYPE_IDENTIFIER, abstract_type[1:-1]))))]
     elif abstract_type in VOID_TYPE:
-        return [Token(Position(), TOKEN.TYPE_IDENTIFIER, "Void")]
+        return [Token(NO_POSITION, TOKEN.TYPE_IDENTIFIER, "Void")]
     else:
         raise Exception("Unknown abstract type encountered in builtin operator table: %s" % abstract_type)
 
@@ -136,6 +138,27 @@ def generateBuiltinTypesyns():
 
     return temp
 
+'''
+The builtin functions, operators and type synonyms are the same for every compilation, so they are generated once per process.
+Entries are read-only views, the overload lists are tuples and the types are interned, so the tables can be shared: whoever needs to change a list copies it first.
+'''
+_BUILTIN_TABLES = None
+
+def freezeEntries(table):
+    for entry in [entry for v in table.values() for entry in v]:
+        freezeType(entry['type'])
+    return OrderedDict([(k, tuple(MappingProxyType(entry) for entry in v)) for (k, v) in table.items()])
+
+def builtinTables():
+    global _BUILTIN_TABLES
+    if _BUILTIN_TABLES is None:
+        functions = freezeEntries(OrderedDict(list(generateBuiltinFuncs().items()) + list(generateBuiltinOps().items())))
+        type_syns = OrderedDict([(k, MappingProxyType(v)) for (k, v) in generateBuiltinTypesyns().items()])
+        for v in type_syns.values():
+            freezeType(v['def_type'])
+        _BUILTIN_TABLES = (MappingProxyType(functions), MappingProxyType(type_syns))
+    return _BUILTIN_TABLES
+
 # TODO this is broken now
 def mergeCustomOps(op_table, symbol_table, module_name):
     for x in symbol_table.functions:
@@ -179,17 +202,13 @@ def mergeCustomOps(op_table, symbol_table, module_name):
 
 
 def enrichExternalTable(external_table):
-    builtin_funcs = generateBuiltinFuncs()
-    builtin_ops = generateBuiltinOps()
-    builtin_type_syns = generateBuiltinTypesyns()
-
-    temp_functions = OrderedDict(list(builtin_funcs.items()) + list(builtin_ops.items()))
+    builtin_functions, builtin_type_syns = builtinTables()
 
     # Test if type syns of imports clash with builtins
     # Test for function clashes happens after normalisation
 
     # Merge functions:
-    for k,v in temp_functions.items():
+    for k,v in builtin_functions.items():
         if k not in external_table.functions:
             external_table.functions[k] = []
         external_table.functions[k].extend(v)
@@ -6,39 +6,66 @@ from lib.datastructure.scope import NONGLOBALSCOPE
 from lib.builtins.operators import BUILTIN_INFIX_OPS, BUILTIN_PREFIX_OPS
 from lib.builtins.functions import BUILTIN_FUNCTIONS
 from enum import IntEnum
-from lib.imports.objectfile_imports import OBJECT_FORMAT, OBJECT_COMMENT_PREFIX
+from collections import OrderedDict
+import json
+from lib.imports.objectfile_imports import OBJECT_FORMAT, OBJECT_COMMENT_PREFIX, DEFAULT_OBJECT_FORMAT, BINARY_OBJECT_MAGIC, BINARY_OBJECT_VERSION, BINARY_OBJECT_HEADER, codeSymbols
 from lib.parser.parser import Accessor_lookup
+from lib.codegen.peephole import optimize, DEFAULT_OPT_LEVEL
+from lib.codegen.folding import foldConstants
+
+# Everything besides the source and the headers that changes the generated code, recorded in the stamp of object files
+def codegen_options(opt_level=DEFAULT_OPT_LEVEL, inline_accessors=True, fold_globals=False):
+    return "O{}".format(opt_level) + ("" if inline_accessors else "-accessor-calls") + ("-fold-globals" if fold_globals else "")
 
 class MEMTYPE(IntEnum):
     BASICTYPE   = 1
     POINTER     = 2
 
-def generate_expr(expr, module_name, mappings, ext_table):
+'''
+Code taking a field of the tuple or list on top of the stack.
+.hd and .tl crash the program on an empty list. That check is inlined unless mappings['inline_accessors'] is off,
+in which case the builtin head and tail functions are called, which is smaller but executes 13 instructions instead of 5.
+'''
+def generate_field(field, mappings):
+    accessor = Accessor_lookup[field.val]
+    if accessor == Accessor.FST:
+        return ['LDH -1']
+    elif accessor == Accessor.SND:
+        return ['LDH 00']
+    elif mappings['inline_accessors']:
+        return ['LDS 00', 'LDC 00', 'EQ', 'BRT program_crash', 'LDH -1' if accessor == Accessor.HD else 'LDH 00']
+    else:
+        return ['BSR head' if accessor == Accessor.HD else 'BSR tail', 'AJS -1', 'LDR RR']
+
+'''
+Code for an expression, appended to the instruction buffer code (a new one if None), which is returned.
+The generate_* functions all add to the buffer of their caller, so every instruction is stored once.
+'''
+def generate_expr(expr, module_name, mappings, ext_table, code=None):
+    if code is None:
+        code = []
+
     if type(expr) is Token:
         if expr.typ is TOKEN.INT:
-            return ['LDC ' + str(expr.val) if expr.val != 0 else "LDC 00"]
+            code.append('LDC ' + str(expr.val) if expr.val != 0 else "LDC 00")
         elif expr.typ is TOKEN.CHAR:
-            return ['LDC ' + str(ord(expr.val))]
+            code.append('LDC ' + str(ord(expr.val)))
         elif expr.typ is TOKEN.BOOL:
-            return ['LDC -1'] if expr.val else ['LDC 00']
+            code.append('LDC -1' if expr.val else 'LDC 00')
         elif expr.typ is TOKEN.EMPTY_LIST:
-            return ['LDC 00']
+            code.append('LDC 00')
         elif expr.typ is TOKEN.STRING:
-            code = []
             for c in expr.val:
                 code.append('LDC ' + str(ord(c)))
             code.append('LDC 00')
             for _ in expr.val:
                 code.append('STMH 2')
-
-            return code
         else:
             raise Exception("Unknown type")
     elif type(expr) is AST.PARSEDEXPR:
-        return generate_expr(expr.val, module_name, mappings, ext_table)
+        generate_expr(expr.val, module_name, mappings, ext_table, code)
     elif type(expr) is AST.RES_VARREF:
         if type(expr.val) == AST.RES_GLOBAL:
-            res = []
             module = expr.val.module
             if expr.val.module is None:
                 module = module_name
@@ -47,72 +74,32 @@ def generate_expr(expr, module_name, mappings, ext_table):
                 module = expr.val.module
                 var_name = ext_table.global_vars[expr.val.id.val]['orig_id']
 
-            res.append('LDC ' + module + '_global_' + var_name)
-            res.append('LDA 00')
-
-            fields = list(reversed(expr.val.fields))
-            while len(fields) > 0:
-                field = fields.pop()
-                if Accessor_lookup[field.val] == Accessor.FST or Accessor_lookup[field.val] == Accessor.SND:
-                    if Accessor_lookup[field.val] == Accessor.FST:
-                        res.append('LDH -1')
-                    else:
-                        res.append('LDH 00')
-                else:
-                    if Accessor_lookup[field.val] == Accessor.HD:
-                        res.append('BSR head')
-                        res.append('AJS -1')
-                        res.append('LDR RR')
-                    else:
-                        res.append('BSR tail')
-                        res.append('AJS -1')
-                        res.append('LDR RR')
-
-            return res
+            code.append('LDC ' + module + '_global_' + var_name)
+            code.append('LDA 00')
         else:
-            res = []
-
             if expr.val.scope == NONGLOBALSCOPE.LocalVar:
                 var_offset = mappings['vars'][expr.val.id.val][0]
             else:
                 var_offset = mappings['args'][expr.val.id.val][0]
 
-            res.append('LDL ' + var_offset)
-            fields = list(reversed(expr.val.fields))
-            while len(fields) > 0:
-                field = fields.pop()
-                if Accessor_lookup[field.val] == Accessor.FST or Accessor_lookup[field.val] == Accessor.SND:
-                    if Accessor_lookup[field.val] == Accessor.FST:
-                        res.append('LDH -1')
-                    else:
-                        res.append('LDH 00')
-                else:
-                    if Accessor_lookup[field.val] == Accessor.HD:
-                        res.append('BSR head')
-                        res.append('AJS -1')
-                        res.append('LDR RR')
-                    else:
-                        res.append('BSR tail')
-                        res.append('AJS -1')
-                        res.append('LDR RR')
+            code.append('LDL ' + var_offset)
 
-            return res
+        for field in expr.val.fields:
+            code.extend(generate_field(field, mappings))
 
     elif type(expr) is AST.TYPED_FUNCALL:
-        res = []
-
         for a in expr.args:
-            res.extend(generate_expr(a, module_name, mappings, ext_table))
+            generate_expr(a, module_name, mappings, ext_table, code)
 
         module = expr.module if expr.module is not None else module_name
 
         if expr.module == 'builtins':
             if expr.uniq == FunUniq.FUNC:
-                res.extend(BUILTIN_FUNCTIONS[expr.id.val][expr.oid][1])
+                code.extend(BUILTIN_FUNCTIONS[expr.id.val][expr.oid][1])
             elif expr.uniq == FunUniq.INFIX:
-                res.append(BUILTIN_INFIX_OPS[expr.id.val][3])
+                code.append(BUILTIN_INFIX_OPS[expr.id.val][3])
             else:
-                res.append(BUILTIN_PREFIX_OPS[expr.id.val][1])
+                code.append(BUILTIN_PREFIX_OPS[expr.id.val][1])
         else:
             if expr.uniq == FunUniq.FUNC:
                 if expr.module is not None:
@@ -125,30 +112,27 @@ def generate_expr(expr, module_name, mappings, ext_table):
                 else:
                     fid = str(mappings['operators'][module][(expr.uniq, expr.id.val)])
 
-            res.append('BSR ' + module + '_{}_'.format(expr.uniq.name.lower()) + fid + '_' + str(expr.oid))
+            code.append('BSR ' + module + '_{}_'.format(expr.uniq.name.lower()) + fid + '_' + str(expr.oid))
             if len(expr.args) > 0:
-                res.append('AJS -' + str(len(expr.args)))
+                code.append('AJS -' + str(len(expr.args)))
             # TODO: Check this for void functions
             if expr.returns:
-                res.append('LDR RR')
+                code.append('LDR RR')
 
-        return res
     elif type(expr) is AST.TUPLE:
-        res = []
-
-        res.extend(generate_expr(expr.a, module_name, mappings, ext_table))
-        res.extend(generate_expr(expr.b, module_name, mappings, ext_table))
-        res.append("STMH 2")
-
-        return res
+        generate_expr(expr.a, module_name, mappings, ext_table, code)
+        generate_expr(expr.b, module_name, mappings, ext_table, code)
+        code.append("STMH 2")
     else:
         print(expr)
         print(type(expr))
         raise Exception("Unknown expression type encountered")
 
+    return code
+
 def generate_ret(stmt, code, module_name, mappings, ext_table, label):
     if stmt.val.expr is not None:
-        code.extend(generate_expr(stmt.val.expr, module_name, mappings, ext_table))
+        generate_expr(stmt.val.expr, module_name, mappings, ext_table, code)
         code.append('STR RR')
     code.append('BRA ' + label + '_exit')
 
@@ -157,9 +141,9 @@ def generate_ret(stmt, code, module_name, mappings, ext_table, label):
 def generate_actstmt(stmt, code, module_name, mappings, ext_table, label):
     if type(stmt.val) == AST.TYPED_FUNCALL:
         stmt.val.returns = False
-        code.extend(generate_expr(stmt.val, module_name, mappings, ext_table))
+        generate_expr(stmt.val, module_name, mappings, ext_table, code)
     else:
-        code.extend(generate_expr(stmt.val.expr, module_name, mappings, ext_table))
+        generate_expr(stmt.val.expr, module_name, mappings, ext_table, code)
         if type(stmt.val.varref.val) is AST.RES_NONGLOBAL:
             if (stmt.val.varref.val.id.val in mappings['vars'] and mappings['vars'][stmt.val.varref.val.id.val][1] == MEMTYPE.BASICTYPE) or (stmt.val.varref.val.id.val in mappings['args'] and mappings['args'][stmt.val.varref.val.id.val][1] == MEMTYPE.BASICTYPE):
                 if stmt.val.varref.val.scope == NONGLOBALSCOPE.LocalVar:
@@ -176,20 +160,7 @@ def generate_actstmt(stmt, code, module_name, mappings, ext_table, label):
                     first = fields[0]
                     while len(fields) > 1:
                         field = fields.pop()
-                        if Accessor_lookup[field.val] == Accessor.FST or Accessor_lookup[field.val] == Accessor.SND:
-                            if Accessor_lookup[field.val] == Accessor.FST:
-                                code.append('LDH -1')
-                            else:
-                                code.append('LDH 00')
-                        else:
-                            if Accessor_lookup[field.val] == Accessor.HD:
-                                code.append('BSR head')
-                                code.append('AJS -1')
-                                code.append('LDR RR')
-                            else:
-                                code.append('BSR tail')
-                                code.append('AJS -1')
-                                code.append('LDR RR')
+                        code.extend(generate_field(field, mappings))
                     if Accessor_lookup[first.val] == Accessor.FST or Accessor_lookup[first.val] == Accessor.HD:
                         code.append('STA -1')
                     else:
@@ -201,8 +172,7 @@ def generate_actstmt(stmt, code, module_name, mappings, ext_table, label):
                         code.append('STL ' + mappings['args'][stmt.val.varref.val.id.val][0])
 
         else:
-            module = module_name if stmt.val.varref.val.module is None else stmt.val.varref.val.module
-            if module is None:
+            if stmt.val.varref.val.module is None:
                 module = module_name
                 var_name = stmt.val.varref.val.id.val
             else:
@@ -218,20 +188,7 @@ def generate_actstmt(stmt, code, module_name, mappings, ext_table, label):
                     code.extend(['LDC ' + key, 'LDA 00'])
                     while len(fields) > 1:
                         field = fields.pop()
-                        if field == Accessor.FST or field == Accessor.SND:
-                            if field == Accessor.FST:
-                                code.append('LDH -1')
-                            else:
-                                code.append('LDH 00')
-                        else:
-                            if field == Accessor_lookup[field.val] == Accessor.HD:
-                                code.append('BSR head')
-                                code.append('AJS -1')
-                                code.append('LDR RR')
-                            else:
-                                code.append('BSR tail')
-                                code.append('AJS -1')
-                                code.append('LDR RR')
+                        code.extend(generate_field(field, mappings))
                     if Accessor_lookup[fields[0].val] == Accessor.FST or Accessor_lookup[fields[0].val] == Accessor.HD:
                         code.append('STA -1')
                     else:
@@ -244,8 +201,9 @@ def generate_actstmt(stmt, code, module_name, mappings, ext_table, label):
 
     return code
 
-def generate_stmts(stmts, label, module_name, mappings, ext_table, index = 0, loop_label = None):
-    code = []
+def generate_stmts(stmts, label, module_name, mappings, ext_table, index = 0, loop_label = None, code = None):
+    if code is None:
+        code = []
 
     for stmt in stmts:
         if type(stmt.val) == AST.RETURN:
@@ -268,7 +226,7 @@ def generate_stmts(stmts, label, module_name, mappings, ext_table, index = 0, lo
 
                 # If or elif
                 if b.expr is not None:
-                    code.extend(generate_expr(b.expr, module_name, mappings, ext_table))
+                    generate_expr(b.expr, module_name, mappings, ext_table, code)
                     code.append("BRT " + label + "_" + str(index))
                 else: # Else
                     code.append("BRA " + label + "_" + str(index))
@@ -306,13 +264,11 @@ def generate_stmts(stmts, label, module_name, mappings, ext_table, index = 0, lo
 
             # Condition
             if stmt.val.cond is not None:
-                cond = generate_expr(stmt.val.cond, module_name, mappings, ext_table)
-                code.extend(cond)
+                generate_expr(stmt.val.cond, module_name, mappings, ext_table, code)
                 code.append("BRF " + label + "_" + str(start_index) + "_exit")
 
             # Statements
-            branch_stmt, index = generate_stmts(stmt.val.stmts, label, module_name, mappings, ext_table, index, loop_label)
-            code.extend(branch_stmt)
+            _, index = generate_stmts(stmt.val.stmts, label, module_name, mappings, ext_table, index, loop_label, code)
 
             # Update
             code.append(label + "_" + str(start_index) + "_update: nop")
@@ -342,50 +298,100 @@ def generate_func(func, ext_table, module_name, label, mappings):
         memtype = MEMTYPE.POINTER if type(vardecl.type.val) == AST.TUPLETYPE or type(vardecl.type.val) == AST.LISTTYPE else MEMTYPE.BASICTYPE
         mappings['vars'][vardecl.id.val] = (str(var_index), memtype)
         var_index += 1
-        code.extend(generate_expr(vardecl.expr, module_name, mappings, ext_table))
+        generate_expr(vardecl.expr, module_name, mappings, ext_table, code)
 
-    stmts_code, _ = generate_stmts(func['def'].stmts, label, module_name, mappings, ext_table)
-    code.extend(stmts_code)
+    generate_stmts(func['def'].stmts, label, module_name, mappings, ext_table, code=code)
 
     code.append(label + '_exit: UNLINK')
     code.append('RET')
 
     return code
 
-def build_object_file(dependencies, global_code, global_labels, function_code):
+# The object file is built as a list of lines, joined once at the end
+def build_object_file(dependencies, global_code, global_labels, function_code, stamp=None):
     # Depedencies
-    object_file = OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['depend'] + '\n'
+    lines = [OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['depend']]
+    if stamp is not None: # Hashes of the inputs, for incremental builds
+        lines.append(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['sourcehash'] + stamp['source'])
+        for name, digest in stamp['headers']:
+            lines.append(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['headerhash'] + name + ' ' + digest)
+        lines.append(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['codegen'] + stamp['codegen'])
     for d in dependencies:
-        object_file += OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['dependitem'] + d + '\n'
+        lines.append(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['dependitem'] + d)
 
     # Init section
-    object_file += OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['init'] + '\n'
-    object_file += '\n'.join(global_code)
-    object_file += '\n' if len(global_code) > 0 else ''
+    lines.append(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['init'])
+    lines.extend(global_code)
 
     # Entry point
-    object_file += OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['entrypoint'] + '\n'
-    object_file += 'BRA main\n'
+    lines.append(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['entrypoint'])
+    lines.append('BRA main')
 
     # Global section
-    object_file += OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['globals'] + '\n'
+    lines.append(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['globals'])
     for l in global_labels:
-        object_file += l + ': ' + 'NOP\n'
+        lines.append(l + ': ' + 'NOP')
 
     # Function Section
-    object_file += OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['funcs'] + '\n'
+    lines.append(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['funcs'])
     for l in function_code:
-        object_file += l + ': '
-        object_file += '\n'.join(function_code[l])
-        object_file += '\n'
+        code = function_code[l]
+        lines.append(l + ': ' + (code[0] if len(code) > 0 else ''))
+        lines.extend(code[1:])
 
     # Main
-    object_file += OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['main'] + '\n'
-    object_file += 'main: nop'
-    
-    return object_file
+    lines.append(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['main'])
+    lines.append('main: nop')
+
+    return '\n'.join(lines)
+
+# The binary object format, described in objectfile_imports
+def build_binary_object_file(dependencies, global_code, global_labels, function_code, stamp=None):
+    payload = bytearray()
+
+    def add(data):
+        entry = OrderedDict([('offset', len(payload)), ('length', len(data))])
+        payload.extend(data)
+        return entry
+
+    inits_text = '\n'.join(global_code)
+    inits = add(inits_text.encode('utf-8'))
+    inits['references'] = codeSymbols(inits_text)[1]
+    sections = OrderedDict([
+        ('global_inits', inits),
+        ('global_mem', add('\n'.join(l + ': NOP' for l in global_labels).encode('utf-8')))
+    ])
+
+    # The functions follow each other with a newline in between, so the section can be read in one go as well
+    symbols = []
+    start = len(payload)
+    for l in function_code:
+        if len(symbols) > 0:
+            payload.extend(b'\n')
+        code = function_code[l]
+        text = '\n'.join([l + ': ' + (code[0] if len(code) > 0 else '')] + code[1:])
+        entry = add(text.encode('utf-8'))
+        defines, references = codeSymbols(text)
+        symbols.append([l, entry['offset'], entry['length'], defines, references])
+    sections['functions'] = OrderedDict([('offset', start), ('length', len(payload) - start)])
+    sections['symbols'] = add(json.dumps(symbols, separators=(',', ':')).encode('utf-8'))
+
+    index = json.dumps(OrderedDict([
+        ('stamp', stamp),
+        ('dependencies', list(dependencies)),
+        ('sections', sections)
+    ]), separators=(',', ':')).encode('utf-8')
+
+    return BINARY_OBJECT_HEADER.pack(BINARY_OBJECT_MAGIC, BINARY_OBJECT_VERSION, len(index)) + index + bytes(payload)
+
+'''
+Returns the object file of a module: a string in the text format, or bytes in the binary format.
+'''
+def generate_object_file(symbol_table, ext_table, headerfiles, module_name, dependencies, stamp=None, opt_level=DEFAULT_OPT_LEVEL, inline_accessors=True, fold_globals=False, object_format=DEFAULT_OBJECT_FORMAT):
+    # From level 1 on, constant expressions are computed here rather than by the program
+    if opt_level >= 1:
+        foldConstants(symbol_table, fold_globals)
 
-def generate_object_file(symbol_table, ext_table, headerfiles, module_name, dependencies):
     global_code = []
     global_labels = []
     function_code = {}
@@ -393,7 +399,8 @@ def generate_object_file(symbol_table, ext_table, headerfiles, module_name, depe
         'globals': {module_name: {}},
         'operators': {module_name: {}},
         'args': {},
-        'vars': {}
+        'vars': {},
+        'inline_accessors': inline_accessors
     }
 
     # Add local operator mapping
@@ -417,7 +424,7 @@ def generate_object_file(symbol_table, ext_table, headerfiles, module_name, depe
         key = module_name + '_global_' + g
         global_labels.append(key)
         mappings['globals'][module_name][g] = MEMTYPE.POINTER if type(symbol_table.global_vars[g].type.val) in [AST.TUPLETYPE, AST.LISTTYPE] else MEMTYPE.BASICTYPE
-        global_code.extend(generate_expr(symbol_table.global_vars[g].expr, module_name, mappings, ext_table))
+        generate_expr(symbol_table.global_vars[g].expr, module_name, mappings, ext_table, global_code)
         global_code.extend(['LDC ' + key, 'STA 00'])
 
     # Load external global types
@@ -441,6 +448,12 @@ def generate_object_file(symbol_table, ext_table, headerfiles, module_name, depe
             function_code[key] = generate_func(of, ext_table, module_name, key, mappings)
             o += 1
 
-    gen_code = build_object_file(dependencies, global_code, global_labels, function_code)
+    global_code = optimize(global_code, opt_level)
+    function_code = {k: optimize(code, opt_level) for (k, code) in function_code.items()}
+
+    if object_format == 'binary':
+        gen_code = build_binary_object_file(dependencies, global_code, global_labels, function_code, stamp=stamp)
+    else:
+        gen_code = build_object_file(dependencies, global_code, global_labels, function_code, stamp=stamp)
 
     return gen_code
\ No newline at end of file
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+'''
+Constant folding on the typed AST, before code generation.
+Calls of builtin operators on literals are evaluated the way the SSM would evaluate the instructions in
+BUILTIN_INFIX_OPS and BUILTIN_PREFIX_OPS (32 bit, True is -1 and False is 0) and replaced by a literal.
+Division and modulo by zero, and Char arithmetic that leaves the range of characters, are left for the program to do.
+
+Globals whose initialisation folds to an Int, Char or Bool literal are constants within the init section, since nothing
+runs before it that could assign them. Their uses in functions are only replaced with fold_globals, which assumes that
+no other module assigns them either: an importing module can, and this module cannot know about that.
+'''
+
+from lib.datastructure.AST import AST, FunUniq
+from lib.datastructure.token import Token, TOKEN
+from lib.builtins.operators import BUILTIN_INFIX_OPS, BUILTIN_PREFIX_OPS
+from lib.codegen.peephole import FOLDABLE_OPS, wrap
+from lib.util.visitor import Visitor
+
+BUILTINS_MODULE = 'builtins'
+
+SCALAR_LITERALS = [TOKEN.INT, TOKEN.CHAR, TOKEN.BOOL]
+
+MAX_CHAR = 0x10FFFF
+
+COMPARISONS = {
+    'EQ': lambda a, b: a == b,
+    'NE': lambda a, b: a != b,
+    'LT': lambda a, b: a < b,
+    'GT': lambda a, b: a > b,
+    'LE': lambda a, b: a <= b,
+    'GE': lambda a, b: a >= b
+}
+
+BOOL_OPS = {
+    'AND': lambda a, b: a & b,
+    'OR': lambda a, b: a | b
+}
+
+# The word the SSM works with for a literal
+def literalWord(token):
+    if token.typ is TOKEN.INT:
+        return token.val
+    elif token.typ is TOKEN.CHAR:
+        return ord(token.val)
+    else:
+        return -1 if token.val else 0
+
+def isScalar(expr):
+    return type(expr) is Token and expr.typ in SCALAR_LITERALS
+
+def makeLiteral(typ, word, pos):
+    if typ is TOKEN.INT:
+        return Token(pos, TOKEN.INT, wrap(word))
+    elif typ is TOKEN.CHAR:
+        return Token(pos, TOKEN.CHAR, chr(word)) if 0 <= word <= MAX_CHAR else None
+    else:
+        return Token(pos, TOKEN.BOOL, word != 0)
+
+def foldInfix(call, a, b):
+    op = BUILTIN_INFIX_OPS[call.id.val][3]
+    x, y = literalWord(a), literalWord(b)
+    if op in FOLDABLE_OPS:
+        if y == 0 and op in ['DIV', 'MOD']:
+            return None
+        return makeLiteral(a.typ, FOLDABLE_OPS[op](x, y), call.id.pos)
+    elif op in COMPARISONS:
+        return makeLiteral(TOKEN.BOOL, COMPARISONS[op](x, y), call.id.pos)
+    elif op in BOOL_OPS:
+        return makeLiteral(TOKEN.BOOL, BOOL_OPS[op](x, y), call.id.pos)
+    return None
+
+def foldPrefix(call, a):
+    op = BUILTIN_PREFIX_OPS[call.id.val][1]
+    if op == 'NOT':
+        return makeLiteral(TOKEN.BOOL, ~literalWord(a), call.id.pos)
+    elif op == 'NEG':
+        return makeLiteral(TOKEN.INT, -literalWord(a), call.id.pos)
+    return None
+
+def foldCall(call):
+    if call.uniq == FunUniq.INFIX and all(isScalar(a) for a in call.args):
+        return foldInfix(call, call.args[0], call.args[1])
+    elif call.uniq == FunUniq.PREFIX and isScalar(call.args[0]):
+        return foldPrefix(call, call.args[0])
+    return None
+
+'''
+Fold an expression bottom-up, returning the expression to replace it with.
+constants maps the names of the globals of this module that may be replaced to their literal.
+'''
+def foldExpr(expr, constants):
+    typ = type(expr)
+    if typ is AST.PARSEDEXPR:
+        return foldExpr(expr.val, constants)
+    elif typ is AST.TUPLE:
+        expr.a = foldExpr(expr.a, constants)
+        expr.b = foldExpr(expr.b, constants)
+    elif typ is AST.RES_VARREF:
+        ref = expr.val
+        if type(ref) is AST.RES_GLOBAL and ref.module is None and len(ref.fields) == 0 and ref.id.val in constants:
+            return constants[ref.id.val]
+    elif typ is AST.TYPED_FUNCALL:
+        expr.args = [foldExpr(a, constants) for a in expr.args]
+        if expr.module == BUILTINS_MODULE:
+            folded = foldCall(expr)
+            if folded is not None:
+                return folded
+    return expr
+
+# Globals of this module that some function in it assigns to
+def assignedGlobals(symbol_table):
+    res = set()
+    def assignment(node):
+        ref = node.varref.val
+        if type(ref) is AST.RES_GLOBAL and ref.module is None:
+            res.add(ref.id.val)
+    finder = Visitor({AST.ASSIGNMENT: assignment}, enter_handled=False)
+    for f in symbol_table.functions.values():
+        for o in f:
+            finder.walk(o['def'].stmts)
+    return res
+
+def foldStatements(func, constants):
+    def actstmt(node):
+        if type(node.val) is AST.ASSIGNMENT:
+            node.val.expr = foldExpr(node.val.expr, constants)
+        elif type(node.val) is AST.TYPED_FUNCALL: # A call as a statement stays a call, only its arguments are folded
+            node.val.args = [foldExpr(a, constants) for a in node.val.args]
+    def condbranch(node):
+        if node.expr is not None:
+            node.expr = foldExpr(node.expr, constants)
+    def loop(node):
+        if node.cond is not None:
+            node.cond = foldExpr(node.cond, constants)
+    def ret(node):
+        if node.expr is not None:
+            node.expr = foldExpr(node.expr, constants)
+
+    for vardecl in func['def'].vardecls:
+        vardecl.expr = foldExpr(vardecl.expr, constants)
+    Visitor({
+        AST.ACTSTMT: actstmt,
+        AST.CONDBRANCH: condbranch,
+        AST.LOOP: loop,
+        AST.RETURN: ret
+    }).walk(func['def'].stmts)
+
+def foldConstants(symbol_table, fold_globals=False):
+    # Globals are initialised in order, so an initialisation can only use the constants before it
+    constants = {}
+    for g, decl in symbol_table.global_vars.items():
+        decl.expr = foldExpr(decl.expr, constants)
+        if isScalar(decl.expr):
+            constants[g] = decl.expr
+
+    if fold_globals:
+        assigned = assignedGlobals(symbol_table)
+        constants = {g: val for (g, val) in constants.items() if g not in assigned}
+    else:
+        constants = {}
+
+    for f in symbol_table.functions.values():
+        for o in f:
+            foldStatements(o, constants)
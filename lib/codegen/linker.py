@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+'''
+Symbol resolution and dead code elimination for the linker.
+The code of the linked modules is cut into blocks that are kept or dropped as a whole: the functions, and the
+initialisation of every global together with its slot in the global section. Starting from the entry point, every
+block that a kept block refers to (with a BSR, a branch or an LDC of one of its labels) is kept as well, the rest is
+left out of the executable.
+
+A function in a text object file starts at a labelled LINK, which codegen only emits as the first instruction of a
+function. Binary object files list the functions with their labels, so those are not parsed.
+The initialisation of a global is the code up to the LDC of its label and the STA that stores it. It is only dropped
+if nothing refers to the global and the code can do nothing but compute the value: no calls, no branches (the inlined
+.hd and .tl checks crash the program on an empty list), no traps.
+'''
+
+from lib.imports.objectfile_imports import BinaryObjectSections, codeSymbols
+from lib.codegen.peephole import parseLine, opcode, intArg
+from lib.analysis.error_handler import *
+
+from collections import OrderedDict
+from functools import partial
+
+import re
+
+FUNCTION_START = re.compile(r"\n[^\s:/]+: LINK\b")
+
+# Instructions that make the initialisation of a global do more than compute its value
+EFFECT_OPS = ['BRA', 'BRT', 'BRF', 'BSR', 'JSR', 'TRAP', 'HALT']
+
+class Block():
+    __slots__ = ('defines', 'references', 'root', 'live')
+
+    def __init__(self, defines, references, root=False):
+        self.defines = defines
+        self.references = references
+        self.root = root
+        self.live = root
+
+'''
+A piece of a section of the executable: the block it belongs to, and its text. So that a function that is dropped is
+never copied, its text can also be a function that cuts it out of the object file.
+'''
+def pieceText(piece):
+    text = piece[1]
+    return text() if callable(text) else text
+
+def codeBlock(text, root=False):
+    defines, references = codeSymbols(text)
+    return Block(defines, references, root)
+
+def functionPieces(sections):
+    if isinstance(sections, BinaryObjectSections):
+        return [(Block(row[3], row[4]), partial(sections.text, row[1], row[2])) for row in sections.symbols]
+    text = sections['functions']
+    if len(text) == 0:
+        return []
+    # The functions are found by the newline before them, the first one is at the start of the section
+    starts = [match.start() for match in FUNCTION_START.finditer(text)]
+    ends = starts + [len(text)]
+    res = [(codeBlock(text[:ends[0]]), partial(sliceText, text, 0, ends[0]))]
+    res.extend((Block(*codeSymbols(text, start, end)), partial(sliceText, text, start + 1, end)) for (start, end) in zip(starts, ends[1:]))
+    return res
+
+def sliceText(text, start, end):
+    return text[start:end]
+
+'''
+The pieces of the init and global sections of a module. Every global gets one block, for both its initialisation
+and its slot.
+'''
+def globalPieces(sections):
+    slots = OrderedDict()
+    for line in sections['global_mem'].split('\n'):
+        if len(line) > 0:
+            slots[parseLine(line)[0]] = line
+
+    inits = []
+    blocks = {}
+    lines = []
+    instrs = []
+    shared = None
+    for line in sections['global_inits'].split('\n') if len(sections['global_inits']) > 0 else []:
+        lines.append(line)
+        instrs.append(parseLine(line))
+        if len(instrs) >= 2 and opcode(instrs[-1]) == 'STA' and intArg(instrs[-1]) == 0 and opcode(instrs[-2]) == 'LDC' and instrs[-2][2] in slots:
+            label = instrs[-2][2]
+            defines, references = codeSymbols('\n'.join(lines))
+            references = [l for l in references if l != label]
+            # After LDS 00; LDC g; STA 00 (see the peephole optimizer) the next initialisation uses the copy of g left
+            # on the stack, so it needs the initialisation of g, and cannot be dropped itself
+            if shared is not None:
+                references.append(shared)
+            pure = shared is None and all(opcode(instr) not in EFFECT_OPS for instr in instrs)
+            blocks[label] = Block(defines + [label], references, root=not pure)
+            inits.append((blocks[label], '\n'.join(lines)))
+            shared = label if len(instrs) >= 3 and opcode(instrs[-3]) == 'LDS' else None
+            lines = []
+            instrs = []
+    if len(lines) > 0: # Code after the last store is always kept
+        inits.append((codeBlock('\n'.join(lines), root=True), '\n'.join(lines)))
+
+    mem = [(blocks[label] if label in blocks else Block([label], []), line) for (label, line) in slots.items()]
+    return inits, mem
+
+# The pieces of the linked sections of a module
+def modulePieces(sections):
+    inits, mem = globalPieces(sections)
+    return OrderedDict([
+        ('global_inits', inits),
+        ('global_mem', mem),
+        ('functions', functionPieces(sections))
+    ])
+
+# The blocks of a module, each once
+def pieceBlocks(pieces):
+    return list(OrderedDict.fromkeys(block for section in pieces.values() for (block, _) in section))
+
+'''
+The label table of everything that is linked: a map of every label to the block that defines it, given the blocks of
+every module by module name (with the entry point and the builtins as modules too).
+A label defined more than once, or used but not defined by any module, is an error, reported with the modules involved.
+'''
+def resolveSymbols(modules):
+    defined = {}
+    origin = {}
+    for module, blocks in modules:
+        for block in blocks:
+            for label in block.defines:
+                if label in defined:
+                    ERROR_HANDLER.addError(ERR.LinkerDuplicateLabel, [label, origin[label], module])
+                else:
+                    defined[label] = block
+                    origin[label] = module
+    for module, blocks in modules:
+        undefined = set(label for block in blocks for label in block.references if label not in defined)
+        for label in sorted(undefined):
+            ERROR_HANDLER.addError(ERR.LinkerUndefinedLabel, [label, module])
+    ERROR_HANDLER.checkpoint()
+    return defined
+
+'''
+Mark every block that can be reached from the roots as live, given the label table from resolveSymbols.
+'''
+def markLive(blocks, defined):
+    openlist = [block for block in blocks if block.root]
+    while openlist:
+        block = openlist.pop()
+        for label in block.references:
+            target = defined[label]
+            if not target.live:
+                target.live = True
+                openlist.append(target)
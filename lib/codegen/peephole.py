@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+'''
+Peephole optimizer for the SSM code of one function body (or the global initialisation code), before it goes into an
+object file. Every line is split into its label, opcode and argument, and rewritten until nothing changes anymore.
+
+Level 1 rewrites instructions next to each other:
+    labelled nops: the label moves to the next instruction, or becomes an alias of the label already on it
+    constant folding: LDC a; LDC b; ADD becomes LDC a+b, likewise for SUB, MUL, DIV, MOD and NEG
+    NOT; BRF L becomes BRT L, and NOT; BRT L becomes BRF L
+    branches on a constant: LDC c; BRT L becomes BRA L if c is not 0 and is dropped if it is, likewise for BRF
+    storing a global and loading it right after: LDC g; STA 00; LDC g; LDA 00 becomes LDS 00; LDC g; STA 00
+    jumps to the next instruction are dropped
+Level 2 also rewrites the control flow:
+    jump threading: a branch to a BRA goes to where that BRA goes
+    BRT L1; BRA L2; L1: becomes BRF L2; L1: (and the other way around)
+    code after a BRA, RET or HALT is dropped up to the next label that is jumped to
+    a BRA to UNLINK; RET is replaced by UNLINK; RET
+    labels nothing jumps to are dropped
+
+Labels defined in the code given are assumed to be used only in that code, which holds for everything codegen emits.
+Labels it does not define (other functions, builtins) are left alone. Branches only ever test booleans (0 or -1) in
+generated code, and none of the rewrites makes them test anything else, so BRT and BRF can be swapped for each other.
+'''
+
+OPT_LEVELS = [0, 1, 2]
+DEFAULT_OPT_LEVEL = 0
+
+BRANCH_OPS = ['BRA', 'BRT', 'BRF']
+END_OPS = ['BRA', 'RET', 'HALT']
+INVERSE_BRANCH = {'BRT': 'BRF', 'BRF': 'BRT'}
+
+WORD_BITS = 32
+
+def parseLine(line):
+    label = None
+    if ': ' in line:
+        label, line = line.split(': ', 1)
+    parts = line.split(' ', 1)
+    return [label, parts[0], parts[1] if len(parts) > 1 else None]
+
+def renderLine(instr):
+    label, op, arg = instr
+    text = op if arg is None else op + ' ' + arg
+    return text if label is None else label + ': ' + text
+
+def opcode(instr):
+    return instr[1].upper()
+
+def intArg(instr):
+    # The argument of an LDC of a number, or None if it loads an address
+    try:
+        return int(instr[2])
+    except (TypeError, ValueError):
+        return None
+
+def intText(val):
+    return '00' if val == 0 else str(val)
+
+def wrap(val):
+    val &= (1 << WORD_BITS) - 1
+    return val - (1 << WORD_BITS) if val >= 1 << (WORD_BITS - 1) else val
+
+# Integer division the way the SSM does it: rounding towards zero
+def truncDiv(a, b):
+    return abs(a) // abs(b) * (1 if (a < 0) == (b < 0) else -1)
+
+FOLDABLE_OPS = {
+    'ADD': lambda a, b: a + b,
+    'SUB': lambda a, b: a - b,
+    'MUL': lambda a, b: a * b,
+    'DIV': lambda a, b: truncDiv(a, b),
+    'MOD': lambda a, b: a - b * truncDiv(a, b)
+}
+
+class Peephole():
+    def __init__(self, code, level):
+        self.code = [parseLine(line) for line in code]
+        self.level = level
+
+    def run(self):
+        if self.level <= 0:
+            return [renderLine(instr) for instr in self.code]
+        changed = True
+        while changed:
+            changed = False
+            for rewrite in self.rewrites():
+                changed = rewrite() or changed
+        return [renderLine(instr) for instr in self.code]
+
+    def rewrites(self):
+        res = [self.dropNops, self.foldConstants, self.fuseNot, self.foldBranches, self.reuseStored, self.dropJumpsToNext]
+        if self.level >= 2:
+            res += [self.threadJumps, self.invertBranches, self.dropUnreachable, self.inlineReturns]
+        return res
+
+    def unlabelled(self, ix):
+        return ix < len(self.code) and self.code[ix][0] is None
+
+    def alias(self, old, new):
+        for instr in self.code:
+            if instr[2] == old and (opcode(instr) in BRANCH_OPS or opcode(instr) in ['BSR', 'LDC']):
+                instr[2] = new
+
+    def remove(self, ix):
+        # Drop an instruction, keeping its label on the next one
+        label = self.code[ix][0]
+        if label is not None:
+            if ix + 1 >= len(self.code):
+                self.code[ix] = [label, 'nop', None]
+                return False
+            if self.code[ix + 1][0] is None:
+                self.code[ix + 1][0] = label
+            else:
+                self.alias(label, self.code[ix + 1][0])
+        del self.code[ix]
+        return True
+
+    def targets(self):
+        return set(instr[2] for instr in self.code if opcode(instr) in BRANCH_OPS or opcode(instr) in ['BSR', 'LDC'])
+
+    def labelIndex(self):
+        return {instr[0]: ix for ix, instr in enumerate(self.code) if instr[0] is not None}
+
+    def dropNops(self):
+        changed = False
+        ix = 0
+        while ix < len(self.code):
+            if opcode(self.code[ix]) == 'NOP' and self.remove(ix):
+                changed = True
+            else:
+                ix += 1
+        return changed
+
+    def foldConstants(self):
+        changed = False
+        ix = 0
+        while ix < len(self.code):
+            first = self.code[ix]
+            if opcode(first) == 'LDC' and intArg(first) is not None:
+                if self.unlabelled(ix + 1) and opcode(self.code[ix + 1]) == 'NEG':
+                    first[2] = intText(wrap(-intArg(first)))
+                    del self.code[ix + 1]
+                    changed = True
+                    continue
+                if self.unlabelled(ix + 1) and self.unlabelled(ix + 2) and opcode(self.code[ix + 1]) == 'LDC' \
+                        and intArg(self.code[ix + 1]) is not None and opcode(self.code[ix + 2]) in FOLDABLE_OPS:
+                    a, b, op = intArg(first), intArg(self.code[ix + 1]), opcode(self.code[ix + 2])
+                    if b != 0 or op not in ['DIV', 'MOD']:
+                        first[2] = intText(wrap(FOLDABLE_OPS[op](a, b)))
+                        del self.code[ix + 1:ix + 3]
+                        changed = True
+                        continue
+            ix += 1
+        return changed
+
+    def fuseNot(self):
+        changed = False
+        ix = 0
+        while ix + 1 < len(self.code):
+            if opcode(self.code[ix]) == 'NOT' and self.unlabelled(ix + 1) and opcode(self.code[ix + 1]) in INVERSE_BRANCH:
+                self.code[ix][1:] = [INVERSE_BRANCH[opcode(self.code[ix + 1])], self.code[ix + 1][2]]
+                del self.code[ix + 1]
+                changed = True
+            ix += 1
+        return changed
+
+    def foldBranches(self):
+        changed = False
+        ix = 0
+        while ix + 1 < len(self.code):
+            first = self.code[ix]
+            if opcode(first) == 'LDC' and intArg(first) is not None and self.unlabelled(ix + 1) and opcode(self.code[ix + 1]) in INVERSE_BRANCH:
+                taken = (intArg(first) != 0) == (opcode(self.code[ix + 1]) == 'BRT')
+                if taken:
+                    first[1:] = ['BRA', self.code[ix + 1][2]]
+                    del self.code[ix + 1]
+                    changed = True
+                else:
+                    del self.code[ix + 1]
+                    self.remove(ix)
+                    changed = True
+                    continue
+            ix += 1
+        return changed
+
+    def reuseStored(self):
+        changed = False
+        for ix in range(len(self.code) - 3):
+            window = self.code[ix:ix + 4]
+            if [opcode(instr) for instr in window] == ['LDC', 'STA', 'LDC', 'LDA'] and all(instr[0] is None for instr in window[1:]) \
+                    and window[0][2] == window[2][2] and intArg(window[1]) == 0 and intArg(window[3]) == 0:
+                self.code[ix:ix + 4] = [[window[0][0], 'LDS', '00'], [None, 'LDC', window[0][2]], [None, 'STA', '00']]
+                changed = True
+        return changed
+
+    def dropJumpsToNext(self):
+        changed = False
+        ix = 0
+        while ix + 1 < len(self.code):
+            if opcode(self.code[ix]) == 'BRA' and self.code[ix][2] == self.code[ix + 1][0] and self.remove(ix):
+                changed = True
+            else:
+                ix += 1
+        return changed
+
+    def threadJumps(self):
+        changed = False
+        labels = self.labelIndex()
+        for instr in self.code:
+            if opcode(instr) in BRANCH_OPS:
+                seen = set()
+                target = instr[2]
+                while target in labels and target not in seen and opcode(self.code[labels[target]]) == 'BRA':
+                    seen.add(target)
+                    target = self.code[labels[target]][2]
+                if target != instr[2] and target not in seen:
+                    instr[2] = target
+                    changed = True
+        return changed
+
+    def invertBranches(self):
+        changed = False
+        ix = 0
+        while ix + 2 < len(self.code):
+            cond, jump, after = self.code[ix:ix + 3]
+            if opcode(cond) in INVERSE_BRANCH and opcode(jump) == 'BRA' and jump[0] is None and cond[2] == after[0]:
+                self.code[ix][1:] = [INVERSE_BRANCH[opcode(cond)], jump[2]]
+                del self.code[ix + 1]
+                changed = True
+            ix += 1
+        return changed
+
+    def dropUnreachable(self):
+        changed = False
+        targets = self.targets()
+        ix = 0
+        while ix < len(self.code):
+            if opcode(self.code[ix]) in END_OPS:
+                end = ix + 1
+                while end < len(self.code) and self.code[end][0] not in targets:
+                    end += 1
+                if end > ix + 1:
+                    del self.code[ix + 1:end]
+                    changed = True
+            ix += 1
+        for instr in self.code:
+            if instr[0] is not None and instr[0] not in targets:
+                instr[0] = None
+                changed = True
+        return changed
+
+    def inlineReturns(self):
+        changed = False
+        labels = self.labelIndex()
+        ix = 0
+        while ix < len(self.code):
+            instr = self.code[ix]
+            target = labels.get(instr[2]) if opcode(instr) == 'BRA' else None
+            if target is not None and target + 1 < len(self.code) and opcode(self.code[target]) == 'UNLINK' \
+                    and self.unlabelled(target + 1) and opcode(self.code[target + 1]) == 'RET':
+                self.code[ix:ix + 1] = [[instr[0], 'UNLINK', None], [None, 'RET', None]]
+                labels = self.labelIndex()
+                changed = True
+            ix += 1
+        return changed
+
+def optimize(code, level=DEFAULT_OPT_LEVEL):
+    return Peephole(code, level).run()
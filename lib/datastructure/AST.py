@@ -12,7 +12,7 @@ def syntaxnode(typename, *field_names, module=None):
     typename = _sys.intern(str(typename))
     field_names = list(field_names)
 
-    class_attrs = list(map(_sys.intern, ['_start_pos']))
+    class_attrs = list(map(_sys.intern, ['_start_pos', '_interned']))
 
     for name in [typename] + field_names:
         if type(name) is not str:
@@ -43,19 +43,21 @@ def syntaxnode(typename, *field_names, module=None):
         self = super().__new__(cls)
         return self
 
-
-    def __init__(self, **kwargs):
-        if not set(kwargs) == set(field_names):
-            raise KeyError("Keyword arguments do not match: {} != {}".format(list(set(kwargs)), list(set(field_names))))
-        for key, val in kwargs.items():
-            setattr(self, key, val)
-        for key in class_attrs:
-            setattr(self, key, None)
-
-
-    def __iter__(self):
-        field_values = list(map(lambda x: getattr(self, x), field_names))
-        return iter(field_values)
+    # Nodes are made all the time, so the constructor and iterators are generated for the fields, like namedtuple does.
+    # Fields can be given by position or by keyword, and missing or unknown ones are a TypeError.
+    generated_src = (
+        'def __init__(self{params}):\n{assign}\n'
+        'def __iter__(self):\n    return iter(({values}))\n'
+        'def items(self):\n    return iter(({pairs}))\n').format(
+        params="".join(", " + name for name in field_names),
+        assign="".join(["    self.{0} = {0}\n".format(name) for name in field_names] + ["    self.{} = None\n".format(name) for name in class_attrs]),
+        values="".join("self.{}, ".format(name) for name in field_names),
+        pairs="".join("('{0}', self.{0}), ".format(name) for name in field_names))
+    generated = {}
+    exec(generated_src, generated)
+    __init__ = generated['__init__']
+    __iter__ = generated['__iter__']
+    items = generated['items']
 
 
     def __repr__(self):
@@ -110,10 +112,6 @@ def syntaxnode(typename, *field_names, module=None):
         '''return "{} {}:\n{}".format(self.__class__.__name__, "@" + repr(self._start_pos), indented)'''
         return "{}:\n{}".format(self.__class__.__name__, indented)
 
-    def items(self):
-        key_values = list(map(lambda x: (x, getattr(self, x)), field_names))
-        return iter(key_values)
-
     # Modify function metadata to help with introspection and debugging
 
     for method in (__new__, __init__, __iter__, __repr__, __serial__, __setitem__, tree_string , items):
@@ -125,6 +123,7 @@ def syntaxnode(typename, *field_names, module=None):
         '__doc__': '{}({})'.format(typename, arg_list),
         '__slots__': tuple((*(i for i in field_names),*(i for i in class_attrs))),
         '_fields': field_names,
+        '_plain_init': __init__,
         '__init__':__init__,
         '__iter__':__iter__,
         '__repr__': __repr__,
@@ -266,8 +265,8 @@ class AST:
     # oid = Overloaded id, module = module name, returns = True if the function returns a value.
     TYPED_FUNCALL = syntaxnode("TYPED_FUNCALL", "id", "uniq", "args", "oid", "module", "returns")
 
-    # Create node list to support __contains__ and __iter__: TODO make this not hacky
-    nodes = [
+    # All node classes, to test whether something is a node
+    nodes = frozenset([
         SPL,
         IMPORT,
         IMPORTNAME,
@@ -299,7 +298,70 @@ class AST:
         RES_GLOBAL,
         RES_NONGLOBAL,
         TYPED_FUNCALL
-    ]
+    ])
+
+    # The node classes that can occur in each field, during any phase of the compiler. Fields that only hold tokens,
+    # enums or strings are left out. Lets a traversal skip subtrees that cannot contain what it looks for.
+    TYPE_NODES = (TYPE, BASICTYPE, TUPLETYPE, LISTTYPE, FUNTYPE, MOD_TYPE)
+    EXPR_NODES = (DEFERREDEXPR, PARSEDEXPR, FUNCALL, TYPED_FUNCALL, TUPLE, VARREF, RES_VARREF, RES_GLOBAL, RES_NONGLOBAL)
+    field_types = {
+        SPL: {"imports": (IMPORT,), "decls": (DECL,)},
+        IMPORT: {"importlist": (IMPORTNAME,)},
+        IMPORTNAME: {},
+        DECL: {"val": (VARDECL, FUNDECL, TYPESYN)},
+        VARDECL: {"type": TYPE_NODES, "expr": EXPR_NODES},
+        FUNDECL: {"type": TYPE_NODES, "vardecls": (VARDECL,), "stmts": (STMT,)},
+        TYPESYN: {"def_type": TYPE_NODES},
+        TYPE: {"val": TYPE_NODES},
+        BASICTYPE: {},
+        TUPLETYPE: {"a": TYPE_NODES, "b": TYPE_NODES},
+        LISTTYPE: {"type": TYPE_NODES},
+        FUNTYPE: {"from_types": TYPE_NODES, "to_type": TYPE_NODES},
+        MOD_TYPE: {},
+        STMT: {"val": (IFELSE, LOOP, ACTSTMT, RETURN, BREAK, CONTINUE)},
+        IFELSE: {"condbranches": (CONDBRANCH,)},
+        CONDBRANCH: {"expr": EXPR_NODES, "stmts": (STMT,)},
+        LOOP: {"init": (ACTSTMT,), "cond": EXPR_NODES, "update": (ACTSTMT,), "stmts": (STMT,)},
+        ACTSTMT: {"val": (ASSIGNMENT,) + EXPR_NODES},
+        RETURN: {"expr": EXPR_NODES},
+        BREAK: {},
+        CONTINUE: {},
+        ASSIGNMENT: {"varref": (VARREF, RES_VARREF), "expr": EXPR_NODES},
+        FUNCALL: {"args": EXPR_NODES},
+        DEFERREDEXPR: {"contents": EXPR_NODES},
+        TUPLE: {"a": EXPR_NODES, "b": EXPR_NODES},
+        PARSEDEXPR: {"val": EXPR_NODES},
+        VARREF: {},
+        RES_VARREF: {"val": (RES_GLOBAL, RES_NONGLOBAL)},
+        RES_GLOBAL: {},
+        RES_NONGLOBAL: {},
+        TYPED_FUNCALL: {"args": EXPR_NODES}
+    }
+
+    '''
+    Debug mode: check every node when it is made, against field_types. A field listed there may hold a node of one of
+    its classes, a token, None, or a list of those, and the other fields may not hold nodes at all.
+    Off by default, since it makes building nodes several times slower.
+    '''
+    def validateNode(node):
+        fields = AST.field_types[type(node)]
+        for name, val in node.items():
+            allowed = fields.get(name, ())
+            for el in (val if type(val) is list else [val]):
+                if type(el) in AST.nodes and type(el) not in allowed:
+                    raise TypeError("{} is not allowed in {}.{}".format(type(el).__name__, type(node).__name__, name))
+                if name in fields and not (type(el) in AST.nodes or type(el) is Token or el is None):
+                    raise TypeError("{} is not allowed in {}.{}".format(type(el).__name__, type(node).__name__, name))
+
+    def setValidation(enabled):
+        for cls in AST.nodes:
+            cls.__init__ = AST.checkedInit(cls._plain_init) if enabled else cls._plain_init
+
+    def checkedInit(plain_init):
+        def __init__(self, *args, **kwargs):
+            plain_init(self, *args, **kwargs)
+            AST.validateNode(self)
+        return __init__
 
     def equalVals(node1, node2): # Same structure and values (not necessarily same tokens)
         if type(node1) == type(node2):
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+from lib.datastructure.AST import AST
+from lib.datastructure.token import Token, TOKEN
+from lib.datastructure.position import NO_POSITION
+
+'''
+Hash-consed types: every distinct type tree is mapped to one InternedType object, such that two trees get the same object
+exactly when AST.equalVals holds for them. Comparing types then is an identity check and hashing them is O(1).
+
+Type nodes remember their InternedType once they are frozen. Only freeze types that will not be rewritten anymore,
+i.e. after normalizeAllTypes: a rewritten node would keep its old InternedType.
+'''
+
+class InternedType():
+    __slots__ = ('kind', 'args')
+
+    def __init__(self, kind, args):
+        self.kind = kind
+        self.args = args
+
+    def __repr__(self):
+        name = self.kind if type(self.kind) is str else self.kind.__name__
+        return "{}({})".format(name, ", ".join(map(repr, self.args)))
+
+# Keys are the node class and the InternedTypes or values of its children, so building one is O(number of children)
+_INTERNED_TYPES = {}
+
+def internType(node, freeze=False):
+    t = type(node)
+    if t in AST.nodes:
+        interned = node._interned
+        if interned is not None:
+            return interned
+        key = (t,) + tuple(internType(x, freeze) for x in node)
+    elif t is Token:
+        key = (t, node.val)
+    elif t is list:
+        key = (t,) + tuple(internType(x, freeze) for x in node)
+    else:
+        key = (t, node)
+
+    interned = _INTERNED_TYPES.get(key)
+    if interned is None:
+        interned = _INTERNED_TYPES[key] = InternedType(t if t is not Token else node.val, key[1:])
+    if freeze and t in AST.nodes:
+        node._interned = interned
+    return interned
+
+def freezeType(node):
+    internType(node, freeze=True)
+    return node
+
+def sameType(node1, node2):
+    return internType(node1) is internType(node2)
+
+
+# Shared, so this node must never be modified
+VOID_TYPE_NODE = freezeType(AST.TYPE(val=Token(NO_POSITION, TOKEN.TYPE_IDENTIFIER, "Void")))
@@ -1,4 +1,10 @@
+'''
+Positions are never modified after they are made, so tokens and nodes starting at the same place can share one,
+and synthetic tokens that do not come from the source all share NO_POSITION.
+'''
 class Position():
+    __slots__ = ('line', 'col')
+
     def __init__(self, line = 1, col = 1):
         self.line = line
         self.col  = col
@@ -7,4 +13,6 @@ class Position():
         return "line {} :col {}".format(self.line, self.col)
 
     def copy(self):
-        return Position(self.line, self.col)
\ No newline at end of file
+        return self
+
+NO_POSITION = Position()
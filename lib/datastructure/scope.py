@@ -4,4 +4,23 @@ from enum import IntEnum
 
 class NONGLOBALSCOPE(IntEnum):
     ArgVar      = 1
-    LocalVar    = 2
\ No newline at end of file
+    LocalVar    = 2
+
+
+class DeclaredBefore():
+    '''The names declared before a given one, given the position of every name in declaration order.
+    Membership is O(1), and no set has to be built per declaration.'''
+    __slots__ = ('order', 'limit')
+
+    def __init__(self, order, name):
+        self.order = order
+        self.limit = order[name]
+
+    def __contains__(self, name):
+        return self.order.get(name, self.limit) < self.limit
+
+def declarationOrder(names):
+    order = {}
+    for ix, name in enumerate(names):
+        order.setdefault(name, ix)
+    return order
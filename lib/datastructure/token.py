@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
+import sys
+from array import array
 from enum import IntEnum
 
+from lib.datastructure.position import Position
+
 class TOKEN(IntEnum):  # auto() for python >3.5
     VAR = 1
     IF = 2
@@ -79,7 +83,13 @@ PRETTY_TOKEN = {
 }
 
 
+'''
+Tokens are slotted, since there is one for every token in the source, and never modified after they are made.
+String values of identifiers and operators are interned by the lexer, so equal names are the same object.
+'''
 class Token():
+    __slots__ = ('pos', 'typ', 'val')
+
     def __init__(self, pos, typ, val):
         self.pos = pos
         self.typ = typ
@@ -96,3 +106,61 @@ class Token():
 
     def pretty(self):
         return PRETTY_TOKEN[self.typ](self)
+
+
+TOKEN_BY_CODE = {tok.value: tok for tok in TOKEN}
+
+class TokenBuffer():
+    '''
+    Compact storage for a token stream. Type codes and positions are kept in
+    parallel arrays and every distinct value is stored only once.
+    Indexing gives a Token, which is only built at that moment, so the parser
+    creates Tokens for the tokens it consumes but not for every token it looks at.
+    '''
+    def __init__(self, tokens=()):
+        self.types = array('B')
+        self.lines = array('I')
+        self.cols = array('I')
+        self.value_ids = array('I')
+        self.values = [None]
+        # Keyed on the type as well, since True == 1 but BOOL and INT values differ
+        self.value_index = {(type(None), None): 0}
+        # Tokens and nodes starting at the same index share one Position, like they do with a token list
+        self.positions = {}
+        for tok in tokens:
+            self.append(tok.typ, tok.val, tok.pos.line, tok.pos.col)
+
+    def append(self, typ, val, line, col):
+        key = (type(val), val)
+        value_id = self.value_index.get(key)
+        if value_id is None:
+            value_id = len(self.values)
+            self.values.append(sys.intern(val) if type(val) is str else val)
+            self.value_index[key] = value_id
+        self.types.append(typ)
+        self.lines.append(line)
+        self.cols.append(col)
+        self.value_ids.append(value_id)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, ix):
+        if type(ix) is slice:
+            return [self[i] for i in range(*ix.indices(len(self)))]
+        return Token(self.pos(ix), TOKEN_BY_CODE[self.types[ix]], self.values[self.value_ids[ix]])
+
+    def __iter__(self):
+        for ix in range(len(self)):
+            yield self[ix]
+
+    def typ(self, ix):
+        return TOKEN_BY_CODE[self.types[ix]]
+
+    def pos(self, ix):
+        if ix < 0:
+            ix += len(self)
+        position = self.positions.get(ix)
+        if position is None:
+            position = self.positions[ix] = Position(self.lines[ix], self.cols[ix])
+        return position
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# Interpreter for the part of the SSM instruction set the compiler emits, to run and count the instructions of executables
+
+import re
+
+'''
+Code is laid out like the SSM does: every instruction takes one word plus one per argument, and a label stands for the
+address of the instruction it is on. Globals are stored at the address of their label in the global section, so memory
+is shared between code and data. Values are 32 bit, True is -1 and False is 0.
+'''
+
+WORD_BITS = 32
+HEAP_START = 1 << 24
+
+INSTRUCTION_ARGS = {
+    'LDC': 1, 'LDL': 1, 'STL': 1, 'LDA': 1, 'STA': 1, 'LDH': 1, 'STMH': 1, 'LDS': 1, 'STS': 1, 'AJS': 1,
+    'LDR': 1, 'STR': 1, 'BSR': 1, 'BRA': 1, 'BRT': 1, 'BRF': 1, 'LINK': 1, 'TRAP': 1,
+    'UNLINK': 0, 'RET': 0, 'HALT': 0, 'NOP': 0, 'STH': 0,
+    'ADD': 0, 'SUB': 0, 'MUL': 0, 'DIV': 0, 'MOD': 0, 'NEG': 0, 'NOT': 0, 'AND': 0, 'OR': 0, 'XOR': 0,
+    'EQ': 0, 'NE': 0, 'LT': 0, 'GT': 0, 'LE': 0, 'GE': 0
+}
+
+REG_LABEL = re.compile(r'^([^\s:]+):\s*(.*)$')
+
+class SSMError(Exception):
+    pass
+
+def wrap(val):
+    val &= (1 << WORD_BITS) - 1
+    return val - (1 << WORD_BITS) if val >= 1 << (WORD_BITS - 1) else val
+
+# Rounds towards zero, like the SSM (and Java) do
+def truncDiv(a, b):
+    return abs(a) // abs(b) * (1 if (a < 0) == (b < 0) else -1)
+
+def toBool(cond):
+    return -1 if cond else 0
+
+def splitInstruction(line):
+    # Returns the label on the line (or None), the opcode and its arguments
+    label = None
+    match = REG_LABEL.match(line)
+    if match is not None:
+        label, line = match.group(1), match.group(2)
+    parts = line.split()
+    if not parts:
+        return label, None, []
+    return label, parts[0].upper(), parts[1:]
+
+def assemble(text):
+    code = {}
+    labels = {}
+    addr = 0
+    for line in text.split("\n"):
+        line = line.split("//", 1)[0].strip()
+        if not line:
+            continue
+        label, op, args = splitInstruction(line)
+        if label is not None:
+            labels[label] = addr
+        if op is None:
+            continue
+        if op not in INSTRUCTION_ARGS or INSTRUCTION_ARGS[op] != len(args):
+            raise SSMError("Cannot assemble: " + line)
+        code[addr] = (op, args)
+        addr += 1 + len(args)
+    return code, labels, addr
+
+def run(text, stdin="", max_steps=10**7):
+    '''
+    Run an executable from its first instruction until HALT.
+    Returns the output, the number of instructions executed and whether it halted within max_steps.
+    '''
+    code, labels, code_size = assemble(text)
+
+    def value(arg):
+        return labels[arg] if arg in labels else int(arg)
+
+    mem = {}
+    regs = {'PC': 0, 'SP': code_size - 1, 'MP': code_size - 1, 'HP': HEAP_START, 'RR': 0}
+    output = []
+    inp = list(stdin)
+    steps = 0
+
+    def push(val):
+        regs['SP'] += 1
+        mem[regs['SP']] = val
+
+    def pop():
+        val = mem.get(regs['SP'], 0)
+        regs['SP'] -= 1
+        return val
+
+    binops = {
+        'ADD': lambda a, b: a + b,
+        'SUB': lambda a, b: a - b,
+        'MUL': lambda a, b: a * b,
+        'DIV': lambda a, b: truncDiv(a, b),
+        'MOD': lambda a, b: a - b * truncDiv(a, b),
+        'AND': lambda a, b: a & b,
+        'OR': lambda a, b: a | b,
+        'XOR': lambda a, b: a ^ b,
+        'EQ': lambda a, b: toBool(a == b),
+        'NE': lambda a, b: toBool(a != b),
+        'LT': lambda a, b: toBool(a < b),
+        'GT': lambda a, b: toBool(a > b),
+        'LE': lambda a, b: toBool(a <= b),
+        'GE': lambda a, b: toBool(a >= b)
+    }
+
+    while steps < max_steps:
+        pc = regs['PC']
+        if pc not in code:
+            raise SSMError("No instruction at address {}".format(pc))
+        op, args = code[pc]
+        regs['PC'] = pc + 1 + len(args)
+        steps += 1
+
+        if op in binops:
+            b = pop()
+            a = pop()
+            if b == 0 and (op == 'DIV' or op == 'MOD'):
+                raise SSMError("Division by zero")
+            push(wrap(binops[op](a, b)))
+        elif op == 'LDC':
+            push(value(args[0]))
+        elif op == 'LDL':
+            push(mem.get(regs['MP'] + value(args[0]), 0))
+        elif op == 'STL':
+            mem[regs['MP'] + value(args[0])] = pop()
+        elif op == 'LDS':
+            push(mem.get(regs['SP'] + value(args[0]), 0))
+        elif op == 'STS':
+            val = pop()
+            mem[regs['SP'] + 1 + value(args[0])] = val
+        elif op == 'LDA' or op == 'LDH':
+            push(mem.get(pop() + value(args[0]), 0))
+        elif op == 'STA':
+            addr = pop()
+            mem[addr + value(args[0])] = pop()
+        elif op == 'STH':
+            mem[regs['HP']] = pop()
+            push(regs['HP'])
+            regs['HP'] += 1
+        elif op == 'STMH':
+            count = value(args[0])
+            vals = [pop() for _ in range(count)]
+            for val in reversed(vals):
+                mem[regs['HP']] = val
+                regs['HP'] += 1
+            push(regs['HP'] - 1)
+        elif op == 'AJS':
+            regs['SP'] += value(args[0])
+        elif op == 'LDR':
+            push(regs[args[0]])
+        elif op == 'STR':
+            regs[args[0]] = pop()
+        elif op == 'NEG':
+            push(wrap(-pop()))
+        elif op == 'NOT':
+            push(~pop())
+        elif op == 'BRA':
+            regs['PC'] = value(args[0])
+        elif op == 'BRT':
+            if pop() != 0:
+                regs['PC'] = value(args[0])
+        elif op == 'BRF':
+            if pop() == 0:
+                regs['PC'] = value(args[0])
+        elif op == 'BSR':
+            push(regs['PC'])
+            regs['PC'] = value(args[0])
+        elif op == 'RET':
+            regs['PC'] = pop()
+        elif op == 'LINK':
+            push(regs['MP'])
+            regs['MP'] = regs['SP']
+            regs['SP'] += value(args[0])
+        elif op == 'UNLINK':
+            regs['SP'] = regs['MP']
+            regs['MP'] = pop()
+        elif op == 'TRAP':
+            trap = value(args[0])
+            if trap == 0:
+                output.append(str(pop()) + "\n")
+            elif trap == 1:
+                output.append(chr(pop() & 0x10FFFF))
+            elif trap == 10 or trap == 11:
+                if not inp:
+                    raise SSMError("Read past the end of the input")
+                push(ord(inp.pop(0)))
+            else:
+                raise SSMError("Unsupported trap {}".format(trap))
+        elif op == 'HALT':
+            return "".join(output), steps, True
+        elif op == 'NOP':
+            pass
+        else:
+            raise SSMError("Unsupported instruction " + op)
+
+    return "".join(output), steps, False
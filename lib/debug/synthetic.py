@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# Generator for large, well-typed SPL programs, used by the bench-*.py scripts
+
+import random
+
+BINOPS = ["+", "-", "*"]
+CMPOPS = ["<", ">", "==", "!=", "<=", ">="]
+
+def synthetic_program(funcs=50, globs=20, stmts=8, depth=3, seed=0):
+    '''Return the source of an SPL program with `globs` globals and `funcs` functions
+    of roughly `stmts` statements each. Expressions are nested up to `depth` levels.'''
+    rng = random.Random(seed)
+    out = []
+
+    def expr(names, callees, d):
+        if d <= 0 or rng.random() < 0.25:
+            return rng.choice(names) if rng.random() < 0.7 else str(rng.randint(0, 99))
+        kind = rng.random()
+        if kind < 0.5:
+            return "{} {} {}".format(expr(names, callees, d - 1), rng.choice(BINOPS), expr(names, callees, d - 1))
+        elif kind < 0.7:
+            return "({})".format(expr(names, callees, d - 1))
+        elif kind < 0.85 and callees:
+            return "{}({}, {})".format(rng.choice(callees), expr(names, callees, d - 1), expr(names, callees, d - 1))
+        else:
+            return "-({})".format(expr(names, callees, d - 1))
+
+    def cond(names, callees):
+        return "{} {} {}".format(expr(names, callees, 1), rng.choice(CMPOPS), expr(names, callees, 1))
+
+    glob_names = []
+    for i in range(globs):
+        name = "g{}".format(i)
+        out.append("Int {} = {};".format(name, expr(glob_names, [], depth) if glob_names else str(i)))
+        glob_names.append(name)
+    out.append("")
+
+    func_names = []
+    for i in range(funcs):
+        name = "f{}".format(i)
+        out.append("{} (a, b) :: Int Int -> Int {{".format(name))
+        out.append("    Int x = {};".format(expr(["a", "b"], func_names, depth)))
+        out.append("    [Int] xs = [];")
+        out.append("    (Int, Bool) t = (x, True);")
+        names = ["a", "b", "x", "t.fst"] + glob_names[-3:]
+        for _ in range(stmts):
+            kind = rng.random()
+            if kind < 0.4:
+                out.append("    x = {};".format(expr(names, func_names, depth)))
+            elif kind < 0.6:
+                out.append("    xs = {} : xs;".format(expr(names, func_names, depth)))
+            elif kind < 0.8:
+                out.append("    if ({}) {{".format(cond(names, func_names)))
+                out.append("        x = {};".format(expr(names, func_names, depth)))
+                out.append("    }} elif ({}) {{".format(cond(names, func_names)))
+                out.append("        t.snd = !t.snd;")
+                out.append("    } else {")
+                out.append("        x = x + 1;")
+                out.append("    }")
+            else:
+                out.append("    while (x > {}) {{".format(rng.randint(0, 9)))
+                out.append("        x = x - 1;")
+                out.append("        xs = x : xs;")
+                out.append("    }")
+        out.append("    return x;")
+        out.append("}")
+        out.append("")
+        func_names.append(name)
+
+    out.append("main () :: -> Int {")
+    out.append("    print({}(1, 2));".format(func_names[-1]) if func_names else "    print(0);")
+    out.append("    return 0;")
+    out.append("}")
+    return "\n".join(out) + "\n"
+
+def overloaded_program(depth=10, overloads=3):
+    '''Return the source of an SPL program with an infix operator that has up to 4 overloads, which all take an Int
+    on the left, and a chain of `depth` applications of it. Every overload accepts the chain on its left.'''
+    right_types = ["Int", "Char", "Bool", "[Char]"][:overloads]
+    right_values = {"Int": "1", "Char": "'a'", "Bool": "True", "[Char]": "\"a\""}
+    out = []
+    for typ in right_types:
+        out.append("infixl 6 <+> (a, b) :: Int {} -> Int {{".format(typ))
+        out.append("    return a;")
+        out.append("}")
+        out.append("")
+
+    chain = " <+> ".join(["0"] + [right_values[right_types[i % len(right_types)]] for i in range(depth)])
+    out.append("main () :: -> Int {")
+    out.append("    Int x = {};".format(chain))
+    out.append("    print(x <+> 1 == 0 && !(x <+> 2 <+> 3 < x));")
+    out.append("    return 0;")
+    out.append("}")
+    return "\n".join(out) + "\n"
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    argparser = ArgumentParser(description="Print a synthetic SPL program")
+    argparser.add_argument("--funcs", type=int, default=50)
+    argparser.add_argument("--globs", type=int, default=20)
+    argparser.add_argument("--stmts", type=int, default=8)
+    argparser.add_argument("--depth", type=int, default=3)
+    argparser.add_argument("--seed", type=int, default=0)
+    args = argparser.parse_args()
+    print(synthetic_program(args.funcs, args.globs, args.stmts, args.depth, args.seed), end="")
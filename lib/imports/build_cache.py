@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+from lib.imports.imports import resolveFileName, header_hash, HEADER_EXT
+from lib.imports.objectfile_imports import OBJECT_COMMENT_PREFIX, OBJECT_FORMAT, BinaryObjectSections, isBinaryObject
+
+import json
+import os
+
+BUILD_CACHE_DIR = ".splcache"
+
+'''
+Incremental builds:
+every headerfile records the md5sum of the source it was generated from, and every object file additionally records
+the interface hash of each headerfile that was read to build it, and the code generation options it was built with.
+An artifact is up to date when the source still hashes the same, every recorded headerfile (as resolved with the current
+import arguments) still exports the same symbols and an object file was generated with the current options.
+'''
+
+def headerStamp(json_string):
+    try:
+        return json.loads(json_string).get("stamp")
+    except (ValueError, AttributeError):
+        return None
+
+def objectStamp(data):
+    if isBinaryObject(data): # The stamp is in the index
+        try:
+            stamp = BinaryObjectSections(data).stamp
+        except Exception:
+            return None
+        if stamp is None or stamp.get("source") is None:
+            return None
+        return {"source": stamp["source"], "headers": [tuple(h) for h in stamp.get("headers", [])], "codegen": stamp.get("codegen")}
+
+    stamp = {"source": None, "headers": [], "codegen": None}
+    source_prefix = OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['sourcehash']
+    header_prefix = OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['headerhash']
+    codegen_prefix = OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['codegen']
+    # The stamp lives in the dependency section, at the top of the file
+    for line in data.split("\n"):
+        if line.startswith(source_prefix):
+            stamp["source"] = line[len(source_prefix):]
+        elif line.startswith(header_prefix):
+            stamp["headers"].append(tuple(line[len(header_prefix):].split(" ", 1)))
+        elif line.startswith(codegen_prefix):
+            stamp["codegen"] = line[len(codegen_prefix):]
+        elif line.startswith(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['init']):
+            break
+    return stamp if stamp["source"] is not None else None
+
+def headerUpToDate(json_string, source_hash):
+    stamp = headerStamp(json_string)
+    return stamp is not None and stamp.get("source") == source_hash
+
+def objectUpToDate(data, source_hash, local_dir, file_mapping_arg={}, lib_dir_path=None, lib_dir_env=None, codegen=None):
+    stamp = objectStamp(data)
+    if stamp is None or stamp["source"] != source_hash or stamp["codegen"] != codegen:
+        return False
+    for entry in stamp["headers"]:
+        if len(entry) != 2:
+            return False
+        name, recorded = entry
+        try:
+            handle, _ = resolveFileName(name, HEADER_EXT, local_dir, file_mapping_arg=file_mapping_arg, lib_dir_path=lib_dir_path, lib_dir_env=lib_dir_env)
+        except FileNotFoundError:
+            return False
+        with handle:
+            try:
+                if header_hash(handle.read()) != recorded:
+                    return False
+            except ValueError:
+                return False
+    return True
+
+
+class BuildCache():
+    '''Directory of previously generated artifacts, keyed on module name and source hash.
+    An entry for a source is overwritten when it is regenerated against changed headerfiles.'''
+    def __init__(self, cache_dir=BUILD_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def path(self, mod_name, source_hash, extension):
+        return os.path.join(self.cache_dir, "{}-{}{}".format(mod_name, source_hash, extension))
+
+    def store(self, mod_name, source_hash, extension, data):
+        # The cache is only an accelerator, so failing to write to it is not an error
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self.path(mod_name, source_hash, extension)
+            with open(path + ".tmp", "wb" if type(data) is bytes else "w") as outfile:
+                outfile.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass
+
+    '''
+    Find an up to date artifact, first at its output path, then in the cache
+    Returns the artifact (bytes for a binary object file, a string otherwise) and the path it was found at, or None
+    '''
+    def lookup(self, outfile_name, mod_name, source_hash, extension, up_to_date):
+        candidates = [outfile_name] if outfile_name is not None else []
+        candidates.append(self.path(mod_name, source_hash, extension))
+        for path in candidates:
+            try:
+                with open(path, "rb") as infile:
+                    data = infile.read()
+                if not isBinaryObject(data):
+                    data = data.decode()
+            except (OSError, UnicodeDecodeError):
+                continue
+            if up_to_date(data):
+                return data, path
+        return None
@@ -11,7 +11,12 @@ from collections import OrderedDict
 from lib.parser.lexer import REG_FIL
 from lib.builtins.builtin_mod import BUILTINS_NAME
 
+from concurrent.futures import ThreadPoolExecutor
+
+import hashlib
 import os
+import sys
+import time
 
 HEADER_EXT = ".spld"
 OBJECT_EXT = ".splo"
@@ -20,22 +25,35 @@ TARGET_EXT = ".ssm"
 
 IMPORT_DIR_ENV_VAR_NAME = "SPL_PATH"
 
+# Files are loaded with this many threads, so that reading imports from a slow (network) drive overlaps
+LOAD_THREADS = 8
+
 RESERVED_MODNAMES = [
     BUILTINS_NAME
 ]
 
 '''
 everything breaks if the object files linked with are generated from a different version of a source file than its headerfile
-solution: have headerfile and object file encode the md5sum of their source file + add this md5sum after the module name for each dependency in the object file
+so headerfiles and object files encode the md5sum of their source file, and object files the md5sum of every headerfile they were built against
+(see lib/imports/build_cache.py)
 '''
 
+def content_hash(text):
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+def interface_hash(packet): # Ignores the stamp, so importers only go stale when the exported symbols change
+    return content_hash(json.dumps({k: v for (k, v) in packet.items() if k != "stamp"}, sort_keys=True, indent=2))
+
+def header_hash(json_string):
+    return interface_hash(json.loads(json_string))
+
 def validate_modname(mod_name): # Errors need to be collected outside
     if not REG_FIL.fullmatch(mod_name):
         ERROR_HANDLER.addError(ERR.CompModuleFileNameRegex, [mod_name])
     if mod_name in RESERVED_MODNAMES:
         ERROR_HANDLER.addError(ERR.ReservedModuleName, [mod_name])
 
-def export_headers(symbol_table, modname, modname_typesyns, ext_table):
+def export_headers(symbol_table, modname, modname_typesyns, ext_table, source_hash=None):
     temp_globals = list(map(lambda x: (x.id.val, x.type.__serial__()), symbol_table.global_vars.values()))
     own_typesyns = list(filter(lambda x: x[0][1] == modname, ext_table.type_syns.items()))
     own_typesyns = OrderedDict(list(map(lambda x: (x[0][0], x[1]), own_typesyns)))
@@ -50,6 +68,8 @@ def export_headers(symbol_table, modname, modname_typesyns, ext_table):
         "typesyns": temp_typesyns,
         "functions": temp_functions
     }
+    if source_hash is not None:
+        temp_packet["stamp"] = {"source": source_hash}
     return json.dumps(temp_packet, sort_keys=True,indent=2)
 
 
@@ -57,6 +77,7 @@ def import_headers(json_string): # Can return exception, so put in try-except
     load_packet = json.loads(json_string)
     temp_packet = {}
     temp_packet["depends"] = load_packet["depends"]
+    temp_packet["hash"] = interface_hash(load_packet)
     temp_packet["globals"] = OrderedDict([(k,parse_type(v)) for k,v in load_packet["globals"]])
     temp_packet["typesyns"] = OrderedDict([(k,parse_type(v)) for k,v in load_packet["typesyns"]])
     temp_packet["functions"] = OrderedDict()
@@ -182,55 +203,84 @@ def getImportFiles(ast, modname, extension, local_dir, file_mapping_arg={}, lib_
     ERROR_HANDLER.checkpoint()
     return temp
 
+'''
+Find, read and parse the header file of a module. Runs in a worker thread, so it does not report errors itself.
+Returns the entry of the module in the header table, with the time it took.
+'''
+def loadHeader(name, extension, local_dir, file_mapping_arg={}, lib_dir_path=None, lib_dir_env=None):
+    start = time.perf_counter()
+    handle, path = resolveFileName(name, extension, local_dir, file_mapping_arg=file_mapping_arg, lib_dir_path=lib_dir_path, lib_dir_env=lib_dir_env)
+    try:
+        data = handle.read()
+    finally:
+        handle.close()
+    symbols = import_headers(data)
+    return {"name":name,"filehandle":handle,"path":path,"symbols":symbols,"hash":symbols['hash'],"load_time":time.perf_counter() - start}
+
+'''
+The headers of the modules imported by the ast, and the headers of the modules those need for their type synonyms.
+Modules that do not depend on each other are loaded at the same time, with LOAD_THREADS threads: all direct imports
+at once, and then the type synonym dependencies level by level. The order of the tables is the order of the imports,
+and then breadth first, like loading them one by one would give.
+'''
 def getHeaders(ast, modname, extension, local_dir, file_mapping_arg={}, lib_dir_path=None, lib_dir_env=None):
     importlist = ast.imports
 
-    headerfiles = getImportFiles(ast,
-        modname,
-        extension,
-        local_dir,
-        file_mapping_arg=file_mapping_arg,
-        lib_dir_path=lib_dir_path,
-        lib_dir_env=lib_dir_env
-        )
+    unique_names = OrderedDict.fromkeys(map(lambda x: x.name.val, importlist)) # names directly imported
+    unique_names.pop(modname, None) # Do not read this module if it is in imports
+    for impname in unique_names:
+        validate_modname(impname)
 
     all_seen_names = OrderedDict.fromkeys(map(lambda x: x.name.val, importlist)) # List for recursive header reading (for typesyn dependencies)
     all_seen_names[modname] = None # Do not recursively read the current module again either
-    all_seen_names = list(all_seen_names)
-    recurse_names =[]
-
-    for head in headerfiles.values():
-        data = head['filehandle'].read()
 
-        symbols = import_headers(data)
-        head['symbols'] = symbols
+    def load(names):
+        futures = [executor.submit(loadHeader, name, extension, local_dir, file_mapping_arg=file_mapping_arg, lib_dir_path=lib_dir_path, lib_dir_env=lib_dir_env) for name in names]
+        return zip(names, futures)
 
-        for dep in symbols['depends']:
+    def dependencies(head):
+        res = []
+        for dep in head['symbols']['depends']:
             if dep not in all_seen_names:
-                all_seen_names.append(dep)
-                recurse_names.append(dep)
-    for head in headerfiles.values():
-        head['filehandle'].close()
+                all_seen_names[dep] = None
+                res.append(dep)
+        return res
 
+    headerfiles = OrderedDict()
     temp_typesyn_headers = OrderedDict()
-    for rec_name in recurse_names:
-        try:
-            handle, path = resolveFileName(rec_name, extension, local_dir, file_mapping_arg=file_mapping_arg, lib_dir_path=lib_dir_path, lib_dir_env=lib_dir_env)
-            temp_typesyn_headers[rec_name] = {"name":rec_name,"filehandle":handle,"path":path}
-            data = handle.read()
-            handle.close()
-
-            symbols = import_headers(data)
-            temp_typesyn_headers[rec_name]['symbols'] = symbols
-
-            for dep in symbols['depends']:
-                if dep not in all_seen_names:
-                    all_seen_names.append(dep)
-                    recurse_names.append(dep)
-        except FileNotFoundError as e:
-            ERROR_HANDLER.addError(ERR.RecursiveImportNotFound, [rec_name, "\t" + "\n\t".join(str(e).split("\n"))])
+    with ThreadPoolExecutor(max_workers=LOAD_THREADS) as executor:
+        recurse_names = []
+        failed = None
+        for impname, future in load(list(unique_names)):
+            try:
+                headerfiles[impname] = future.result()
+            except FileNotFoundError as e:
+                ERROR_HANDLER.addError(ERR.ImportNotFound, [impname, "\t" + "\n\t".join(str(e).split("\n"))])
+            except Exception as e:
+                failed = failed or e
+        # Imports that are not found are reported before anything that went wrong reading the others
+        ERROR_HANDLER.checkpoint()
+        if failed is not None:
+            raise failed
+        for head in headerfiles.values():
+            recurse_names.extend(dependencies(head))
+
+        while recurse_names:
+            next_names = []
+            for rec_name, future in load(recurse_names):
+                try:
+                    temp_typesyn_headers[rec_name] = future.result()
+                    next_names.extend(dependencies(temp_typesyn_headers[rec_name]))
+                except FileNotFoundError as e:
+                    ERROR_HANDLER.addError(ERR.RecursiveImportNotFound, [rec_name, "\t" + "\n\t".join(str(e).split("\n"))])
+            recurse_names = next_names
     return headerfiles, temp_typesyn_headers
 
+# Print how long loading every file took, to stderr so it does not end up in output written to stdout
+def reportLoadTimes(load_times):
+    for path, seconds in load_times:
+        print("Loaded {} in {:.3f}s".format(path, seconds), file=sys.stderr)
+
 '''
 Parse a list of headerfiles to json and subset the symbols that are in scope
 '''
@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 
 from lib.analysis.error_handler import *
-from lib.imports.imports import resolveFileName, validate_modname, OBJECT_EXT
+from lib.imports.imports import resolveFileName, validate_modname, OBJECT_EXT, LOAD_THREADS
 
 from lib.parser.lexer import REG_FIL
 
 from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
+import json
+import mmap
 import os
+import re
+import struct
+import time
 
 
 OBJECT_COMMENT_PREFIX = "// "
@@ -15,6 +23,9 @@ OBJECT_COMMENT_PREFIX = "// "
 OBJECT_FORMAT = {
     "depend"    : "DEPENDENCIES:",
     "dependitem": "DEPEND ",
+    "sourcehash": "SOURCE ",
+    "headerhash": "HEADER ",
+    "codegen"   : "CODEGEN ",
     "init"      : "INIT SECTION:",
     "entrypoint": "BOOTSTRAP:",
     "globals"   : "GLOBAL SECTION:",
@@ -22,22 +33,115 @@ OBJECT_FORMAT = {
     "main"      : "ENTRYPOINT:"
 }
 
-def getSlice(text, start, end):
-    start_ix = text.find(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT[start]) if start is not None else 0
-    end_ix = text.find(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT[end]) if end is not None else len(text)
-    if start_ix == -1 or end_ix == -1:
-        raise Exception('Could not locate section: "{}"-"{}"'.format(OBJECT_FORMAT[start], OBJECT_FORMAT[end]))
-    res = text[start_ix:end_ix].split("\n",1)[1].strip()
-    text = text[:start_ix] + text[end_ix:]
-    return res, text
+'''
+Object files come in two formats. The text format is commented SSM code, with the sections marked by OBJECT_FORMAT lines.
+The binary format starts with a header (magic, version, length of the index), then a JSON index and then the sections:
+    {"stamp": {...} or null, "dependencies": [module, ...],
+     "sections": {"global_inits": {"offset", "length", "references"}, "global_mem": ..., "functions": ..., "symbols": ...}}
+Offsets are in bytes from the end of the index. The function section is the SSM text of the functions one after another,
+every one starting with its label. The symbols section is a JSON list with a row for each function, with the fields in
+SYMBOL_FIELDS: where its text is, the labels it defines and the labels it uses but does not define (references).
+So a linker can find out what a module defines and needs without reading its code, and read only the functions it needs.
+'''
+OBJECT_FORMATS = ["text", "binary"]
+DEFAULT_OBJECT_FORMAT = "text"
 
-def parseObjectFile(data):
-    deps, data = getSlice(data, "depend", "init")
-    inits, data = getSlice(data, "init", "entrypoint")
-    globs, data = getSlice(data, "globals", "funcs")
-    funcs, data = getSlice(data, "funcs", "main")
-    main, data = getSlice(data, "main", None)
+BINARY_OBJECT_MAGIC = b"SPLO"
+BINARY_OBJECT_VERSION = 1
+BINARY_OBJECT_HEADER = struct.Struct(">4sHI")
+SYMBOL_FIELDS = ["label", "offset", "length", "defines", "references"]
+
+# Labels defined at the start of a line, and labels used by BRA, BRT, BRF, BSR or an LDC of something that is not a
+# number. Both start with the newline before the line, which makes them a lot faster to search for than with ^.
+LABEL_DEFINITION = re.compile(r"\n([^\s:/]+):")
+LABEL_USE = re.compile(r"\n(?:[^\s:/]+:[ \t]*)?(?:BR[ATF]|BSR|LDC)[ \t]+([^\s\d+-]\S*)[ \t]*\r?$", re.MULTILINE)
+
+def isBinaryObject(data):
+    return type(data) is not str and data[:len(BINARY_OBJECT_MAGIC)] == BINARY_OBJECT_MAGIC
+
+'''
+The labels defined in a piece of SSM code, and the labels it uses but does not define, both sorted.
+With start and end, only text[start:end] is looked at, and text[start] has to be the newline before its first line.
+'''
+def codeSymbols(text, start=None, end=None):
+    if start is None:
+        text, start = "\n" + text, 0
+    end = len(text) if end is None else end
+    defines = set(LABEL_DEFINITION.findall(text, start, end))
+    uses = set(LABEL_USE.findall(text, start, end))
+    return sorted(defines), sorted(uses - defines)
+
+# The sections of an object file, in the order they come in. The bootstrap and entrypoint sections are not linked.
+SECTION_ORDER = ["depend", "init", "entrypoint", "globals", "funcs", "main"]
+LINKED_SECTIONS = OrderedDict([
+    ("global_inits", "init"),
+    ("global_mem", "globals"),
+    ("functions", "funcs")
+])
+
+'''
+The sections of an object file, found in one scan over its text (a string, or the bytes of a memory mapped file).
+Only the offsets of the sections are kept, a section is cut out of the text the first time it is looked up.
+The dependencies are read right away, since they are needed to find the other object files.
+Behaves like an OrderedDict of the dependencies, global_inits, global_mem and functions.
+'''
+class ObjectSections(Mapping):
+    def __init__(self, data, encoding="utf-8"):
+        self.data = data
+        self.encoding = encoding
+        self.bounds = self.scan()
+        self.loaded = {}
+        self.module = None # Set by getObjectFiles, with the path and the time it took to load
+        self.path = None
+        self.load_time = None
+        self.dependencies = parseDependencies(self.section("depend"))
 
+    def scan(self):
+        # The sections come in a fixed order, so each marker line is looked for after the one before it
+        newline = "\n" if type(self.data) is str else b"\n"
+        found = []
+        pos = 0
+        for key in SECTION_ORDER:
+            marker = OBJECT_COMMENT_PREFIX + OBJECT_FORMAT[key]
+            marker = marker if type(self.data) is str else marker.encode("ascii")
+            if pos == 0 and self.data[:len(marker)] == marker:
+                start = 0
+            else:
+                start = self.data.find(newline + marker, max(pos - 1, 0))
+                if start == -1:
+                    raise Exception('Could not locate section: "{}"'.format(OBJECT_FORMAT[key]))
+                start += 1
+            pos = self.data.find(newline, start)
+            pos = len(self.data) if pos == -1 else pos + 1
+            found.append((start, pos))
+        # A section runs from the end of its marker line to the start of the next marker line
+        ends = [start for (start, _) in found[1:]] + [len(self.data)]
+        return {key: (pos, end) for (key, (_, pos), end) in zip(SECTION_ORDER, found, ends)}
+
+    def section(self, key):
+        start, end = self.bounds[key]
+        text = self.data[start:end]
+        if type(text) is bytes: # Newlines are not translated in a memory mapped file
+            text = text.decode(self.encoding).replace("\r\n", "\n")
+        return text.strip()
+
+    def __getitem__(self, name):
+        if name == "dependencies":
+            return self.dependencies
+        if name not in LINKED_SECTIONS:
+            raise KeyError(name)
+        if name not in self.loaded:
+            self.loaded[name] = self.section(LINKED_SECTIONS[name])
+        return self.loaded[name]
+
+    def __iter__(self):
+        yield "dependencies"
+        yield from LINKED_SECTIONS
+
+    def __len__(self):
+        return 1 + len(LINKED_SECTIONS)
+
+def parseDependencies(deps):
     modnames = OrderedDict()
     for line in [x for x in deps.split("\n") if len(x) > 0]:
         if line.startswith(OBJECT_COMMENT_PREFIX + OBJECT_FORMAT['dependitem']):
@@ -47,52 +151,155 @@ def parseObjectFile(data):
             pass
         else:
             raise Exception("Non-comment in dependencies: " + line)
-    modnames = list(modnames)
-    #print(modnames)
-    temp = OrderedDict([
-        ("dependencies", modnames),
-        ("global_inits", inits),
-        ("global_mem", globs),
-        ("functions", funcs)
-    ])
-    return temp
+    return list(modnames)
+
+'''
+The sections of a binary object file. Only the index is read up front: the code of a section or function is cut out of
+the data when it is looked up, and the symbols are read the first time they are needed.
+Behaves like ObjectSections, and also gives the stamp and the symbols of the functions.
+'''
+class BinaryObjectSections(Mapping):
+    def __init__(self, data):
+        if len(data) < BINARY_OBJECT_HEADER.size:
+            raise Exception("Truncated binary object file")
+        magic, version, index_length = BINARY_OBJECT_HEADER.unpack(data[:BINARY_OBJECT_HEADER.size])
+        if magic != BINARY_OBJECT_MAGIC:
+            raise Exception("Not a binary object file")
+        if version != BINARY_OBJECT_VERSION:
+            raise Exception("Unsupported binary object file version {}".format(version))
+        self.data = data
+        self.payload = BINARY_OBJECT_HEADER.size + index_length
+        if self.payload > len(data):
+            raise Exception("Truncated binary object file")
+        index = json.loads(bytes(data[BINARY_OBJECT_HEADER.size:self.payload]).decode("utf-8"))
+        self.stamp = index["stamp"]
+        self.dependencies = index["dependencies"]
+        self.sections = index["sections"]
+        # Checked here rather than when a section is read, so a cut off file is rejected before linking starts
+        if any(self.payload + entry["offset"] + entry["length"] > len(data) for entry in self.sections.values()):
+            raise Exception("Truncated binary object file")
+        self.loaded = {}
+        self.module = None # Set by getObjectFiles, with the path and the time it took to load
+        self.path = None
+        self.load_time = None
+        self._symbols = None
+        self._functions = None
+
+    def text(self, offset, length):
+        start = self.payload + offset
+        if start + length > len(self.data):
+            raise Exception("Truncated binary object file")
+        return bytes(self.data[start:start + length]).decode("utf-8")
+
+    def block(self, entry):
+        return self.text(entry["offset"], entry["length"])
+
+    # The rows of the symbols section, with the fields in SYMBOL_FIELDS
+    @property
+    def symbols(self):
+        if self._symbols is None:
+            self._symbols = json.loads(self.block(self.sections["symbols"]))
+        return self._symbols
+
+    # The symbols of the functions by label, in the order of the function section
+    @property
+    def functions(self):
+        if self._functions is None:
+            self._functions = OrderedDict([(row[0], dict(zip(SYMBOL_FIELDS, row))) for row in self.symbols])
+        return self._functions
+
+    def function(self, label):
+        return self.block(self.functions[label])
+
+    def __getitem__(self, name):
+        if name == "dependencies":
+            return self.dependencies
+        if name not in LINKED_SECTIONS:
+            raise KeyError(name)
+        if name not in self.loaded:
+            self.loaded[name] = self.block(self.sections[name])
+        return self.loaded[name]
+
+    def __iter__(self):
+        yield "dependencies"
+        yield from LINKED_SECTIONS
+
+    def __len__(self):
+        return 1 + len(LINKED_SECTIONS)
+
+def parseObjectFile(data):
+    return BinaryObjectSections(data) if isBinaryObject(data) else ObjectSections(data)
+
+'''
+Read the sections of an open object file, in either format. A file on disk is memory mapped rather than read, so that
+the sections the linker does not need are never copied into memory. Anything else (like the StringIO or BytesIO the
+compiler links from) is read.
+'''
+def readObjectFile(handle):
+    try:
+        data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError): # No file descriptor, or an empty file
+        return parseObjectFile(handle.read())
+    if isBinaryObject(data):
+        return BinaryObjectSections(data)
+    return ObjectSections(data, getattr(handle, "encoding", None) or "utf-8")
+
+'''
+Open (with resolve, which returns an open file and its path), read and parse an object file, and time it.
+Runs in a worker thread, so an error is returned rather than reported: the path is None if the file was not found.
+'''
+def loadObjectFile(resolve):
+    start = time.perf_counter()
+    found = None
+    try:
+        found = resolve()
+        obj_struct = readObjectFile(found[0])
+        obj_struct.path = found[1]
+        obj_struct.load_time = time.perf_counter() - start
+        return found[1], obj_struct, None
+    except Exception as e:
+        return found[1] if found is not None else None, None, e
+    finally:
+        if found is not None:
+            found[0].close()
 
+'''
+The object files of the main module and everything it depends on, in the order the linker puts them in.
+A file is loaded by a worker thread as soon as a module that depends on it is read, so that the files are opened and
+read at the same time, but the list comes out in the order of reading them one by one.
+'''
 def getObjectFiles(main_filehandle, main_filename, local_dir, file_mapping_arg={}, lib_dir_path=None, lib_dir_env=None):
     main_mod_name = os.path.splitext(os.path.basename(main_filename))[0]
-    #print(main_mod_name)
 
     res = []
     seen = set([main_mod_name])
-    closed = {}
-    # openlist is list of open file handles that need to be read still
-    openlist = [(main_filehandle, main_filename)]
-    while openlist:
-        cur_handle, cur_name = openlist.pop()
-        #print("Reading", cur_name)
-        data = cur_handle.read()
-        cur_handle.close()
-        try:
-            obj_struct = parseObjectFile(data)
+    with ThreadPoolExecutor(max_workers=LOAD_THREADS) as executor:
+        # openlist is the list of modules still to be read, with the loading of their object file
+        openlist = [(main_mod_name, executor.submit(loadObjectFile, lambda: (main_filehandle, main_filename)))]
+        while openlist:
+            cur_mod_name, future = openlist.pop()
+            cur_path, obj_struct, error = future.result()
+            if cur_path is None:
+                ERROR_HANDLER.addError(ERR.ImportNotFound, [cur_mod_name, "\t" + "\n\t".join(str(error).split("\n"))])
+                continue
+            if obj_struct is None:
+                ERROR_HANDLER.addError(ERR.CompMalformedObjectFile, [cur_path, error])
+                continue
+            obj_struct.module = cur_mod_name # For the linker to say where a label comes from
             res.append(obj_struct)
             for dep in obj_struct['dependencies']:
                 validate_modname(dep)
                 if dep not in seen:
-                    try:
-                        found = resolveFileName(
-                            dep,
-                            OBJECT_EXT,
-                            local_dir,
-                            file_mapping_arg=file_mapping_arg,
-                            lib_dir_path=lib_dir_path,
-                            lib_dir_env=lib_dir_env
-                        )
-                        #print(found)
-                        seen.add(dep)
-                        openlist.append(found)
-                    except Exception as e:
-                        ERROR_HANDLER.addError(ERR.ImportNotFound, [dep, "\t" + "\n\t".join(str(e).split("\n"))])
-        except Exception as e:
-            ERROR_HANDLER.addError(ERR.CompMalformedObjectFile, [cur_name, e])
+                    seen.add(dep)
+                    resolve = partial(resolveFileName,
+                        dep,
+                        OBJECT_EXT,
+                        local_dir,
+                        file_mapping_arg=file_mapping_arg,
+                        lib_dir_path=lib_dir_path,
+                        lib_dir_env=lib_dir_env
+                    )
+                    openlist.append((dep, executor.submit(loadObjectFile, resolve)))
 
     ERROR_HANDLER.checkpoint()
-    return res
\ No newline at end of file
+    return res
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+
+import sys
+# Import hack
+import os
+sys.path.insert(0, os.path.join(sys.path[0],'../../'))
+
+from lib.datastructure.token import TOKEN, TokenBuffer
+from lib.datastructure.AST import AST, FunKind
+
+'''
+Hand-written recursive descent version of the combinator grammar in parser.py.
+Every choice in that grammar can be made by looking at the current token (and
+the one after an identifier), so no backtracking is needed. The tree is the
+same as the combinator one, including the _start_pos of every node.
+On a syntax error this parser gives up, and the combinator grammar is used to
+report the error.
+'''
+
+class NoParse(Exception):
+    pass
+
+TYPE_FIRST = frozenset([TOKEN.TYPE_IDENTIFIER, TOKEN.PAR_OPEN, TOKEN.BRACK_OPEN])
+VARDECL_FIRST = TYPE_FIRST | {TOKEN.VAR}
+DECL_FIRST = VARDECL_FIRST | {TOKEN.IDENTIFIER, TOKEN.TYPESYN, TOKEN.PREFIX, TOKEN.INFIXL, TOKEN.INFIXR}
+STMT_FIRST = frozenset([TOKEN.IF, TOKEN.WHILE, TOKEN.FOR, TOKEN.IDENTIFIER, TOKEN.RETURN, TOKEN.BREAK, TOKEN.CONTINUE])
+LITERALS = frozenset([TOKEN.INT, TOKEN.CHAR, TOKEN.STRING, TOKEN.BOOL, TOKEN.EMPTY_LIST])
+EXP_FIRST = LITERALS | {TOKEN.IDENTIFIER, TOKEN.OP_IDENTIFIER, TOKEN.PAR_OPEN}
+IMPORT_FIRST = frozenset([TOKEN.FROM, TOKEN.IMPORTALL])
+ANY_ID = frozenset([TOKEN.IDENTIFIER, TOKEN.TYPE_IDENTIFIER, TOKEN.OP_IDENTIFIER])
+BASIC_TYPES = frozenset(["Int", "Bool", "Char"])
+
+
+class DescentParser():
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.types = tokens.types
+        self.index = 0
+
+    def peek(self, offset=0):
+        ix = self.index + offset
+        return self.types[ix] if ix < len(self.types) else None
+
+    def peek_op(self, val):
+        return self.peek() == TOKEN.OP_IDENTIFIER and self.tokens.values[self.tokens.value_ids[self.index]] == val
+
+    def skip(self, typ):
+        if self.peek() != typ:
+            raise NoParse()
+        self.index += 1
+
+    def expect(self, typ):
+        self.skip(typ)
+        return self.tokens[self.index - 1]
+
+    def expect_op(self, val):
+        if not self.peek_op(val):
+            raise NoParse()
+        self.index += 1
+
+    def take(self):
+        self.index += 1
+        return self.tokens[self.index - 1]
+
+    def mark(self, node, start):
+        # Same start position as the combinator that returns this node would give
+        node._start_pos = self.tokens.pos(start)
+        return node
+
+    # IMPORTS ===========================================================
+    def spl(self):
+        imports = []
+        while self.peek() in IMPORT_FIRST:
+            imports.append(self.import_decl())
+        decls = []
+        while self.peek() in DECL_FIRST:
+            decls.append(self.decl())
+        if self.index < len(self.tokens):
+            raise NoParse()
+        return self.mark(AST.SPL(imports=imports, decls=decls), 0)
+
+    def import_decl(self):
+        start = self.index
+        if self.peek() == TOKEN.IMPORTALL:
+            self.index += 1
+            name = self.expect(TOKEN.FILENAME)
+            return self.mark(AST.IMPORT(name=name, importlist=None), start)
+        self.skip(TOKEN.FROM)
+        name = self.expect(TOKEN.FILENAME)
+        self.skip(TOKEN.IMPORT)
+        importlist = [self.import_name()]
+        while self.peek() == TOKEN.COMMA:
+            # COMMA >> ImportName moves the name to the ','
+            comma = self.index
+            self.index += 1
+            importlist.append(self.mark(self.import_name(), comma))
+        return self.mark(AST.IMPORT(name=name, importlist=importlist), start)
+
+    def any_id(self):
+        if self.peek() not in ANY_ID:
+            raise NoParse()
+        return self.take()
+
+    def import_name(self):
+        start = self.index
+        name = self.any_id()
+        alias = None
+        if self.peek() == TOKEN.AS:
+            self.index += 1
+            alias = self.any_id()
+        return self.mark(AST.IMPORTNAME(name=name, alias=alias), start)
+
+    # DECLS =============================================================
+    def decl(self):
+        start = self.index
+        typ = self.peek()
+        if typ in VARDECL_FIRST:
+            val = self.var_decl()
+        elif typ == TOKEN.IDENTIFIER:
+            val = self.fun_decl()
+        elif typ == TOKEN.TYPESYN:
+            val = self.type_syn()
+        elif typ == TOKEN.PREFIX:
+            val = self.prefix_op_decl()
+        else:
+            val = self.infix_op_decl()
+        return self.mark(AST.DECL(val=val), start)
+
+    def var_decl(self):
+        start = self.index
+        if self.peek() == TOKEN.VAR:
+            self.index += 1
+            typ = None
+        else:
+            typ = self.type()
+        varname = self.expect(TOKEN.IDENTIFIER)
+        self.expect_op("=")
+        found_expr = self.exp()
+        self.skip(TOKEN.SEMICOLON)
+        return self.mark(AST.VARDECL(type=typ, id=varname, expr=found_expr), start)
+
+    def fun_body(self):
+        self.skip(TOKEN.CURL_OPEN)
+        decls = []
+        while self.peek() in VARDECL_FIRST:
+            decls.append(self.var_decl())
+        found_stmts = self.stmts()
+        if not found_stmts:
+            raise NoParse()
+        self.skip(TOKEN.CURL_CLOSE)
+        return decls, found_stmts
+
+    def fun_decl(self):
+        start = self.index
+        fname = self.expect(TOKEN.IDENTIFIER)
+        self.skip(TOKEN.PAR_OPEN)
+        args = []
+        if self.peek() == TOKEN.IDENTIFIER:
+            args.append(self.expect(TOKEN.IDENTIFIER))
+            while self.peek() == TOKEN.COMMA:
+                self.index += 1
+                args.append(self.expect(TOKEN.IDENTIFIER))
+        self.skip(TOKEN.PAR_CLOSE)
+        typesig = self.fun_type_sig(self.fun_type) if self.peek_op("::") else None
+        decls, found_stmts = self.fun_body()
+        return self.mark(AST.FUNDECL(kind=FunKind.FUNC, fixity=None, id=fname, params=args, type=typesig, vardecls=decls, stmts=found_stmts), start)
+
+    def prefix_op_decl(self):
+        start = self.index
+        self.skip(TOKEN.PREFIX)
+        operator = self.expect(TOKEN.OP_IDENTIFIER)
+        self.skip(TOKEN.PAR_OPEN)
+        varname = self.expect(TOKEN.IDENTIFIER)
+        self.skip(TOKEN.PAR_CLOSE)
+        typesig = self.fun_type_sig(self.pre_fun_type) if self.peek_op("::") else None
+        decls, found_stmts = self.fun_body()
+        return self.mark(AST.FUNDECL(kind=FunKind.PREFIX, fixity=None, id=operator, params=[varname], type=typesig, vardecls=decls, stmts=found_stmts), start)
+
+    def infix_op_decl(self):
+        start = self.index
+        if self.peek() == TOKEN.INFIXL:
+            found_kind = FunKind.INFIXL
+        elif self.peek() == TOKEN.INFIXR:
+            found_kind = FunKind.INFIXR
+        else:
+            raise NoParse()
+        self.index += 1
+        found_fixity = self.expect(TOKEN.INT)
+        operator = self.expect(TOKEN.OP_IDENTIFIER)
+        self.skip(TOKEN.PAR_OPEN)
+        a = self.expect(TOKEN.IDENTIFIER)
+        self.skip(TOKEN.COMMA)
+        b = self.expect(TOKEN.IDENTIFIER)
+        self.skip(TOKEN.PAR_CLOSE)
+        typesig = self.fun_type_sig(self.inf_fun_type) if self.peek_op("::") else None
+        decls, found_stmts = self.fun_body()
+        return self.mark(AST.FUNDECL(kind=found_kind, fixity=found_fixity, id=operator, params=[a,b], type=typesig, vardecls=decls, stmts=found_stmts), start)
+
+    def type_syn(self):
+        start = self.index
+        self.skip(TOKEN.TYPESYN)
+        identifier = self.expect(TOKEN.TYPE_IDENTIFIER)
+        self.expect_op("=")
+        other_type = self.type()
+        return self.mark(AST.TYPESYN(type_id=identifier, def_type=other_type), start)
+
+    # TYPES =============================================================
+    def type(self):
+        start = self.index
+        typ = self.peek()
+        if typ == TOKEN.TYPE_IDENTIFIER:
+            tok = self.take()
+            if tok.val in BASIC_TYPES:
+                val = self.mark(AST.BASICTYPE(type_id=tok), start)
+            else:
+                val = tok
+        elif typ == TOKEN.PAR_OPEN:
+            self.index += 1
+            el1 = self.type()
+            self.skip(TOKEN.COMMA)
+            el2 = self.type()
+            self.skip(TOKEN.PAR_CLOSE)
+            val = self.mark(AST.TUPLETYPE(a=el1, b=el2), start)
+        elif typ == TOKEN.BRACK_OPEN:
+            self.index += 1
+            a = self.type()
+            self.skip(TOKEN.BRACK_CLOSE)
+            val = self.mark(AST.LISTTYPE(type=a), start)
+        else:
+            raise NoParse()
+        return self.mark(AST.TYPE(val=val), start)
+
+    def fun_type_sig(self, fun_type):
+        # The FUNTYPE takes the position of the '::', like in FunTypeSig
+        start = self.index
+        self.expect_op("::")
+        return self.mark(fun_type(), start)
+
+    def fun_type(self):
+        a = []
+        while self.peek() in TYPE_FIRST:
+            a.append(self.type())
+        self.expect_op("->")
+        # RetType: a Void return type gives the same TYPE node as any other type identifier
+        b = self.type()
+        return AST.FUNTYPE(from_types=a, to_type=b)
+
+    def pre_fun_type(self):
+        a = self.type()
+        self.expect_op("->")
+        b = self.type()
+        return AST.FUNTYPE(from_types=[a], to_type=b)
+
+    def inf_fun_type(self):
+        a = self.type()
+        b = self.type()
+        self.expect_op("->")
+        out = self.type()
+        return AST.FUNTYPE(from_types=[a, b], to_type=out)
+
+    # CONTROL FLOW ======================================================
+    def stmts(self):
+        found_stmts = []
+        while self.peek() in STMT_FIRST:
+            found_stmts.append(self.stmt())
+        return found_stmts
+
+    def block(self):
+        self.skip(TOKEN.CURL_OPEN)
+        contents = self.stmts()
+        self.skip(TOKEN.CURL_CLOSE)
+        return contents
+
+    def cond(self):
+        self.skip(TOKEN.PAR_OPEN)
+        condition = self.exp()
+        self.skip(TOKEN.PAR_CLOSE)
+        return condition
+
+    def stmt(self):
+        start = self.index
+        typ = self.peek()
+        if typ == TOKEN.IF:
+            self.index += 1
+            condition = self.cond()
+            # The first branch is built inside StmtIfElse, so it never gets a position
+            condbranches = [AST.CONDBRANCH(expr=condition, stmts=self.block())]
+            while self.peek() == TOKEN.ELIF:
+                branch_start = self.index
+                self.index += 1
+                condition = self.cond()
+                condbranches.append(self.mark(AST.CONDBRANCH(expr=condition, stmts=self.block()), branch_start))
+            if self.peek() == TOKEN.ELSE:
+                branch_start = self.index
+                self.index += 1
+                condbranches.append(self.mark(AST.CONDBRANCH(expr=None, stmts=self.block()), branch_start))
+            val = AST.IFELSE(condbranches=condbranches)
+        elif typ == TOKEN.WHILE:
+            self.index += 1
+            condition = self.cond()
+            val = AST.LOOP(init=None, cond=condition, update=None, stmts=self.block())
+        elif typ == TOKEN.FOR:
+            self.index += 1
+            self.skip(TOKEN.PAR_OPEN)
+            initial = self.act_stmt() if self.peek() == TOKEN.IDENTIFIER else None
+            self.skip(TOKEN.SEMICOLON)
+            condition = self.exp() if self.peek() in EXP_FIRST else None
+            self.skip(TOKEN.SEMICOLON)
+            update = self.act_stmt() if self.peek() == TOKEN.IDENTIFIER else None
+            self.skip(TOKEN.PAR_CLOSE)
+            val = AST.LOOP(init=initial, cond=condition, update=update, stmts=self.block())
+        elif typ == TOKEN.IDENTIFIER:
+            val = self.act_stmt()
+            self.skip(TOKEN.SEMICOLON)
+        elif typ == TOKEN.RETURN:
+            self.index += 1
+            found_expr = self.exp() if self.peek() in EXP_FIRST else None
+            self.skip(TOKEN.SEMICOLON)
+            val = AST.RETURN(expr=found_expr)
+        elif typ == TOKEN.BREAK:
+            self.index += 1
+            self.skip(TOKEN.SEMICOLON)
+            val = AST.BREAK()
+        else:
+            self.skip(TOKEN.CONTINUE)
+            self.skip(TOKEN.SEMICOLON)
+            val = AST.CONTINUE()
+        self.mark(val, start)
+        return self.mark(AST.STMT(val=val), start)
+
+    def act_stmt(self):
+        start = self.index
+        if self.peek(1) == TOKEN.PAR_OPEN:
+            val = self.fun_call()
+        else:
+            var = self.id_field()
+            self.expect_op("=")
+            expression = self.exp()
+            val = self.mark(AST.ASSIGNMENT(varref=var, expr=expression), start)
+        return self.mark(AST.ACTSTMT(val=val), start)
+
+    # EXPRESSIONS =======================================================
+    def exp(self):
+        start = self.index
+        contents = [self.conv_exp()]
+        while self.peek() == TOKEN.OP_IDENTIFIER:
+            contents.append(self.take())
+            contents.append(self.conv_exp())
+        return self.mark(AST.DEFERREDEXPR(contents=contents), start)
+
+    def conv_exp(self):
+        start = self.index
+        typ = self.peek()
+        if typ == TOKEN.IDENTIFIER:
+            if self.peek(1) == TOKEN.PAR_OPEN:
+                return self.fun_call()
+            return self.id_field()
+        elif typ == TOKEN.OP_IDENTIFIER:
+            op = self.take()
+            exp = self.conv_exp()
+            return self.mark(AST.FUNCALL(kind=FunKind.PREFIX, id=op, args=[AST.DEFERREDEXPR(contents=[exp])]), start)
+        elif typ in LITERALS:
+            return self.take()
+        elif typ == TOKEN.PAR_OPEN:
+            self.index += 1
+            a = self.exp()
+            if self.peek() == TOKEN.PAR_CLOSE:
+                self.index += 1
+                # ExpSubTup returns the inner expression, moving it to the '('
+                return self.mark(a, start)
+            comma = self.index
+            self.skip(TOKEN.COMMA)
+            b = self.mark(self.exp(), comma)
+            self.skip(TOKEN.PAR_CLOSE)
+            return self.mark(AST.TUPLE(a=a, b=b), start)
+        raise NoParse()
+
+    def fun_call(self):
+        start = self.index
+        fname = self.expect(TOKEN.IDENTIFIER)
+        self.skip(TOKEN.PAR_OPEN)
+        found_args = []
+        if self.peek() in EXP_FIRST:
+            found_args.append(self.exp())
+            while self.peek() == TOKEN.COMMA:
+                # COMMA >> Exp moves the argument to the ','
+                comma = self.index
+                self.index += 1
+                found_args.append(self.mark(self.exp(), comma))
+        self.skip(TOKEN.PAR_CLOSE)
+        return self.mark(AST.FUNCALL(id=fname, kind=FunKind.FUNC, args=found_args), start)
+
+    def id_field(self):
+        start = self.index
+        i = self.expect(TOKEN.IDENTIFIER)
+        found_fields = []
+        while self.peek() == TOKEN.ACCESSOR:
+            found_fields.append(self.take())
+        return self.mark(AST.VARREF(id=i, fields=found_fields), start)
+
+
+def parseDescent(tokens):
+    '''Parse a TokenBuffer (or list of tokens) into an AST.SPL. Returns None on a syntax error.'''
+    if not isinstance(tokens, TokenBuffer):
+        tokens = TokenBuffer(tokens)
+    try:
+        return DescentParser(tokens).spl()
+    except NoParse:
+        return None
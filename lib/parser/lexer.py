@@ -13,6 +13,7 @@ from lib.datastructure.position import Position
 from lib.util.util import pointToLine
 
 import codecs
+from collections import OrderedDict
 '''
 TODO
 Refactor tokenize along repeating pattern to improve readability
@@ -82,6 +83,30 @@ REG_FIL = re.compile(r"[a-zA-Z0-9_-]+")
 
 REG_KEYWORD_END = re.compile(r"[^a-zA-Z0-9]|$")
 
+# Token table for the regex engine. Alternatives are tried in order, which mirrors the order of the prefix tests in tokenize_prefix.
+# Keywords are alphanumeric, so they are recognised by looking up the alphanumeric part (the WORD group) of an identifier match.
+LEXER_TABLE = [
+    ("WHITESPACE", r"\s+"),
+    ("COMMENT_SINGLE", re.escape(COMMENT_SINGLE)),
+    ("COMMENT_START", re.escape(COMMENT_START)),
+    ("IDENTIFIER", r"(?P<ID_WORD>[a-z][a-zA-Z0-9]*)[a-zA-Z0-9_]*"),
+    ("TYPE_IDENTIFIER", r"(?P<TYP_WORD>[A-Z][a-zA-Z0-9]*)[a-zA-Z0-9_]*"),
+    ("EMPTY_LIST", re.escape("[]") + "(?=" + REG_KEYWORD_END.pattern + ")"),
+    ("SYMBOL", "[" + re.escape("".join(SCOPING_SYMBOLS)) + "]"),
+    ("OP_IDENTIFIER", REG_OP.pattern),
+    ("INT", REG_INT.pattern),
+    ("STRING", REG_STR.pattern),
+    ("CHAR", REG_CHR.pattern),
+    ("ACCESSOR", "|".join(map(re.escape, ACCESSORS))),
+]
+
+def build_master_regex(table):
+    return re.compile("|".join("(?P<{}>{})".format(name, pattern) for name, pattern in table))
+
+REG_LEXER = build_master_regex(LEXER_TABLE)
+# Directly after "from" or "importall" a filename takes precedence over everything but whitespace and comments
+REG_LEXER_IMPORT = build_master_regex(LEXER_TABLE[:3] + [("FILENAME", REG_FIL.pattern)] + LEXER_TABLE[3:])
+
 
 # Choice: Keywords and value/type literals should be followed by a non-alphanumeric character
 # Choice: Accessors cannot be preceded by whitespace
@@ -120,13 +145,13 @@ def prefix_symbol(string):
 def prefix_identifier(string):
     tempmatch = REG_ID.match(string)
     if tempmatch:
-        found_id = tempmatch.group(0)
+        found_id = sys.intern(tempmatch.group(0))
         rest = string[len(found_id):]
         if REG_KEYWORD_END.match(rest):  # Should always happen?
             return (True, rest, TOKEN.IDENTIFIER, found_id)
     tempmatch = REG_TYP.match(string)
     if tempmatch:
-        found_id = tempmatch.group(0)
+        found_id = sys.intern(tempmatch.group(0))
         rest = string[len(found_id):]
         if REG_KEYWORD_END.match(rest):  # Should always happen?
             return (True, rest, TOKEN.TYPE_IDENTIFIER, found_id)
@@ -136,7 +161,7 @@ def prefix_identifier(string):
 def prefix_op_identifier(string):
     tempmatch = REG_OP.match(string)
     if tempmatch:
-        found_id = tempmatch.group(0)
+        found_id = sys.intern(tempmatch.group(0))
         rest = string[len(found_id):]
         return (True, rest, TOKEN.OP_IDENTIFIER, found_id)
     return (False, None, None, None)
@@ -180,23 +205,21 @@ def prefix_accessor(string):
     return (False, None, None, None)
 
 
-def tokenize(inputstream):
+def tokenize_prefix(inputstream):
     FLAG_SKIPPED_WHITESPACE = True
     FLAG_MULTI_COMMENT = False
     FLAG_IN_IMPORT = False
     ERRORS_OCCURRED = False
 
-    pos = Position()
-
     curdata = ""
-    for line in inputstream:
+    for line_no, line in enumerate(inputstream, 1):
         curdata = line
 
         FLAG_SKIPPED_WHITESPACE = True  # Newline is considered whitespace
         FLAG_IN_IMPORT = False  # No filename for import on new line
 
         while len(curdata) > 0:
-            pos.col = len(line) - len(curdata) + 1
+            col = len(line) - len(curdata) + 1
 
             if not FLAG_MULTI_COMMENT:  # Not currently in a multiline comment
                 # Test for whitespace
@@ -224,7 +247,7 @@ def tokenize(inputstream):
                 if FLAG_IN_IMPORT:
                     found, strippeddata, temptoken, val = prefix_filename(curdata)
                     if found:
-                        yield (Token(pos.copy(), temptoken, val))
+                        yield (Token(Position(line_no, col), temptoken, val))
                         FLAG_SKIPPED_WHITESPACE = False
                         FLAG_IN_IMPORT = False
                         # Modify string
@@ -234,7 +257,7 @@ def tokenize(inputstream):
                 # Test for keyword tokens
                 found, strippeddata, temptoken, val = prefix_keyword(curdata)
                 if found:
-                    yield (Token(pos.copy(), temptoken, val))
+                    yield (Token(Position(line_no, col), temptoken, val))
                     FLAG_SKIPPED_WHITESPACE = False
                     FLAG_IN_IMPORT = False
 
@@ -247,7 +270,7 @@ def tokenize(inputstream):
                 # Test for symbols
                 found, strippeddata, temptoken = prefix_symbol(curdata)
                 if found:
-                    yield (Token(pos.copy(), temptoken, None))
+                    yield (Token(Position(line_no, col), temptoken, None))
                     FLAG_SKIPPED_WHITESPACE = False
                     FLAG_IN_IMPORT = False
                     # Modify string
@@ -257,7 +280,7 @@ def tokenize(inputstream):
                 # Test for identifiers
                 found, strippeddata, temptoken, val = prefix_identifier(curdata)
                 if found:
-                    yield (Token(pos.copy(), temptoken, val))
+                    yield (Token(Position(line_no, col), temptoken, val))
                     FLAG_SKIPPED_WHITESPACE = False
                     FLAG_IN_IMPORT = False
                     # Modify string
@@ -267,7 +290,7 @@ def tokenize(inputstream):
                 # Test for operator identifiers
                 found, strippeddata, temptoken, val = prefix_op_identifier(curdata)
                 if found:
-                    yield (Token(pos.copy(), TOKEN.OP_IDENTIFIER, val))
+                    yield (Token(Position(line_no, col), TOKEN.OP_IDENTIFIER, val))
                     FLAG_SKIPPED_WHITESPACE = False
                     FLAG_IN_IMPORT = False
                     # Modify string
@@ -277,7 +300,7 @@ def tokenize(inputstream):
                 # Test for value literal
                 found, strippeddata, temptoken, val = prefix_val_literal(curdata)
                 if found:
-                    yield (Token(pos.copy(), temptoken, val))
+                    yield (Token(Position(line_no, col), temptoken, val))
                     FLAG_SKIPPED_WHITESPACE = False
                     FLAG_IN_IMPORT = False
                     # Modify string
@@ -287,7 +310,7 @@ def tokenize(inputstream):
                 if not FLAG_SKIPPED_WHITESPACE:
                     found, strippeddata, temptoken, val = prefix_accessor(curdata)
                     if found:
-                        yield (Token(pos.copy(), temptoken, val))
+                        yield (Token(Position(line_no, col), temptoken, val))
                         FLAG_SKIPPED_WHITESPACE = False
                         FLAG_IN_IMPORT = False
                         # Modify data
@@ -307,7 +330,7 @@ def tokenize(inputstream):
                     curdata = curdata[1:]
                     continue
 
-            sys.stderr.write("Lexing error:\n{}\nInvalid syntax\n\n".format(pointToLine(line, pos)))
+            sys.stderr.write("Lexing error:\n{}\nInvalid syntax\n\n".format(pointToLine(line, Position(line_no, col))))
             ERRORS_OCCURRED = True
             '''
             TODO
@@ -318,25 +341,115 @@ def tokenize(inputstream):
             '''
             break
 
-        pos.line += 1
+    if ERRORS_OCCURRED:
+        exit(1)
+
+
+'''
+Single pass lexer: one match of the master regex per token, driven by offsets into the line instead of slicing off the rest.
+Produces exactly the same tokens, positions and errors as tokenize_prefix.
+'''
+def tokenize_regex(inputstream):
+    FLAG_MULTI_COMMENT = False
+    ERRORS_OCCURRED = False
+
+    for line_no, line in enumerate(inputstream, 1):
+        FLAG_SKIPPED_WHITESPACE = True  # Newline is considered whitespace
+        FLAG_IN_IMPORT = False  # No filename for import on new line
+
+        ix = 0
+        line_len = len(line)
+        while ix < line_len:
+            if FLAG_MULTI_COMMENT:
+                end_ix = line.find(COMMENT_END, ix)
+                if end_ix == -1:
+                    break  # The rest of the line is comment
+                ix = end_ix + len(COMMENT_END)
+                FLAG_SKIPPED_WHITESPACE = True
+                FLAG_MULTI_COMMENT = False
+                continue
+
+            match = (REG_LEXER_IMPORT if FLAG_IN_IMPORT else REG_LEXER).match(line, ix)
+            kind = match.lastgroup if match is not None else None
+
+            if kind == "WHITESPACE":
+                FLAG_SKIPPED_WHITESPACE = True
+                ix = match.end()
+                continue
+            elif kind == "COMMENT_SINGLE":
+                break  # We can discard the entire line from here on
+            elif kind == "COMMENT_START":
+                FLAG_SKIPPED_WHITESPACE = True
+                FLAG_MULTI_COMMENT = True
+                ix = match.end()
+                continue
+            elif kind == "ACCESSOR" and FLAG_SKIPPED_WHITESPACE:
+                kind = None # Accessors cannot be preceded by whitespace
+
+            if kind is None:
+                sys.stderr.write("Lexing error:\n{}\nInvalid syntax\n\n".format(pointToLine(line, Position(line_no, ix + 1))))
+                ERRORS_OCCURRED = True
+                break
+
+            pos = Position(line_no, ix + 1)
+            FLAG_SKIPPED_WHITESPACE = False
+            FLAG_IN_IMPORT = False
+            ix = match.end()
+
+            if kind == "IDENTIFIER" or kind == "TYPE_IDENTIFIER":
+                word_group = "ID_WORD" if kind == "IDENTIFIER" else "TYP_WORD"
+                word = match.group(word_group)
+                temptoken = COMBINED_KEYWORDS.get(word)
+                if temptoken is not None: # Keyword, possibly followed directly by an underscore
+                    yield Token(pos, temptoken, (word == "True") if word in BOOLS else None)
+                    ix = match.end(word_group)
+                    if temptoken is TOKEN.FROM or temptoken is TOKEN.IMPORTALL:
+                        FLAG_IN_IMPORT = True
+                else:
+                    yield Token(pos, TOKEN[kind], sys.intern(match.group()))
+            elif kind == "SYMBOL":
+                yield Token(pos, SCOPING_SYMBOLS[match.group()], None)
+            elif kind == "OP_IDENTIFIER":
+                yield Token(pos, TOKEN.OP_IDENTIFIER, sys.intern(match.group()))
+            elif kind == "INT":
+                yield Token(pos, TOKEN.INT, int(match.group()))
+            elif kind == "STRING" or kind == "CHAR":
+                yield Token(pos, TOKEN[kind], codecs.getdecoder("unicode_escape")(match.group())[0][1:-1])
+            elif kind == "EMPTY_LIST":
+                yield Token(pos, TOKEN.EMPTY_LIST, None)
+            elif kind == "ACCESSOR":
+                yield Token(pos, TOKEN.ACCESSOR, match.group())
+            elif kind == "FILENAME":
+                yield Token(pos, TOKEN.FILENAME, match.group())
 
     if ERRORS_OCCURRED:
         exit(1)
 
 
+LEXER_ENGINES = OrderedDict([
+    ("prefix", tokenize_prefix),
+    ("regex", tokenize_regex),
+])
+DEFAULT_LEXER_ENGINE = "prefix"
+
+def tokenize(inputstream, engine=DEFAULT_LEXER_ENGINE):
+    return LEXER_ENGINES[engine](inputstream)
+
+
 if __name__ == "__main__":
     from argparse import ArgumentParser
 
     argparser = ArgumentParser(description="SPL Lexer")
     argparser.add_argument("infile", metavar="INPUT", help="Input file", nargs="?",
                            default="../../example programs/p1_example.spl")
+    argparser.add_argument("--lexer", help="Lexer engine to use", choices=list(LEXER_ENGINES), default=DEFAULT_LEXER_ENGINE)
     args = argparser.parse_args()
 
     with open(args.infile, "r") as infile:
 
         cur = None
 
-        for t in tokenize(infile):
+        for t in tokenize(infile, engine=args.lexer):
             if cur is None:
                 cur = t.pos.line
             if t.pos.line != cur:
@@ -44,6 +44,9 @@ TOKEN_SYNTAX = {
 class ParseErrorHandler():
 
     def __init__(self):
+        # In lazy mode failures only move error_index forward. The expected set is
+        # collected by a second parse, once the first one has actually failed.
+        self.lazy = False
         self.reset()
 
     def reset(self):
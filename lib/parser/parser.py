@@ -5,11 +5,12 @@ import sys
 import os
 sys.path.insert(0, os.path.join(sys.path[0],'../../'))
 
-from lib.datastructure.token import TOKEN, Token
+from lib.datastructure.token import TOKEN, Token, TokenBuffer
 import parsec as ps
 from lib.datastructure.AST import AST, FunKind, Accessor
 from lib.debug.AST_prettyprinter import flatten, printAST
 from lib.parser.parse_error_handler import ParseError
+from lib.parser.descent_parser import parseDescent
 
 
 @ps.generate
@@ -413,9 +414,18 @@ def ActStmt():
 
 
 
-def parseTokenStream(instream, infile):
+PARSER_BACKENDS = ["combinator", "descent"]
+DEFAULT_PARSER_BACKEND = "combinator"
+
+def parseTokenStream(instream, infile, packrat=False, backend=DEFAULT_PARSER_BACKEND):
+    # Tokens are packed into the buffer one at a time as the lexer produces them
+    tokens = instream if isinstance(instream, TokenBuffer) else TokenBuffer(instream)
+    ast = parseDescent(tokens) if backend == "descent" else None
+    if ast is not None:
+        return ast
+    # The combinator grammar also produces the error report for the descent parser
     try:
-        ast = SPL.parse_strict(list(instream), infile)
+        ast = SPL.parse_strict(tokens, infile, packrat=packrat)
     except ParseError as e:
         print(e, file=sys.stderr)
         exit()
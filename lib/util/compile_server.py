@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+'''
+Compile server: a long-lived process that has already imported the compiler, so that a compile or link
+only costs the compilation itself instead of interpreter startup and module imports.
+Requests are served by a forked child of the warmed-up server, so no state carries over between requests.
+
+Protocol, over a Unix socket, one request per connection:
+client -> server: one line of JSON {"tool": "gsc"|"gsl", "argv": [...], "cwd": ..., "env": {...}}
+server -> client: one line of JSON {"code": ..., "stdout": ..., "stderr": ...}
+
+This module only imports the standard library until the server is started, so the client stays cheap.
+'''
+
+import os
+import io
+import sys
+import json
+import socket
+import tempfile
+
+SERVER_SOCKET_ENV_VAR_NAME = "SPL_SERVER_SOCKET"
+SERVER_TOOLS = ["gsc", "gsl"]
+
+# Environment variables that change the outcome of a compile, passed along with every request
+FORWARDED_ENV_VAR_NAMES = ["SPL_PATH"]
+
+WARMUP_PROGRAM = "main () :: -> Int {\n    print(1 + 1);\n    return 0;\n}\n"
+
+def default_socket_path():
+    if SERVER_SOCKET_ENV_VAR_NAME in os.environ:
+        return os.environ[SERVER_SOCKET_ENV_VAR_NAME]
+    return os.path.join(tempfile.gettempdir(), "gsc-{}.sock".format(os.getuid()))
+
+def exit_code(e):
+    if e.code is None:
+        return 0
+    return e.code if isinstance(e.code, int) else 1
+
+def run_tool(tool, argv):
+    '''Run the main function of gsc.py or gsl.py in this process, returning its exit code'''
+    if tool == "gsc":
+        from gsc import main
+    else:
+        from gsl import main
+    try:
+        main(argv)
+    except SystemExit as e:
+        return exit_code(e)
+    return 0
+
+def server_running(socket_path):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+def request(tool, argv, socket_path=None):
+    '''Have the server run a tool. Returns the response, or None if no server is listening'''
+    packet = {
+        "tool": tool,
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "env": {k: os.environ[k] for k in FORWARDED_ENV_VAR_NAMES if k in os.environ}
+    }
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path if socket_path is not None else default_socket_path())
+    except OSError:
+        return None
+    with sock, sock.makefile("rwb") as stream:
+        stream.write(json.dumps(packet).encode("utf-8") + b"\n")
+        stream.flush()
+        line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line.decode("utf-8"))
+
+def handle_request(packet):
+    from contextlib import redirect_stdout, redirect_stderr
+    out = io.StringIO()
+    err = io.StringIO()
+
+    if packet.get("tool") not in SERVER_TOOLS or not isinstance(packet.get("argv"), list):
+        return {"code": 2, "stdout": "", "stderr": "Invalid compile server request\n"}
+    try:
+        os.chdir(packet["cwd"])
+    except OSError as e:
+        return {"code": 2, "stdout": "", "stderr": "Could not enter directory {}: {}\n".format(packet["cwd"], e)}
+    for k in FORWARDED_ENV_VAR_NAMES:
+        if k in packet["env"]:
+            os.environ[k] = packet["env"][k]
+        elif k in os.environ:
+            del os.environ[k]
+
+    with redirect_stdout(out), redirect_stderr(err):
+        try:
+            code = run_tool(packet["tool"], packet["argv"])
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            code = 1
+    return {"code": code, "stdout": out.getvalue(), "stderr": err.getvalue()}
+
+def warm_up():
+    # Compile a small program once, so whatever is built lazily is already there in every forked child
+    from contextlib import redirect_stdout, redirect_stderr
+    from lib.analysis.error_handler import ERROR_HANDLER
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "warmup.spl")
+        with open(path, "w") as f:
+            f.write(WARMUP_PROGRAM)
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            run_tool("gsc", [path, "--stdout"])
+    ERROR_HANDLER.errors = []
+    ERROR_HANDLER.warnings = []
+
+def serve(socket_path=None):
+    import socketserver
+
+    socket_path = socket_path if socket_path is not None else default_socket_path()
+
+    class CompileRequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                packet = json.loads(self.rfile.readline().decode("utf-8"))
+            except ValueError:
+                return
+            self.wfile.write(json.dumps(handle_request(packet)).encode("utf-8") + b"\n")
+
+    class CompileServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+        pass
+
+    # Remove the socket of a server that is no longer running
+    if os.path.exists(socket_path):
+        if server_running(socket_path):
+            print("A compile server is already listening on {}".format(socket_path), file=sys.stderr)
+            return 1
+        os.unlink(socket_path)
+
+    warm_up()
+
+    old_umask = os.umask(0o177) # Only the current user can connect
+    try:
+        server = CompileServer(socket_path, CompileRequestHandler)
+    finally:
+        os.umask(old_umask)
+
+    print("Compile server listening on {}".format(socket_path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+    return 0
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
-from io import SEEK_SET
+import re
+import mmap
+from array import array
+from io import SEEK_SET, UnsupportedOperation
 from lib.datastructure.token import Token
 from lib.datastructure.AST import AST
 
@@ -61,20 +64,49 @@ def iterative_topological_sort(graph, start,path=set()):
 
     return ans
 
-'''
-How to make this O(1):
-Read the tokens in byte mode so you can .tell()
-Then .decode("utf-8") to use the line
-Store a list containing the offsets for each line (or just use the first token that has a new one as a start of the line)
-You can use this offset to seek in this function in O(1) given that the file is in byte mode.
-'''
-def pointToPosition(instream, position): # Could be made O(1) instead of O(n) with some work
-    instream.seek(0, SEEK_SET)
+class SourceMap():
+    '''
+    Index of the line starts of a source, so a line can be fetched in O(1).
+    Files on disk are memory mapped, other streams (like StringIO) are read into memory.
+    The index is only built when the first line is requested, so a clean compile never pays for it.
+    '''
+    def __init__(self, instream):
+        self.instream = instream
+        self.data = None
+        self.offsets = None
+        self.encoding = getattr(instream, "encoding", None) or "utf-8"
+
+    def build(self):
+        try:
+            self.data = mmap.mmap(self.instream.fileno(), 0, access=mmap.ACCESS_READ)
+            # Same line breaks as a file opened in text mode
+            breaks = re.finditer(rb"\r\n?|\n", self.data)
+        except (AttributeError, OSError, ValueError, UnsupportedOperation):
+            # Not a file or an empty one: read the text, leaving the stream where it was
+            current = self.instream.tell()
+            self.instream.seek(0, SEEK_SET)
+            self.data = self.instream.read()
+            self.instream.seek(current, SEEK_SET)
+            breaks = re.finditer("\n", self.data)
+        self.offsets = array('Q', [0])
+        self.offsets.extend(match.end() for match in breaks)
+
+    def line(self, line_no):
+        '''The text of line `line_no` (1-based), including the line break, or "" past the end.'''
+        if self.offsets is None:
+            self.build()
+        ix = max(line_no, 1) - 1
+        if ix >= len(self.offsets):
+            return ""
+        end = self.offsets[ix + 1] if ix + 1 < len(self.offsets) else len(self.data)
+        text = self.data[self.offsets[ix]:end]
+        return text.decode(self.encoding, errors="replace") if type(text) is bytes else text
 
-    for _ in range(position.line - 1):
-        instream.readline()
-    line = instream.readline()
-    return pointToLine(line, position)
+def pointToPosition(source, position):
+    # Pass a SourceMap when pointing more than once into the same source
+    if not isinstance(source, SourceMap):
+        source = SourceMap(source)
+    return pointToLine(source.line(position.line), position)
 
 def pointToLine(string, position):
     offset = position.col - 1
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+from lib.datastructure.AST import AST
+
+'''
+Visitors: walk an AST and call a handler for every node of the classes they have one for.
+A handler gets the node and returns the node to replace it with, or None to keep it.
+Nodes and lists are changed in place, and subtrees that cannot contain a handled class (according to AST.field_types)
+are not entered at all. Several visitors can be fused, so that one walk does the work of all of them.
+'''
+
+def reachableClasses():
+    # Node classes that can occur anywhere below a node of each class
+    direct = {cls: set(c for classes in fields.values() for c in classes) for (cls, fields) in AST.field_types.items()}
+    reachable = {}
+    for cls in direct:
+        seen = set()
+        openlist = list(direct[cls])
+        while openlist:
+            cur = openlist.pop()
+            if cur not in seen:
+                seen.add(cur)
+                openlist.extend(direct[cur])
+        reachable[cls] = frozenset(seen)
+    return reachable
+
+REACHABLE_CLASSES = reachableClasses()
+
+class Visitor():
+    '''
+    handlers maps node classes to a handler, or to a list of handlers that are called one after another.
+    With enter_handled=False the children of handled nodes are not walked, for handlers that take care of
+    the whole subtree themselves. Otherwise the children of the node the handlers returned are walked.
+    '''
+    def __init__(self, handlers, enter_handled=True):
+        self.dispatch = {cls: list(f) if type(f) is list else [f] for (cls, f) in handlers.items()}
+        self.enter_handled = {cls: enter_handled for cls in handlers}
+        self.prepare()
+
+    def prepare(self):
+        targets = set(self.dispatch)
+        # Classes worth entering, and classes worth looking at (handled, or with something handled below them)
+        self.entered = frozenset(cls for cls in AST.nodes if REACHABLE_CLASSES[cls] & targets)
+        self.relevant = frozenset(self.entered | targets)
+
+    '''
+    One visitor doing the work of all the given ones, calling the handlers in the order of the visitors.
+    A visitor that does not enter a class would hide the targets of the others below it, so that is not allowed.
+    '''
+    def fuse(*visitors):
+        fused = Visitor({})
+        for visitor in visitors:
+            others = set(cls for other in visitors if other is not visitor for cls in other.dispatch)
+            for cls, handlers in visitor.dispatch.items():
+                if not visitor.enter_handled[cls] and REACHABLE_CLASSES[cls] & others:
+                    raise Exception("Cannot fuse a visitor that does not enter {} with one that handles nodes below it".format(cls.__name__))
+                fused.dispatch.setdefault(cls, []).extend(handlers)
+                fused.enter_handled[cls] = fused.enter_handled.get(cls, True) and visitor.enter_handled[cls]
+        fused.prepare()
+        return fused
+
+    def walk(self, node):
+        typ = type(node)
+        if typ is list:
+            for ix, el in enumerate(node):
+                if type(el) is list or type(el) in self.relevant:
+                    res = self.walk(el)
+                    if res is not el:
+                        node[ix] = res
+            return node
+
+        handlers = self.dispatch.get(typ)
+        if handlers is not None:
+            for f in handlers:
+                res = f(node)
+                if res is not None:
+                    node = res
+            if not self.enter_handled[typ]:
+                return node
+            typ = type(node)
+
+        if typ in self.entered:
+            for name in typ._fields:
+                val = getattr(node, name)
+                if type(val) is list or type(val) in self.relevant:
+                    res = self.walk(val)
+                    if res is not val:
+                        setattr(node, name, res)
+        return node
@@ -8,10 +8,11 @@ A universal Python parser combinator library inspired by Parsec library of Haske
 __author__ = 'He Tao, sighingnow@gmail.com'
 
 from functools import wraps
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from lib.util.util import pointToPosition
 from lib.parser.parse_error_handler import ParseErrorHandler, ParseError
 from lib.datastructure.AST import AST
+from lib.datastructure.token import TokenBuffer
 
 ##########################################################################
 # Definition the Value modelof parsec.py.
@@ -19,6 +20,29 @@ from lib.datastructure.AST import AST
 
 error_handler = ParseErrorHandler()
 
+# Upper bound on the number of (parser, index) results kept in packrat mode.
+# Parsing moves forward through the token list, so the oldest entries are the
+# first to be evicted once the bound is reached.
+PACKRAT_MEMO_SIZE = 1 << 16
+
+# Memo table of the parse that is currently running in packrat mode, None otherwise.
+packrat_memo = None
+
+class PackratMemo():
+    '''Bounded (parser_id, index) -> Value table, alive for a single parse.'''
+
+    def __init__(self, max_size=PACKRAT_MEMO_SIZE):
+        self.max_size = max_size
+        self.table = OrderedDict()
+
+    def get(self, key):
+        return self.table.get(key)
+
+    def put(self, key, value):
+        self.table[key] = value
+        if len(self.table) > self.max_size:
+            self.table.popitem(last=False)
+
 class Value(namedtuple('Value', 'status index value expected')):
     '''Represent the result of the Parser.'''
     @staticmethod
@@ -31,7 +55,11 @@ class Value(namedtuple('Value', 'status index value expected')):
         global error_handler
         '''Create failure value.'''
         result = Value(False, index, None, expected)
-        error_handler.push_error(result)
+        if error_handler.lazy:
+            if index > error_handler.error_index:
+                error_handler.error_index = index
+        else:
+            error_handler.push_error(result)
         return result
 
     def aggregate(self, other=None):
@@ -89,23 +117,38 @@ class Parser(object):
         if res.status:
             if type(res.value) in AST.nodes:
                 # TODO: Fix error for empty file
-                res.value._start_pos = text[index].pos
+                res.value._start_pos = text.pos(index)
         return res
 
     def parse(self, text):
         '''Parser a given string `text`.'''
         return self.parse_partial(text)[0]
 
-    def parse_partial(self, text, infile):
-        global error_handler
+    def parse_partial(self, text, infile, packrat=False):
+        global error_handler, packrat_memo
         '''Parse the longest possible prefix of a given string.
         Return a tuple of the result value and the rest of the string.
-        If failed, raise a ParseError. '''
-
-        res = self(text, 0)
+        If failed, raise a ParseError.
+        With `packrat` set, the results of memoizing parsers are cached for the
+        duration of this call, so no rule is applied twice at the same index. '''
+
+        if not isinstance(text, TokenBuffer):
+            text = TokenBuffer(text)
+        lazy, error_handler.lazy = error_handler.lazy, True
+        if packrat:
+            packrat_memo = PackratMemo()
+        try:
+            res = self(text, 0)
+        finally:
+            packrat_memo = None
+            error_handler.lazy = lazy
         if res.status:
             return (res.value, text[res.index:])
         else:
+            # Only the furthest failure index was tracked. Redo the parse without
+            # the memo, collecting every expected alternative along the way.
+            error_handler.reset()
+            self(text, 0)
             # Make error, reset error handler and raise error
             bounded_index = error_handler.error_index if len(text) > error_handler.error_index else len(text) - 1
             position = text[bounded_index].pos
@@ -113,7 +156,7 @@ class Parser(object):
             error_handler.reset()
             raise error
 
-    def parse_strict(self, text, infile):
+    def parse_strict(self, text, infile, packrat=False):
         global error_handler
         '''Parse the longest possible prefix of the entire given string.
         If the parser worked successfully and NONE text was rested, return the
@@ -122,7 +165,7 @@ class Parser(object):
         given text must be used.'''
         # pylint: disable=comparison-with-callable
         # Here the `<` is not comparison.
-        result = (self < eof()).parse_partial(text, infile)[0]
+        result = (self < eof()).parse_partial(text, infile, packrat=packrat)[0]
         error_handler.reset()
         return result
 
@@ -236,6 +279,10 @@ class Parser(object):
         '''Describe a parser, when it failed, print out the description text.'''
         return self | Parser(lambda _, index: Value.failure(index, description))
 
+    def memo(self):
+        '''Cache the results of this parser per index when parsing in packrat mode.'''
+        return MemoParser(self.fn)
+
     def __or__(self, other):
         '''Implements the `(|)` operator, means `choice`.'''
         return self.choice(other)
@@ -265,6 +312,26 @@ class Parser(object):
         return self.ends_with(other)
 
 
+class MemoParser(Parser):
+    '''
+    A Parser that looks its result up in the packrat memo before doing the
+    parsing work. Outside of packrat mode it behaves like a plain Parser.
+    '''
+
+    def __call__(self, text, index):
+        if packrat_memo is None:
+            return Parser.__call__(self, text, index)
+        key = (id(self), index)
+        res = packrat_memo.get(key)
+        if res is None:
+            res = Parser.__call__(self, text, index)
+            packrat_memo.put(key, res)
+        elif res.status and type(res.value) in AST.nodes:
+            # An enclosing parser may have moved the start position since.
+            res.value._start_pos = text.pos(index)
+        return res
+
+
 def parse(p, text, index):
     '''Parse a string and return the result or raise a ParseError.'''
     return p.parse(text, index)
@@ -346,6 +413,11 @@ def desc(p, description):
     return p.desc(description)
 
 
+def memo(p):
+    '''Cache the results of the parser `p` per index when parsing in packrat mode.'''
+    return p.memo()
+
+
 ##########################################################################
 # Parser Generator
 #
@@ -391,7 +463,7 @@ def generate(fn):
                 return endval(text, index)
             else:
                 return Value.success(index, endval)
-    return generated.desc(fn.__name__)
+    return generated.desc(fn.__name__).memo()
 
 
 ##########################################################################
@@ -596,14 +668,13 @@ def eof():
 
 
 def token(t, cond=None):
-    '''Parse a lexer token'''
+    '''Parse a lexer token from a TokenBuffer'''
     @Parser
     def token_parser(token_list, index):
+        # Only look at the type and value, the Token is built once it is consumed
         if index < len(token_list):
-            tok = token_list[index]
-
-            if tok.typ == t and (cond is None or cond(tok.val)):
-                return Value.success(index+1, tok)
+            if token_list.types[index] == t and (cond is None or cond(token_list.values[token_list.value_ids[index]])):
+                return Value.success(index+1, token_list[index])
             else:
                 return Value.failure(index, t)
         else:
@@ -6,14 +6,16 @@ from lib.datastructure.AST import AST, FunKind, FunUniq, FunKindToUniq
 from lib.datastructure.token import Token, TOKEN
 from lib.datastructure.position import Position
 from lib.datastructure.symbol_table import SymbolTable, ExternalTable
-from lib.datastructure.scope import NONGLOBALSCOPE
+from lib.datastructure.scope import NONGLOBALSCOPE, DeclaredBefore, declarationOrder
+from lib.datastructure.interned_types import internType, freezeType, sameType, VOID_TYPE_NODE
 
 from lib.builtins.types import BUILTIN_TYPES, VOID_TYPE
 from lib.builtins.functions import ENTRYPOINT_FUNCNAME
 from lib.builtins.builtin_mod import enrichExternalTable, BUILTINS_NAME
 from lib.builtins.operators import ILLEGAL_OP_IDENTIFIERS
 
-from lib.util.util import treemap, selectiveApply, iterative_topological_sort
+from lib.util.util import iterative_topological_sort
+from lib.util.visitor import Visitor
 
 from lib.parser.parser import parseTokenStream
 from lib.parser.lexer import tokenize
@@ -78,21 +80,22 @@ def normalizeType(main_modname, cur_modname, symbol_table, ext_table, own_define
             '''
         return x
 
+    type_visitor = Visitor({AST.TYPE: replace_other})
     if cur_modname == main_modname: # Normalize main module
         for globkey, glob_def in symbol_table.global_vars.items():
-            symbol_table.global_vars[globkey] = treemap(glob_def, lambda x: selectiveApply(AST.TYPE, x, replace_other), replace=True)#print(glob_def)
+            symbol_table.global_vars[globkey] = type_visitor.walk(glob_def)#print(glob_def)
 
         for functlist in symbol_table.functions.values():
             for func_def in functlist:
                 #print(func_def)
                 #print("FUNTION TYPE")
-                func_def['type'] = treemap(func_def['type'], lambda x: selectiveApply(AST.TYPE, x, replace_other), replace=True)
+                func_def['type'] = type_visitor.walk(func_def['type'])
                 for local_var_def in func_def["local_vars"].values():
-                    local_var_def.type = treemap(local_var_def.type, lambda x: selectiveApply(AST.TYPE, x, replace_other), replace=True)
+                    local_var_def.type = type_visitor.walk(local_var_def.type)
                 
                 # Normalize args
                 for arg_var_def in func_def["arg_vars"].values():
-                    arg_var_def['type'] = treemap(arg_var_def['type'], lambda x: selectiveApply(AST.TYPE, x, replace_other), replace=True)
+                    arg_var_def['type'] = type_visitor.walk(arg_var_def['type'])
                     #print("ARG VAR", arg_var_def)
                 
                 #print(func_def['type'])
@@ -102,7 +105,7 @@ def normalizeType(main_modname, cur_modname, symbol_table, ext_table, own_define
         #print("AYOO",cur_modname)
         for globkey, glob_dict in ext_table.global_vars.items():
             #print("PRE",globkey, glob_dict["module"], glob_dict)
-            glob_dict['type'] = treemap(glob_dict['type'], lambda x: selectiveApply(AST.TYPE, x, replace_other), replace=True)
+            glob_dict['type'] = type_visitor.walk(glob_dict['type'])
             #print("POST",globkey, glob_dict["module"], glob_dict)
             #print(ext_table.global_vars.items())
 
@@ -110,12 +113,12 @@ def normalizeType(main_modname, cur_modname, symbol_table, ext_table, own_define
             for func_def in functlist:
                 #print(func_def)
                 #print("FUNTION TYPE")
-                func_def['type'] = treemap(func_def['type'], lambda x: selectiveApply(AST.TYPE, x, replace_other), replace=True)
+                func_def['type'] = type_visitor.walk(func_def['type'])
                 for local_var_def in func_def["local_vars"].values():
-                    local_var_def.type = treemap(local_var_def.type, lambda x: selectiveApply(AST.TYPE, x, replace_other), replace=True)
+                    local_var_def.type = type_visitor.walk(local_var_def.type)
                 # Normalize args
                 for arg_var_def in func_def["arg_vars"].values():
-                    arg_var_def['type'] = treemap(arg_var_def['type'], lambda x: selectiveApply(AST.TYPE, x, replace_other), replace=True)
+                    arg_var_def['type'] = type_visitor.walk(arg_var_def['type'])
                 
     '''
     if type_id in symbol_table.type_syns:
@@ -148,7 +151,7 @@ def normalizeTypeSyn(typedef, type_entry, own_typesyns):
                 #print("In typedef",typedef,"rewriting",own_typesyns[found_mod][found_orig])
                 x.val = own_typesyns[found_mod][found_orig].val
         return x
-    treemap(typedef, lambda x: selectiveApply(AST.TYPE, x, replace_other), replace=True)
+    Visitor({AST.TYPE: replace_other}).walk(typedef)
     ERROR_HANDLER.checkpoint() # TODO This could be better
     #print("rewritten to",typedef)
 
@@ -161,7 +164,7 @@ def getTypeDependencies(def_type):
             found_orig = x.val.orig_id
             children[(found_mod, found_orig)] = None
 
-    treemap(def_type, lambda x: selectiveApply(AST.TYPE, x, get_child), replace=False)
+    Visitor({AST.TYPE: get_child}).walk(def_type)
     return list(children)
 
 # Resolve the used types to a module and original id
@@ -192,7 +195,7 @@ def resolveTypeDependency(type_entry, modname, own_typesyns, imported_typesyns):
                             break
                     if not flag_found:
                         ERROR_HANDLER.addError(ERR.TypeIdNotFound, [found_typesyn, type_id, modname])
-    treemap(typedef, lambda x: selectiveApply(AST.TYPE, x, resolveChild), replace=False)
+    Visitor({AST.TYPE: resolveChild}).walk(typedef)
 
 
 def normalizeAllTypes(ast, symbol_table, ext_table, main_mod_name, full_normalize=True, headerfiles=[], typesyn_headerfiles=[]): # What a despicable function
@@ -352,6 +355,30 @@ def normalizeAllTypes(ast, symbol_table, ext_table, main_mod_name, full_normaliz
         normalizeType(main_mod_name, modname, symbol_table, ext_table, own_defined_typesyns, my_typesyn_imports, full_normalize=True)
     
     ERROR_HANDLER.checkpoint()
+
+    freezeAllTypes(symbol_table, ext_table)
+
+'''
+Intern every type in the tables. Types are not rewritten after normalisation, so from here on comparing them is O(1)
+'''
+def freezeAllTypes(symbol_table, ext_table):
+    for glob_def in symbol_table.global_vars.values():
+        freezeType(glob_def.type)
+    for functlist in symbol_table.functions.values():
+        for func_def in functlist:
+            freezeType(func_def['type'])
+            for local_var_def in func_def["local_vars"].values():
+                freezeType(local_var_def.type)
+            for arg_var_def in func_def["arg_vars"].values():
+                freezeType(arg_var_def['type'])
+
+    for glob_dict in ext_table.global_vars.values():
+        freezeType(glob_dict['type'])
+    for functlist in ext_table.functions.values():
+        for func_def in functlist:
+            freezeType(func_def['type'])
+    for type_dict in ext_table.type_syns.values():
+        freezeType(type_dict['def_type'])
         
 
 
@@ -375,7 +402,7 @@ def forbid_illegal_types(symbol_table, ext_table):
                 ERROR_HANDLER.addError(ERR.TypeSynVoid, [type_id, node])
             return node
 
-        treemap(type_syn, lambda x: selectiveApply(AST.TYPE, x, killVoidType))
+        Visitor({AST.TYPE: killVoidType}).walk(type_syn)
 
     # Require global vars to have a type and not contain Void
     for glob_var_id, glob_var in symbol_table.global_vars.items():
@@ -389,7 +416,7 @@ def forbid_illegal_types(symbol_table, ext_table):
                     # Global variable type contains Void
                     ERROR_HANDLER.addError(ERR.GlobalVarVoid, [glob_var_id, node])
                 return node
-            treemap(glob_var.type, lambda x: selectiveApply(AST.TYPE, x, killVoidType))
+            Visitor({AST.TYPE: killVoidType}).walk(glob_var.type)
 
     # Require function types to not be none, and to not have Void as an input type and no direct Void return Type
     for fun_list in symbol_table.functions.values():
@@ -404,7 +431,7 @@ def forbid_illegal_types(symbol_table, ext_table):
                         ERROR_HANDLER.addError(ERR.FunctionInputVoid, [fun['def'].id.val, node])
                     return node
                 for from_type in fun['type'].from_types:
-                    treemap(from_type, lambda x: selectiveApply(AST.TYPE, x, killVoidType))
+                    Visitor({AST.TYPE: killVoidType}).walk(from_type)
 
                 # Forbid non-direct Void return type
                 returntype = fun['type'].to_type
@@ -414,7 +441,7 @@ def forbid_illegal_types(symbol_table, ext_table):
                             # Function output contains Void indirectly
                             ERROR_HANDLER.addError(ERR.FunctionOutputNestedVoid, [fun['def'].id.val, node])
                         return node
-                    treemap(returntype, lambda x: selectiveApply(AST.TYPE, x, killVoidType))
+                    Visitor({AST.TYPE: killVoidType}).walk(returntype)
 
             # Go over local variable types
             for local_var in fun['local_vars'].values():
@@ -427,13 +454,15 @@ def forbid_illegal_types(symbol_table, ext_table):
                             # Local var has void in type
                             ERROR_HANDLER.addError(ERR.LocalVarVoid, [local_var.id.val, fun['def'].id.val, node.val])
                         return node
-                    treemap(local_var, lambda x: selectiveApply(AST.TYPE, x, killVoidType))
+                    Visitor({AST.TYPE: killVoidType}).walk(local_var)
 
     # Check if main exists at most once, and with type "-> Int"
     if (FunUniq.FUNC, ENTRYPOINT_FUNCNAME) in symbol_table.functions:
         if len(symbol_table.functions[(FunUniq.FUNC, ENTRYPOINT_FUNCNAME)]) > 1:
             ERROR_HANDLER.addError(ERR.MultipleMain, [])
         for match in symbol_table.functions[(FunUniq.FUNC, ENTRYPOINT_FUNCNAME)]:
+            if match['type'] is None: # Already reported above
+                continue
             temp_from_types = match['type'].from_types
             temp_to_type = match['type'].to_type
             if not (temp_from_types == [] and temp_to_type is not None and (type(temp_to_type.val) == AST.BASICTYPE and temp_to_type.val.type_id.val == "Int")):
@@ -480,13 +509,15 @@ def check_functype_clashes(symbol_table, ext_table):
         error_pairs = []
         cur_funcs = list(enumerate(symbol_table.functions.get((uq, f_id), []) + ext_table.functions.get((uq, f_id), [])))
 
+        # Group the definitions by type instead of comparing all pairs
+        same_types = OrderedDict()
         for ix, func in cur_funcs:
-            my_type = func['type']
+            same_types.setdefault(internType(func['type']), []).append(ix)
 
-            same_types = list(filter(lambda x: AST.equalVals(x[1]['type'], my_type), cur_funcs))
-            for sam in same_types:
-                if ix != sam[0]: # Other operator with same type
-                    func_combo = sorted((ix,sam[0]))
+        for ix, func in cur_funcs:
+            for sam in same_types[internType(func['type'])]:
+                if ix != sam: # Other operator with same type
+                    func_combo = sorted((ix,sam))
                     if not func_combo in error_pairs: # Pair of functions with same type not seen yet
                         error_pairs.append(func_combo)
 
@@ -654,28 +685,39 @@ def resolveNames(symbol_table, ext_table):
     # Order matters here as to what is in scope
 
     # Globals
+    global_order = declarationOrder(symbol_table.global_vars.keys())
     for glob_var_id, glob_var in symbol_table.global_vars.items():
-        in_scope = list(map(lambda x: x[0], filter(lambda x: list(symbol_table.global_vars.keys()).index(glob_var_id) > list(symbol_table.global_vars.keys()).index(x[0]), symbol_table.global_vars.items())))
+        in_scope = DeclaredBefore(global_order, glob_var_id)
         glob_var.expr = resolveExprNames(glob_var.expr, symbol_table, ext_table, glob=True, in_scope_globals=in_scope)
 
     # Functions
-    in_scope_globals = list(symbol_table.global_vars.keys())
+    in_scope_globals = symbol_table.global_vars
     for f in symbol_table.functions: # Functions
         for i in range(0, len(symbol_table.functions[f])): # Overloaded functions
-            in_scope_locals = {'locals': [], 'args': list(map(lambda x: x[0], symbol_table.functions[f][i]['arg_vars'].items()))}
+            in_scope_locals = {'locals': {}, 'args': symbol_table.functions[f][i]['arg_vars']}
+            local_order = declarationOrder(symbol_table.functions[f][i]['local_vars'].keys())
             for v in symbol_table.functions[f][i]['def'].vardecls:
-                in_scope = list(map(lambda x: x[0], filter(
-                    lambda x: list(symbol_table.functions[f][i]['local_vars'].keys()).index(v.id.val) > list(symbol_table.functions[f][i]['local_vars'].keys()).index(x[0]),
-                    symbol_table.functions[f][i]['local_vars'].items())))
-
-                in_scope_locals['locals'] = in_scope
+                in_scope_locals['locals'] = DeclaredBefore(local_order, v.id.val)
                 resolveExprNames(v.expr, symbol_table, ext_table, False, in_scope_globals, in_scope_locals)
 
-            in_scope_locals['locals'] = list(symbol_table.functions[f][i]['local_vars'].keys())
+            in_scope_locals['locals'] = symbol_table.functions[f][i]['local_vars']
 
             # Expressions and assignments
-            treemap(symbol_table.functions[f][i]['def'].stmts, lambda node: selectiveApply(AST.DEFERREDEXPR, node, lambda y: resolveExprNames(y, symbol_table, ext_table, False, in_scope_globals, in_scope_locals)))
-            treemap(symbol_table.functions[f][i]['def'].stmts, lambda node: selectiveApply(AST.ASSIGNMENT, node, lambda y: resolveAssignName(y, symbol_table, ext_table, in_scope_globals, in_scope_locals)))
+            resolveStmtNames(symbol_table.functions[f][i]['def'].stmts, symbol_table, ext_table, in_scope_globals, in_scope_locals)
+
+'''
+Resolve the names in the statements of a function in one walk.
+Expressions are resolved as a whole, so the walk does not enter them. Assignment targets are resolved after all expressions.
+'''
+def resolveStmtNames(stmts, symbol_table, ext_table, in_scope_globals, in_scope_locals):
+    assignments = []
+    Visitor.fuse(
+        Visitor({AST.DEFERREDEXPR: lambda expr: resolveExprNames(expr, symbol_table, ext_table, False, in_scope_globals, in_scope_locals)}, enter_handled=False),
+        Visitor({AST.ASSIGNMENT: assignments.append})
+    ).walk(stmts)
+
+    for assignment in assignments:
+        resolveAssignName(assignment, symbol_table, ext_table, in_scope_globals, in_scope_locals)
 
 '''
 Funcall naar module, (FunUniq, id) (nog geen type)
@@ -842,12 +884,7 @@ def parseExpression(exp, symbol_table, ext_table, min_precedence = 1, exp_index
 
 ''' Given the operator table, properly transform an expression into a tree instead of a list of operators and terms '''
 def fixExpression(ast, symbol_table, ext_table):
-    decorated_ast = treemap(ast,
-                        lambda node:
-                            selectiveApply(AST.DEFERREDEXPR, node,
-                                lambda y:  parseExpression(y.contents, symbol_table, ext_table)[0]
-                            )
-                        )
+    decorated_ast = Visitor({AST.DEFERREDEXPR: lambda y: parseExpression(y.contents, symbol_table, ext_table)[0]}).walk(ast)
 
     return decorated_ast
 
@@ -860,7 +897,7 @@ Goal of this function is:
 '''
 def analyseFuncStmts(func, statements, loop_depth=0, cond_depth=0):
     returns = False
-    return_exp = not AST.equalVals(func.type.to_type, AST.TYPE(val=Token(Position(), TOKEN.TYPE_IDENTIFIER, "Void")))
+    return_exp = not sameType(func.type.to_type, VOID_TYPE_NODE)
 
     for k in range(0, len(statements)):
         stmt = statements[k].val
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+
+# Makes it possible to import from the compiler
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tests.compile_util import runTool, writeModules, readFile
+from lib.imports.build_cache import objectUpToDate, headerUpToDate, headerStamp
+from lib.imports.imports import content_hash
+
+UTIL = '''
+square (x) :: Int -> Int {
+    return x * x;
+}
+'''
+
+# Same interface, different body
+UTIL_NEW_BODY = '''
+square (x) :: Int -> Int {
+    Int y = x;
+    return y * x;
+}
+'''
+
+# One more exported function
+UTIL_NEW_INTERFACE = UTIL + '''
+cube (x) :: Int -> Int {
+    return x * x * x;
+}
+'''
+
+PROG = '''
+from util import square
+
+main () :: -> Int {
+    print(square(7));
+    return 0;
+}
+'''
+
+class BuildCacheTester(unittest.TestCase):
+
+    """
+    Test when an object file of an incremental build counts as up to date: its source, the interface of every
+    headerfile it was built against and the code generation options all have to be the same.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        writeModules(self.dir, {'util': UTIL, 'prog': PROG})
+        self.build('util', ['-H'])
+        self.build('prog', ['-C'])
+        self.object = readFile(os.path.join(self.dir, 'prog.splo'))
+        self.source_hash = content_hash(readFile(os.path.join(self.dir, 'prog.spl')))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def build(self, name, flags):
+        code, _, err = runTool('gsc', [name + '.spl'] + flags, cwd=self.dir)
+        self.assertEqual(code, 0, err)
+
+    def upToDate(self, codegen='O0'):
+        return objectUpToDate(self.object, self.source_hash, self.dir, codegen=codegen)
+
+    def test_unchanged(self):
+        self.assertTrue(self.upToDate())
+
+    def test_source_changed(self):
+        self.source_hash = content_hash(PROG + '\n')
+        self.assertFalse(self.upToDate())
+
+    def test_header_stamp_changed(self):
+        old_header = readFile(os.path.join(self.dir, 'util.spld'))
+        writeModules(self.dir, {'util': UTIL_NEW_BODY})
+        self.build('util', ['-H'])
+        new_header = readFile(os.path.join(self.dir, 'util.spld'))
+
+        self.assertNotEqual(headerStamp(old_header), headerStamp(new_header))
+        self.assertFalse(headerUpToDate(old_header, content_hash(UTIL_NEW_BODY)))
+        self.assertTrue(self.upToDate())
+
+    def test_header_interface_changed(self):
+        writeModules(self.dir, {'util': UTIL_NEW_INTERFACE})
+        self.build('util', ['-H'])
+        self.assertFalse(self.upToDate())
+
+    def test_header_missing(self):
+        os.remove(os.path.join(self.dir, 'util.spld'))
+        self.assertFalse(self.upToDate())
+
+    def test_codegen_options_changed(self):
+        self.assertFalse(self.upToDate(codegen='O1'))
+        self.assertFalse(self.upToDate(codegen='O0-accessor-calls'))
+
+        self.build('prog', ['-C', '-O', '1', '--fold-globals'])
+        self.object = readFile(os.path.join(self.dir, 'prog.splo'))
+        self.assertTrue(self.upToDate(codegen='O1-fold-globals'))
+        self.assertFalse(self.upToDate(codegen='O1'))
+
+    def test_binary_object(self):
+        self.build('prog', ['-C', '--object-format', 'binary'])
+        self.object = readFile(os.path.join(self.dir, 'prog.splo'))
+        self.assertIs(type(self.object), bytes)
+        self.assertTrue(self.upToDate())
+        self.assertFalse(self.upToDate(codegen='O2'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+
+# Makes it possible to import from the code generator
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tests.compile_util import compileProgram, runProgram, writeModules
+from lib.datastructure.AST import AST, FunUniq
+from lib.datastructure.token import Token, TOKEN
+from lib.datastructure.position import Position
+from lib.codegen.folding import foldExpr, BUILTINS_MODULE
+
+# c is assigned in a function, so it is not a constant even with --fold-globals
+PROGRAM = '''
+Int a = 7;
+Int b = a * 2 + 1;
+Int c = 3;
+Char d = 'a' + 'b' - 'a';
+Bool e = !(a < b) || 1 == 1;
+
+setC () :: -> Void {
+    c = 10;
+}
+
+main () :: -> Int {
+    print(-7 / 2);
+    print(-7 % 2);
+    print(7 % -2);
+    print(2147483647 + 1);
+    print('a' + 'b' - 'a');
+    print(!True && False);
+    print(-(3 - 5) * 4);
+    print(1 < 2);
+    print('a' == 'a');
+    print(b);
+    print(d);
+    print(e);
+    setC();
+    print(c);
+    print(c + a);
+    return 0;
+}
+'''
+
+OUTPUT = '-3\n-1\n1\n-2147483648\nb0\n8\n1\n1\n15\nb1\n10\n17\n0\n'
+
+def literal(typ, val):
+    return Token(Position(), typ, val)
+
+def call(op, *args):
+    return AST.TYPED_FUNCALL(id=literal(TOKEN.OP_IDENTIFIER, op), uniq=FunUniq.INFIX if len(args) == 2 else FunUniq.PREFIX,
+        args=list(args), oid=None, module=BUILTINS_MODULE, returns=None)
+
+class FoldingTester(unittest.TestCase):
+
+    """
+    Test that folding constant expressions gives the values the SSM would compute, and leaves alone what it cannot fold.
+    """
+
+    def test_program(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            writeModules(tmp, {'fold': PROGRAM})
+            path = os.path.join(tmp, 'fold.spl')
+            for flags in [['-O', '0'], ['-O', '0', '--fold-globals'], ['-O', '1'], ['-O', '1', '--fold-globals'], ['-O', '2', '--fold-globals']]:
+                with self.subTest(flags=flags):
+                    executable = compileProgram(path, flags)
+                    self.assertIsNotNone(executable)
+                    self.assertEqual(runProgram(executable, stdin=''), OUTPUT)
+
+    def test_folded(self):
+        self.assertEqual(foldExpr(call('+', literal(TOKEN.INT, 1), call('/', literal(TOKEN.INT, 4), literal(TOKEN.INT, 2))), {}).val, 3)
+        self.assertEqual(foldExpr(call('-', literal(TOKEN.INT, 5)), {}).val, -5)
+        self.assertEqual(foldExpr(call('+', literal(TOKEN.CHAR, 'a'), literal(TOKEN.CHAR, 'b')), {}).val, chr(ord('a') + ord('b')))
+
+    def test_left_unfolded(self):
+        unfoldable = [
+            call('/', literal(TOKEN.INT, 1), literal(TOKEN.INT, 0)),
+            call('%', literal(TOKEN.INT, 1), literal(TOKEN.INT, 0)),
+            call('-', literal(TOKEN.CHAR, 'a'), literal(TOKEN.CHAR, 'b')),
+            call('+', literal(TOKEN.CHAR, chr(0x10FFFF)), literal(TOKEN.CHAR, '\x01'))
+        ]
+        for expr in unfoldable:
+            with self.subTest(op=expr.id.val):
+                self.assertIs(foldExpr(expr, {}), expr)
+                self.assertIs(type(expr.args[0]), Token)
+                self.assertIs(type(expr.args[1]), Token)
+
+if __name__ == '__main__':
+    unittest.main()
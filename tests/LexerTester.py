@@ -5,11 +5,16 @@ import string
 import subprocess
 import sys
 import os
+import io
+import contextlib
 
 # Import hack
 sys.path.insert(0, os.path.join(sys.path[0],'../'))
 
-from lib.parser.lexer import REG_ID, REG_OP, REG_INT, REG_STR, REG_CHR
+from lib.parser.lexer import REG_ID, REG_OP, REG_INT, REG_STR, REG_CHR, tokenize
+from lib.datastructure.token import TokenBuffer
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
 
 class LexerTester(unittest.TestCase):
 
@@ -108,6 +113,58 @@ class LexerTester(unittest.TestCase):
                 )
         
                 self.assertEqual(proc.returncode, 0)
-             
+
+    def lex_with(self, text, engine):
+        """
+        Helper function that collects the tokens, the error output and whether the lexer exited for a given engine
+        """
+        tokens = []
+        errors = io.StringIO()
+        exited = False
+        with contextlib.redirect_stderr(errors):
+            try:
+                for t in tokenize(io.StringIO(text), engine=engine):
+                    tokens.append((t.typ, t.val, t.pos.line, t.pos.col))
+            except SystemExit:
+                exited = True
+        return tokens, errors.getvalue(), exited
+
+    def test_regex_engine_parity(self):
+        """
+        Test that the regex lexer engine produces exactly the same output as the prefix engine
+        """
+        paths = []
+        for directory in [os.path.join(TEST_DIR, '..', 'example programs'), os.path.join(TEST_DIR, 'lexer')]:
+            for root, _, files in os.walk(directory):
+                paths.extend(os.path.join(root, f) for f in sorted(files) if f.endswith('.spl'))
+        # Some example programs are links to files that are not in the repository
+        paths = list(filter(os.path.isfile, paths))
+        self.assertNotEqual(paths, [])
+
+        for path in paths:
+            with self.subTest(path=path):
+                with open(path, encoding="utf-8") as infile:
+                    text = infile.read()
+                self.assertEqual(self.lex_with(text, 'prefix'), self.lex_with(text, 'regex'))
+
+    def test_token_buffer(self):
+        """
+        Test that a TokenBuffer gives back the same tokens it was built from
+        """
+        text = '''
+            from lib importall
+            Bool b = True; Int i = 1; Char c = 'x'; [Int] xs = [];
+            f (a, b) :: Int Int -> Int { return a.hd + -b; }
+        '''
+        tokens = list(tokenize(io.StringIO(text)))
+        buf = TokenBuffer(tokenize(io.StringIO(text)))
+        self.assertEqual(len(tokens), len(buf))
+        for i, (expected, found) in enumerate(zip(tokens, buf)):
+            with self.subTest(i=i):
+                self.assertIs(type(found.val), type(expected.val))
+                self.assertEqual((expected.typ, expected.val, expected.pos.line, expected.pos.col),
+                                 (found.typ, found.val, found.pos.line, found.pos.col))
+        self.assertIs(buf[1].pos, buf.pos(1))
+
 if __name__ == '__main__':
     unittest.main()
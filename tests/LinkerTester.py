@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+import os
+import io
+import sys
+import tempfile
+import unittest
+import contextlib
+
+# Makes it possible to import from the linker
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tests.compile_util import runTool, writeModules, readFile, runProgram
+from lib.codegen.linker import Block, modulePieces, pieceBlocks, pieceText, resolveSymbols, markLive
+from lib.analysis.error_handler import ERROR_HANDLER, ERR
+
+UTIL = '''
+Int unusedPure = 6 * 7;
+[Int] numbers = 1 : 2 : [];
+Int first = numbers.hd;
+[Int] empty = [];
+[Int] alias = empty;
+Int used = 5;
+
+square (x) :: Int -> Int {
+    return x * x;
+}
+
+unusedFunc (x) :: Int -> Int {
+    return square(x) + 1;
+}
+'''
+
+PROG = '''
+from util import square, used, alias
+
+main () :: -> Int {
+    print(square(used));
+    print(isEmpty(alias));
+    return 0;
+}
+'''
+
+FUNCTIONS = '''m_func_main_0: LINK 00
+BSR m_func_f_0
+LDC m_func_g_0
+UNLINK
+RET
+m_func_f_0: LINK 00
+UNLINK
+RET
+m_func_g_0: LINK 00
+UNLINK
+RET
+m_func_unused_0: LINK 00
+BSR m_func_f_0
+UNLINK
+RET'''
+
+'''
+The code of a module that is left after dead code elimination, by section, given the text of its sections.
+It is linked with an entry point that calls m_func_main_0, and with a module that defines program_crash.
+'''
+def liveCode(global_inits, global_mem, functions=FUNCTIONS):
+    pieces = modulePieces({'global_inits': global_inits, 'global_mem': global_mem, 'functions': functions})
+    entry = Block([], ['m_func_main_0'], root=True)
+    crash = Block(['program_crash'], [])
+    defined = resolveSymbols([('<entry point>', [entry]), ('m', pieceBlocks(pieces)), ('<builtins>', [crash])])
+    markLive([entry, crash] + pieceBlocks(pieces), defined)
+    return {section: [pieceText(piece) for piece in section_pieces if piece[0].live] for (section, section_pieces) in pieces.items()}
+
+class LinkerTester(unittest.TestCase):
+
+    """
+    Test which code the linker leaves out of an executable, and that the code it keeps behaves the same.
+    """
+
+    def setUp(self):
+        # A failed checkpoint exits before it clears the errors
+        ERROR_HANDLER.errors = []
+        ERROR_HANDLER.warnings = []
+
+    def test_unreachable_function(self):
+        live = liveCode('', '')
+        self.assertEqual([text.split(':')[0] for text in live['functions']], ['m_func_main_0', 'm_func_f_0', 'm_func_g_0'])
+
+    def test_pure_global(self):
+        live = liveCode('LDC 6\nLDC 7\nMUL\nLDC m_global_a\nSTA 00', 'm_global_a: NOP')
+        self.assertEqual(live['global_inits'], [])
+        self.assertEqual(live['global_mem'], [])
+
+    def test_used_global(self):
+        functions = FUNCTIONS.replace('m_func_f_0: LINK 00', 'm_func_f_0: LINK 00\nLDC m_global_a\nLDA 00')
+        live = liveCode('LDC 6\nLDC m_global_a\nSTA 00', 'm_global_a: NOP', functions)
+        self.assertEqual(live['global_inits'], ['LDC 6\nLDC m_global_a\nSTA 00'])
+        self.assertEqual(live['global_mem'], ['m_global_a: NOP'])
+
+    def test_global_with_effects(self):
+        # Initialisations that call a function or can crash the program are kept, and so is the function they call
+        calling = 'BSR m_func_unused_0\nLDR RR\nLDC m_global_a\nSTA 00'
+        live = liveCode(calling, 'm_global_a: NOP')
+        self.assertEqual(live['global_inits'], [calling])
+        self.assertEqual(live['global_mem'], ['m_global_a: NOP'])
+        self.assertIn('m_func_unused_0', [text.split(':')[0] for text in live['functions']])
+
+        head = 'LDC m_global_xs\nLDA 00\nLDS 00\nLDC 00\nEQ\nBRT program_crash\nLDH -1\nLDC m_global_a\nSTA 00'
+        live = liveCode('LDC 00\nLDC m_global_xs\nSTA 00\n' + head, 'm_global_xs: NOP\nm_global_a: NOP')
+        self.assertEqual(live['global_inits'], ['LDC 00\nLDC m_global_xs\nSTA 00', head])
+
+    def test_shared_value(self):
+        # After LDS 00; LDC a; STA 00 the initialisation of b stores the copy of a left on the stack
+        inits = 'LDC 00\nLDS 00\nLDC m_global_a\nSTA 00\nLDC m_global_b\nSTA 00\nLDC 1\nLDC m_global_c\nSTA 00'
+        functions = FUNCTIONS.replace('m_func_f_0: LINK 00', 'm_func_f_0: LINK 00\nLDC m_global_b\nLDA 00')
+        live = liveCode(inits, 'm_global_a: NOP\nm_global_b: NOP\nm_global_c: NOP', functions)
+        self.assertEqual(live['global_inits'], ['LDC 00\nLDS 00\nLDC m_global_a\nSTA 00', 'LDC m_global_b\nSTA 00'])
+        self.assertEqual(live['global_mem'], ['m_global_a: NOP', 'm_global_b: NOP'])
+
+    def test_code_after_last_global(self):
+        live = liveCode('LDC 1\nLDC m_global_a\nSTA 00\nLDC 2\nAJS -1', 'm_global_a: NOP')
+        self.assertEqual(live['global_inits'], ['LDC 2\nAJS -1'])
+
+    def test_program(self):
+        """
+        Test that linking a two module program without the unused code leaves out what it should and runs the same
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            writeModules(tmp, {'util': UTIL, 'prog': PROG})
+            for level in ['0', '1']:
+                with self.subTest(level=level):
+                    for args in [['util.spl', '-H'], ['util.spl', '-C'], ['prog.spl', '-C']]:
+                        code, _, err = runTool('gsc', args + ['-O', level], cwd=tmp)
+                        self.assertEqual(code, 0, err)
+                    executables = {}
+                    for flags in [[], ['--keep-unused']]:
+                        code, _, err = runTool('gsl', ['prog.splo'] + flags, cwd=tmp)
+                        self.assertEqual(code, 0, err)
+                        executables[tuple(flags)] = readFile(os.path.join(tmp, 'prog.ssm'))
+                    full, linked = executables[('--keep-unused',)], executables[()]
+
+                    self.assertEqual(runProgram(full), '25\n1\n0\n')
+                    self.assertEqual(runProgram(linked), '25\n1\n0\n')
+                    for label in ['util_func_unusedFunc_0:', 'util_global_unusedPure:']:
+                        self.assertIn(label, full)
+                        self.assertNotIn(label, linked)
+                    for label in ['util_func_square_0:', 'util_global_first:', 'util_global_empty:', 'util_global_alias:']:
+                        self.assertIn(label, linked)
+                    self.assertLess(len(linked), len(full))
+
+    def resolveErrors(self, modules):
+        # The errors resolveSymbols reports, as (error, label, module...) tuples
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                resolveSymbols(modules)
+        return [(e['type'],) + tuple(e['tokens']) for e in ERROR_HANDLER.errors]
+
+    def test_resolve(self):
+        f = Block(['a_func_f_0', 'a_func_f_0_exit'], ['b_func_g_0'])
+        g = Block(['b_func_g_0'], [])
+        defined = resolveSymbols([('a', [f]), ('b', [g])])
+        self.assertEqual(defined, {'a_func_f_0': f, 'a_func_f_0_exit': f, 'b_func_g_0': g})
+
+    def test_undefined_label(self):
+        errors = self.resolveErrors([('a', [Block(['a_func_f_0'], ['b_func_g_0', 'b_func_h_0'])]), ('b', [Block(['b_func_g_0'], [])])])
+        self.assertEqual(errors, [(ERR.LinkerUndefinedLabel, 'b_func_h_0', 'a')])
+
+    def test_duplicate_label(self):
+        errors = self.resolveErrors([('a', [Block(['head'], [])]), ('b', [Block(['b_func_g_0'], [])]), ('c', [Block(['head', 'b_func_g_0'], [])])])
+        self.assertEqual(errors, [(ERR.LinkerDuplicateLabel, 'head', 'a', 'c'), (ERR.LinkerDuplicateLabel, 'b_func_g_0', 'b', 'c')])
+
+    def test_broken_link(self):
+        """
+        Test that gsl reports a label that is not defined or defined twice, with the modules involved, and writes nothing
+        """
+        broken = [
+            # util no longer defines square
+            ('util_func_square_0: LINK 00', 'util_func_cube_0: LINK 00',
+                'Label "util_func_square_0" used by module "prog" is not defined by any linked module'),
+            # util defines a function with the label of a builtin
+            ('util_func_square_0: LINK 00', 'head: LINK 00\nUNLINK\nRET\nutil_func_square_0: LINK 00',
+                'Label "head" is defined by both module "<builtins>" and module "util"')
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            writeModules(tmp, {'util': UTIL, 'prog': PROG})
+            for args in [['util.spl', '-H'], ['util.spl', '-C'], ['prog.spl', '-C']]:
+                code, _, err = runTool('gsc', args, cwd=tmp)
+                self.assertEqual(code, 0, err)
+            util_object = readFile(os.path.join(tmp, 'util.splo'))
+
+            for old, new, message in broken:
+                with self.subTest(message=message):
+                    self.assertIn(old, util_object)
+                    with open(os.path.join(tmp, 'util.splo'), 'w') as outfile:
+                        outfile.write(util_object.replace(old, new, 1))
+                    code, out, err = runTool('gsl', ['prog.splo'], cwd=tmp)
+                    self.assertNotEqual(code, 0)
+                    self.assertIn(message, err)
+                    self.assertEqual(out, '')
+                    self.assertFalse(os.path.exists(os.path.join(tmp, 'prog.ssm')))
+
+if __name__ == '__main__':
+    unittest.main()
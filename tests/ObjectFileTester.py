@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+
+# Makes it possible to import from the compiler
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tests.compile_util import runTool, writeModules, readFile
+from lib.imports.objectfile_imports import getObjectFiles, parseObjectFile, codeSymbols, BinaryObjectSections, \
+    LINKED_SECTIONS, BINARY_OBJECT_HEADER, BINARY_OBJECT_MAGIC, BINARY_OBJECT_VERSION
+
+UTIL = '''
+Int counter = 0;
+
+square (x) :: Int -> Int {
+    return x * x;
+}
+
+sum (xs) :: [Int] -> Int {
+    if (isEmpty(xs)) {
+        return 0;
+    }
+    return xs.hd + sum(xs.tl);
+}
+'''
+
+PROG = '''
+from util import square, sum, counter
+
+[Int] numbers = 1 : 2 : 3 : [];
+
+main () :: -> Int {
+    print(square(sum(numbers)) + counter);
+    return 0;
+}
+'''
+
+class ObjectFileTester(unittest.TestCase):
+
+    """
+    Test that the binary object format holds the same code as the text format, and that broken files are rejected.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.dirs = {}
+        for object_format in ['text', 'binary']:
+            directory = os.path.join(cls.tmp.name, object_format)
+            os.mkdir(directory)
+            writeModules(directory, {'util': UTIL, 'prog': PROG})
+            for args in [['util.spl', '-H'], ['util.spl', '-C'], ['prog.spl', '-C']]:
+                code, _, err = runTool('gsc', args + ['--object-format', object_format], cwd=directory)
+                if code != 0:
+                    raise Exception(err)
+            cls.dirs[object_format] = directory
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def load(self, object_format):
+        path = os.path.join(self.dirs[object_format], 'prog.splo')
+        with open(path, 'rb' if object_format == 'binary' else 'r') as main_file:
+            return getObjectFiles(main_file, path, self.dirs[object_format])
+
+    def binaryData(self, name):
+        return readFile(os.path.join(self.dirs['binary'], name + '.splo'))
+
+    def test_round_trip(self):
+        text_mods = self.load('text')
+        binary_mods = self.load('binary')
+        self.assertEqual([mod.module for mod in text_mods], ['prog', 'util'])
+        self.assertEqual([mod.module for mod in binary_mods], ['prog', 'util'])
+        for text_mod, binary_mod in zip(text_mods, binary_mods):
+            self.assertIsInstance(binary_mod, BinaryObjectSections)
+            self.assertEqual(binary_mod['dependencies'], text_mod['dependencies'])
+            for section in LINKED_SECTIONS:
+                with self.subTest(module=text_mod.module, section=section):
+                    self.assertEqual(binary_mod[section], text_mod[section])
+
+    def test_symbols(self):
+        for name in ['prog', 'util']:
+            sections = parseObjectFile(self.binaryData(name))
+            text_functions = parseObjectFile(readFile(os.path.join(self.dirs['text'], name + '.splo')))['functions']
+            self.assertNotEqual(sections.symbols, [])
+            # The functions cut out with the symbols make up the text form of the function section
+            self.assertEqual('\n'.join(sections.function(row[0]) for row in sections.symbols), text_functions)
+            for row in sections.symbols:
+                with self.subTest(label=row[0]):
+                    self.assertEqual(codeSymbols(sections.function(row[0])), (row[3], row[4]))
+                    self.assertIn(row[0], row[3])
+
+    def test_truncated(self):
+        data = self.binaryData('util')
+        for length in [0, BINARY_OBJECT_HEADER.size - 1, BINARY_OBJECT_HEADER.size + 4, len(data) - 1]:
+            with self.subTest(length=length):
+                with self.assertRaisesRegex(Exception, 'Truncated binary object file'):
+                    BinaryObjectSections(data[:length])
+
+    def test_wrong_version(self):
+        data = self.binaryData('util')
+        _, _, index_length = BINARY_OBJECT_HEADER.unpack(data[:BINARY_OBJECT_HEADER.size])
+        newer = BINARY_OBJECT_HEADER.pack(BINARY_OBJECT_MAGIC, BINARY_OBJECT_VERSION + 1, index_length) + data[BINARY_OBJECT_HEADER.size:]
+        with self.assertRaisesRegex(Exception, 'Unsupported binary object file version {}'.format(BINARY_OBJECT_VERSION + 1)):
+            BinaryObjectSections(newer)
+
+    def test_linker_reports_truncated(self):
+        path = os.path.join(self.dirs['binary'], 'util.splo')
+        data = self.binaryData('util')
+        try:
+            with open(path, 'wb') as outfile:
+                outfile.write(data[:-1])
+            code, _, err = runTool('gsl', ['prog.splo'], cwd=self.dirs['binary'])
+        finally:
+            with open(path, 'wb') as outfile:
+                outfile.write(data)
+        self.assertNotEqual(code, 0)
+        self.assertIn('Truncated binary object file', err)
+
+if __name__ == '__main__':
+    unittest.main()
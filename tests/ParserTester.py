@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
 import sys
+import os
+import io
+import contextlib
 import unittest
 
 # Makes it possible to import from the parser/lexer
@@ -10,6 +13,9 @@ from lib.parser.parser import *
 from lib.parser.parse_error_handler import ParseError
 from io import StringIO
 from lib.parser.lexer import tokenize
+from lib.parser.descent_parser import parseDescent
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 class ParserTester(unittest.TestCase):
@@ -750,5 +756,89 @@ class ParserTester(unittest.TestCase):
                 self.assertRaises(ParseError, Exp.parse_strict, tks, t)
             i += 1
 
+    def test_packrat_parser(self):
+
+        """
+            Test that memoizing the grammar rules gives the same tree and the same errors.
+        """
+
+        examples = [
+            '''
+                Int g = 3 + -(4);
+                f (a, b) :: Int Int -> (Int, [Int]) {
+                    var c = (a, b);
+                    while (c.fst > 0) { c.fst = c.fst - 1; }
+                    if (c.snd == 0) { return (a, 1 : []); } else { return (b, []); }
+                }
+            ''',
+            '''
+                infixl 4 +++ (a, b) :: Int Int -> Int { return a + b; }
+                main () :: -> Int { print((((1 +++ 2)))); return 0; }
+            '''
+        ]
+
+        incorrect_examples = [
+            '''
+                f (a) :: Int -> Int { return (a; }
+            ''',
+            '''
+                Int x = ;
+            '''
+        ]
+
+        i = 0
+        for t in examples:
+            with self.subTest(i=i):
+                plain = SPL.parse_strict(list(tokenize(StringIO(t))), StringIO(t))
+                memoized = SPL.parse_strict(list(tokenize(StringIO(t))), StringIO(t), packrat=True)
+                self.assertTrue(AST.equalVals(plain, memoized))
+            i += 1
+
+        for t in incorrect_examples:
+            with self.subTest(i=i):
+                tks = list(tokenize(StringIO(t)))
+                with self.assertRaises(ParseError) as plain:
+                    SPL.parse_strict(tks, StringIO(t))
+                with self.assertRaises(ParseError) as memoized:
+                    SPL.parse_strict(tks, StringIO(t), packrat=True)
+                self.assertEqual(str(plain.exception), str(memoized.exception))
+            i += 1
+
+    def test_descent_parser(self):
+
+        """
+            Test that the recursive descent backend builds the same tree as the combinator grammar
+            for every example program, and rejects the same programs.
+        """
+
+        paths = []
+        for root, _, files in os.walk(os.path.join(TEST_DIR, '..', 'example programs')):
+            paths.extend(os.path.join(root, f) for f in sorted(files) if f.endswith('.spl'))
+        # Some example programs are links to files that are not in the repository
+        paths = list(filter(os.path.isfile, paths))
+        self.assertNotEqual(paths, [])
+
+        for path in paths:
+            with self.subTest(path=path):
+                with open(path, encoding="utf-8") as infile:
+                    text = StringIO(infile.read())
+                try:
+                    with contextlib.redirect_stderr(io.StringIO()):
+                        tks = list(tokenize(text))
+                except SystemExit:
+                    continue
+                if not tks:
+                    # Empty files are not supported by either parser yet
+                    continue
+                try:
+                    expected = SPL.parse_strict(tks, text)
+                except ParseError:
+                    expected = None
+                found = parseDescent(tks)
+                if expected is None:
+                    self.assertIsNone(found)
+                else:
+                    self.assertTrue(AST.equalVals(expected, found))
+
 if __name__ == '__main__':
     unittest.main()
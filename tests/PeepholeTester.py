@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+# Makes it possible to import from the code generator
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tests.compile_util import compileProgram, runProgram, examplePrograms
+from lib.codegen.peephole import optimize, OPT_LEVELS
+
+class PeepholeTester(unittest.TestCase):
+
+    """
+    Test every rewrite of the peephole optimizer on a few instructions, and that optimizing does not change what the
+    example programs do.
+    """
+
+    def check(self, level, code, expected):
+        self.assertEqual(optimize(code, level), expected)
+
+    def test_level_0(self):
+        code = ['l: nop', 'LDC 1', 'LDC 2', 'ADD', 'BRA m', 'm: RET']
+        self.check(0, code, code)
+
+    def test_drop_nops(self):
+        self.check(1, ['LDC 1', 'l1: nop', 'RET'], ['LDC 1', 'l1: RET'])
+        # A labelled nop at the end has nothing to move its label to
+        self.check(1, ['RET', 'l1: nop'], ['RET', 'l1: nop'])
+
+    def test_drop_nops_alias(self):
+        # The label of the nop becomes an alias of the label on the next instruction, in branches and LDCs
+        self.check(1, ['LDL 1', 'BRT l1', 'LDL 2', 'l1: nop', 'l2: RET', 'LDC l1'],
+            ['LDL 1', 'BRT l2', 'LDL 2', 'l2: RET', 'LDC l2'])
+
+    def test_fold_constants(self):
+        self.check(1, ['LDC 2', 'LDC 3', 'MUL', 'LDC 4', 'ADD', 'NEG'], ['LDC -10'])
+        self.check(1, ['LDC 2147483647', 'LDC 1', 'ADD'], ['LDC -2147483648'])
+        # Rounding towards zero, like the SSM
+        self.check(1, ['LDC -7', 'LDC 2', 'DIV'], ['LDC -3'])
+        self.check(1, ['LDC -7', 'LDC 2', 'MOD'], ['LDC -1'])
+        self.check(1, ['LDC 7', 'LDC -2', 'MOD'], ['LDC 1'])
+
+    def test_fold_constants_left_alone(self):
+        self.check(1, ['LDC 1', 'LDC 00', 'DIV'], ['LDC 1', 'LDC 00', 'DIV'])
+        self.check(1, ['LDC 1', 'LDC 00', 'MOD'], ['LDC 1', 'LDC 00', 'MOD'])
+        # Code can jump to a label in the middle
+        self.check(1, ['LDC 1', 'l: LDC 2', 'ADD'], ['LDC 1', 'l: LDC 2', 'ADD'])
+        self.check(1, ['LDC g', 'LDC 2', 'ADD'], ['LDC g', 'LDC 2', 'ADD'])
+
+    def test_fuse_not(self):
+        self.check(1, ['LDL 1', 'NOT', 'BRF l', 'RET', 'l: RET'], ['LDL 1', 'BRT l', 'RET', 'l: RET'])
+        self.check(1, ['LDL 1', 'NOT', 'BRT l', 'RET', 'l: RET'], ['LDL 1', 'BRF l', 'RET', 'l: RET'])
+
+    def test_fold_branches(self):
+        self.check(1, ['LDC -1', 'BRT l', 'LDC 1', 'l: RET'], ['BRA l', 'LDC 1', 'l: RET'])
+        self.check(1, ['LDC 00', 'BRF l', 'LDC 1', 'l: RET'], ['BRA l', 'LDC 1', 'l: RET'])
+        self.check(1, ['LDC 00', 'BRT l', 'LDC 1', 'l: RET'], ['LDC 1', 'l: RET'])
+
+    def test_fold_branches_labelled(self):
+        # A branch that is never taken is dropped with its LDC, whose label moves on
+        self.check(1, ['LDL 1', 'BRT m', 'm: LDC 00', 'BRT l', 'LDC 1', 'l: RET'],
+            ['LDL 1', 'BRT m', 'm: LDC 1', 'l: RET'])
+        self.check(1, ['BRA m', 'RET', 'm: LDC 00', 'BRT l'], ['BRA m', 'RET', 'm: nop'])
+
+    def test_reuse_stored(self):
+        self.check(1, ['LDC 5', 'LDC g', 'STA 00', 'LDC g', 'LDA 00', 'RET'], ['LDC 5', 'LDS 00', 'LDC g', 'STA 00', 'RET'])
+
+    def test_reuse_stored_left_alone(self):
+        # Code can jump to the load, so the value is not always on the stack
+        self.check(1, ['LDC 5', 'LDC g', 'STA 00', 'l: LDC g', 'LDA 00', 'RET'], ['LDC 5', 'LDC g', 'STA 00', 'l: LDC g', 'LDA 00', 'RET'])
+        self.check(1, ['LDC 5', 'LDC g', 'STA 00', 'LDC h', 'LDA 00', 'RET'], ['LDC 5', 'LDC g', 'STA 00', 'LDC h', 'LDA 00', 'RET'])
+        self.check(1, ['LDC 5', 'LDC g', 'STA 01', 'LDC g', 'LDA 01', 'RET'], ['LDC 5', 'LDC g', 'STA 01', 'LDC g', 'LDA 01', 'RET'])
+
+    def test_drop_jumps_to_next(self):
+        self.check(1, ['BRA l', 'l: RET'], ['l: RET'])
+
+    def test_thread_jumps(self):
+        code = ['LDL 1', 'BRT a', 'LDC 1', 'RET', 'a: BRA b', 'LDC 3', 'b: LDC 2', 'RET']
+        self.check(1, code, code)
+        self.check(2, code, ['LDL 1', 'BRT b', 'LDC 1', 'RET', 'b: LDC 2', 'RET'])
+
+    def test_thread_jumps_cycle(self):
+        # Jumps that go around in a circle stay a loop
+        self.check(2, ['LDL 1', 'BRT a', 'RET', 'a: BRA b', 'b: BRA a'], ['LDL 1', 'BRT b', 'RET', 'b: BRA b'])
+        self.check(2, ['a: BRA a'], ['a: BRA a'])
+
+    def test_invert_branches(self):
+        self.check(2, ['LDL 1', 'BRT a', 'BRA b', 'a: LDC 1', 'RET', 'b: LDC 2', 'RET'],
+            ['LDL 1', 'BRF b', 'LDC 1', 'RET', 'b: LDC 2', 'RET'])
+
+    def test_drop_unreachable(self):
+        self.check(2, ['LDL 1', 'BRT l', 'RET', 'LDC 1', 'l: LDC 2', 'unused: RET'], ['LDL 1', 'BRT l', 'RET', 'l: LDC 2', 'RET'])
+        # Labels that are loaded as an address are kept
+        self.check(2, ['LDC l', 'HALT', 'l: RET'], ['LDC l', 'HALT', 'l: RET'])
+
+    def test_inline_returns(self):
+        self.check(2, ['LDL 1', 'BRF l', 'LDC 1', 'BRA e', 'l: LDC 2', 'e: UNLINK', 'RET'],
+            ['LDL 1', 'BRF l', 'LDC 1', 'UNLINK', 'RET', 'l: LDC 2', 'UNLINK', 'RET'])
+
+    def test_example_programs(self):
+        """
+        Test that the example programs that run to the end print the same at every optimization level
+        """
+        ran = 0
+        for path in examplePrograms():
+            with self.subTest(path=path):
+                executable = compileProgram(path, ['-O', str(OPT_LEVELS[0])])
+                output = runProgram(executable) if executable is not None else None
+                if output is None:
+                    continue
+                ran += 1
+                for level in OPT_LEVELS[1:]:
+                    optimized = compileProgram(path, ['-O', str(level)])
+                    self.assertIsNotNone(optimized)
+                    self.assertEqual(runProgram(optimized), output)
+        self.assertGreater(ran, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+# Makes it possible to import from the datastructures
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lib.datastructure.scope import DeclaredBefore, declarationOrder
+
+class ScopeTester(unittest.TestCase):
+
+    """
+    Test the declaration order scopes that name resolution checks globals and locals against.
+    """
+
+    def test_declared_before(self):
+        order = declarationOrder(['a', 'b', 'c'])
+        in_scope = DeclaredBefore(order, 'b')
+        self.assertIn('a', in_scope)
+        self.assertNotIn('b', in_scope)
+        self.assertNotIn('c', in_scope)
+        self.assertNotIn('unknown', in_scope)
+
+    def test_first_declaration(self):
+        self.assertEqual(declarationOrder([]), {})
+        self.assertNotIn('a', DeclaredBefore(declarationOrder(['a']), 'a'))
+
+    def test_duplicate_declaration(self):
+        # The first declaration of a name counts, so a duplicate is in scope from its first declaration on
+        order = declarationOrder(['a', 'b', 'a', 'c'])
+        self.assertEqual(order, {'a': 0, 'b': 1, 'c': 3})
+        self.assertIn('a', DeclaredBefore(order, 'b'))
+        self.assertIn('b', DeclaredBefore(order, 'c'))
+        self.assertNotIn('b', DeclaredBefore(order, 'a'))
+
+if __name__ == '__main__':
+    unittest.main()
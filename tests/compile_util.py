@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+'''
+Helpers for the tests that compile SPL programs.
+gsc.py and gsl.py run in a subprocess like they would from the command line, so nothing carries over from one compile
+to the next.
+'''
+
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+EXAMPLES_DIR = os.path.join(ROOT_DIR, 'example programs')
+
+sys.path.insert(0, ROOT_DIR)
+
+from lib.debug.ssm import run, SSMError
+from lib.imports.objectfile_imports import isBinaryObject
+
+# Run gsc.py or gsl.py, returning the exit code and what it printed to stdout and stderr
+def runTool(tool, args, cwd=None):
+    res = subprocess.run([sys.executable, os.path.join(ROOT_DIR, tool + '.py')] + args, cwd=cwd,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    return res.returncode, res.stdout, res.stderr
+
+def writeModules(directory, modules):
+    for name, text in modules.items():
+        with open(os.path.join(directory, name + '.spl'), 'w') as outfile:
+            outfile.write(text)
+
+# The contents of a file: bytes for a binary object file, a string otherwise
+def readFile(path):
+    with open(path, 'rb') as infile:
+        data = infile.read()
+    return data if isBinaryObject(data) else data.decode('utf-8')
+
+'''
+Compile an SPL file to an executable with gsc.py and --stdout. Returns the executable, or None if it does not compile.
+The output is cut from the first comment on, since warnings can come before it.
+'''
+def compileProgram(path, flags=[]):
+    code, out, _ = runTool('gsc', [path, '--stdout'] + flags, cwd=os.path.dirname(path))
+    start = out.find('//')
+    return out[start:] if code == 0 and start != -1 else None
+
+# Run an executable in the simulator, giving what it printed, or None if it crashed or did not halt
+def runProgram(executable, stdin='42\n'):
+    try:
+        output, _, halted = run(executable, stdin=stdin)
+    except SSMError:
+        return None
+    return output if halted else None
+
+# The example programs that are files (some are links to files that are not in the repository)
+def examplePrograms():
+    paths = []
+    for root, _, files in os.walk(EXAMPLES_DIR):
+        paths.extend(os.path.join(root, f) for f in sorted(files) if f.endswith('.spl'))
+    return sorted(filter(os.path.isfile, paths))